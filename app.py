@@ -7,9 +7,13 @@ Metadados (custo, tokens, tempo) vão nos headers HTTP.
 from flask import Flask, request, jsonify, Response, send_from_directory
 from flask_cors import CORS
 from extractor import PDFExtractor
+from request_coalescer import RequestCoalescer
+from request_context import RequestContext, Deadline, CancellationToken
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import json
 import time
 import os
+import threading
 
 app = Flask(__name__, static_folder='frontend/dist', static_url_path='')
 CORS(app)  # Habilita CORS para uso em frontend
@@ -17,13 +21,110 @@ CORS(app)  # Habilita CORS para uso em frontend
 # Inicializar extrator (singleton)
 extractor = PDFExtractor()
 
+# Coalescing de requisições do mesmo PDF (janela em ms, 0 = desabilitado)
+coalescer = RequestCoalescer(extractor, window_ms=int(os.getenv('COALESCE_WINDOW_MS', '0')))
+
+# Extrações do /extract/stream rodam fora da thread da requisição, que fica
+# livre para enviar heartbeats e detectar desconexão do cliente
+SSE_HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', '5'))
+stream_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('STREAM_WORKERS', '16')),
+    thread_name_prefix='extract-stream'
+)
+
+
+def build_request_context(data):
+    """
+    Cria o RequestContext da requisição a partir do deadline informado.
+    Header X-Deadline-Ms tem prioridade sobre o campo deadline_ms do body.
+    Header X-Retry-Failed: true (ou retry_failed no body) ignora o cache negativo.
+
+    Returns:
+        RequestContext
+
+    Raises:
+        ValueError: Se o deadline não for um inteiro positivo
+    """
+    retry_failed = request.headers.get('X-Retry-Failed', '').lower() == 'true'
+    if not retry_failed and isinstance(data, dict):
+        retry_failed = data.get('retry_failed') is True
+
+    deadline_ms = request.headers.get('X-Deadline-Ms')
+    if deadline_ms is None and isinstance(data, dict):
+        deadline_ms = data.get('deadline_ms')
+    if deadline_ms is None:
+        return RequestContext(retry_failed=retry_failed)
+
+    try:
+        deadline_ms = int(deadline_ms)
+    except (TypeError, ValueError):
+        raise ValueError("deadline (X-Deadline-Ms / deadline_ms) deve ser um inteiro em ms")
+    if deadline_ms <= 0:
+        raise ValueError("deadline (X-Deadline-Ms / deadline_ms) deve ser positivo")
+
+    return RequestContext(deadline=Deadline.from_ms(deadline_ms), retry_failed=retry_failed)
+
+
+# Estado do aquecimento por componente: lazy (carrega na 1ª requisição),
+# warming (thread em andamento), ready ou failed (serve com fallback/lazy)
+warmup_state = {
+    "openai_client": "lazy",
+    "embedding_model": "lazy",
+    "label_caches": "lazy"
+}
+
+
+def run_warmup(component, warmup_fn):
+    """Executa uma etapa de aquecimento e registra o resultado em warmup_state."""
+    try:
+        ok = warmup_fn() is not False
+    except Exception as e:
+        print(f"[AVISO] Falha no aquecimento de {component}: {e}")
+        ok = False
+    warmup_state[component] = "ready" if ok else "failed"
+
+
+def readiness_components():
+    """Estado atual de cada componente (carregamento lazy também conta como pronto)."""
+    components = dict(warmup_state)
+    if components["openai_client"] == "lazy" and extractor.client_ready:
+        components["openai_client"] = "ready"
+    if components["embedding_model"] == "lazy" and extractor.cache.embedding_model_loaded:
+        components["embedding_model"] = "ready"
+    return components
+
 
 @app.route('/health', methods=['GET'])
+@app.route('/health/live', methods=['GET'])
 def health():
-    """Health check endpoint"""
+    """Liveness: o processo está de pé e respondendo"""
     return jsonify({"status": "ok"}), 200
 
 
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    """
+    Readiness: 503 enquanto algum aquecimento ainda está em andamento,
+    para o load balancer só rotear para workers prontos.
+    """
+    components = readiness_components()
+    ready = "warming" not in components.values()
+    return jsonify({
+        "status": "ready" if ready else "warming",
+        "components": components
+    }), 200 if ready else 503
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas de runtime (pool HTTP do cliente OpenAI e caches: hits, latência, ocupação)"""
+    return jsonify({
+        "http_pool": extractor.http_metrics.snapshot(),
+        "result_cache": extractor.cache.get_result_cache_stats(),
+        "cache": extractor.cache.get_metrics()
+    }), 200
+
+
 @app.route('/extract', methods=['POST'])
 def extract():
     """
@@ -36,6 +137,19 @@ def extract():
             "nome": "Nome do profissional",
             "inscricao": "Número de inscrição"
         },
+        "pdf": "base64_encoded_pdf_content",
+        "deadline_ms": 15000,  (opcional, ou header X-Deadline-Ms)
+        "retry_failed": true   (opcional, ou header X-Retry-Failed: true)
+    }
+
+    Input JSON (vários schemas, uma única chamada LLM; não combinar com
+    extraction_schema, senão HTTP 400):
+    {
+        "label": "carteira_oab",
+        "extraction_schemas": {
+            "cadastro": {"nome": "...", "inscricao": "..."},
+            "endereco": {"nome": "...", "endereco": "..."}
+        },
         "pdf": "base64_encoded_pdf_content"
     }
 
@@ -46,6 +160,12 @@ def extract():
         ...
     }
 
+    Output JSON (sucesso, vários schemas):
+    {
+        "cadastro": {"nome": "SON GOKU", "inscricao": "101943"},
+        "endereco": {"nome": "SON GOKU", "endereco": "..."}
+    }
+
     Headers (metadados):
     - X-Extraction-Cost-USD: 0.002499
     - X-Extraction-Tokens-Input: 450
@@ -58,6 +178,10 @@ def extract():
     {
         "error": "Mensagem de erro"
     }
+
+    Deadline excedido: HTTP 504 com header X-Extraction-Timeout: true
+    Falha recente do mesmo PDF (cache negativo): HTTP 500 com o erro gravado e
+    header X-Extraction-Negative-Cache: true (retry_failed força o reprocessamento)
     """
     try:
         # Validar Content-Type
@@ -70,41 +194,81 @@ def extract():
         if not data:
             return jsonify({"error": "Corpo da requisição vazio"}), 400
 
-        required_fields = ['label', 'extraction_schema', 'pdf']
+        required_fields = ['label', 'pdf']
         for field in required_fields:
             if field not in data:
                 return jsonify({"error": f"Campo obrigatório ausente: {field}"}), 400
 
+        if 'extraction_schema' not in data and 'extraction_schemas' not in data:
+            return jsonify({"error": "Campo obrigatório ausente: extraction_schema"}), 400
+        if 'extraction_schema' in data and 'extraction_schemas' in data:
+            return jsonify({"error": "Informe extraction_schema OU extraction_schemas, não os dois"}), 400
+
         label = data['label']
-        extraction_schema = data['extraction_schema']
         pdf_base64 = data['pdf']
 
         # Validar tipos
         if not isinstance(label, str) or not label.strip():
             return jsonify({"error": "label deve ser uma string não vazia"}), 400
 
-        if not isinstance(extraction_schema, dict) or len(extraction_schema) == 0:
-            return jsonify({"error": "extraction_schema deve ser um objeto não vazio"}), 400
-
         if not isinstance(pdf_base64, str) or not pdf_base64.strip():
             return jsonify({"error": "pdf deve ser uma string Base64 não vazia"}), 400
 
+        extraction_schemas = data.get('extraction_schemas')
+        if extraction_schemas is not None:
+            if not isinstance(extraction_schemas, dict) or len(extraction_schemas) == 0:
+                return jsonify({"error": "extraction_schemas deve ser um objeto não vazio"}), 400
+            for schema_name, schema in extraction_schemas.items():
+                if not isinstance(schema, dict) or len(schema) == 0:
+                    return jsonify({"error": f"extraction_schemas.{schema_name} deve ser um objeto não vazio"}), 400
+        else:
+            extraction_schema = data['extraction_schema']
+            if not isinstance(extraction_schema, dict) or len(extraction_schema) == 0:
+                return jsonify({"error": "extraction_schema deve ser um objeto não vazio"}), 400
+
+        try:
+            ctx = build_request_context(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
         # Executar extração
         start_time = time.time()
-        result = extractor.extract_from_base64(
-            pdf_base64=pdf_base64,
-            label=label,
-            extraction_schema=extraction_schema
-        )
+        if extraction_schemas is not None:
+            result = extractor.extract_multi_from_base64(
+                pdf_base64=pdf_base64,
+                label=label,
+                extraction_schemas=extraction_schemas,
+                ctx=ctx
+            )
+        else:
+            result = coalescer.submit(
+                pdf_base64=pdf_base64,
+                label=label,
+                extraction_schema=extraction_schema,
+                ctx=ctx
+            )
         elapsed_time = time.time() - start_time
 
+        # Deadline excedido: resposta rápida e bem definida
+        if result.get('timeout', False):
+            response = jsonify({"error": result.get('error', 'Deadline excedido')})
+            response.headers['X-Extraction-Timeout'] = 'true'
+            response.headers['X-Extraction-Time-Seconds'] = str(round(elapsed_time, 3))
+            return response, 504
+
         # Verificar sucesso
         if not result.get('success', False):
             error_message = result.get('error', 'Erro desconhecido na extração')
-            return jsonify({"error": error_message}), 500
-
-        # Preparar resposta
-        extracted_data = result.get('data', {})
+            response = jsonify({"error": error_message})
+            if result.get('from_negative_cache'):
+                response.headers['X-Extraction-Negative-Cache'] = 'true'
+            return response, 500
+
+        # Preparar resposta (vários schemas: dados separados por schema)
+        if extraction_schemas is not None:
+            extracted_data = result.get('results', {})
+        else:
+            extracted_data = result.get('data', {})
 
         # Preparar headers com metadados
         headers = {
@@ -115,6 +279,11 @@ def extract():
             'X-Extraction-Used-Examples': str(result.get('used_examples', False)).lower()
         }
 
+        if result.get('coalesced_requests'):
+            headers['X-Extraction-Coalesced-Requests'] = str(result['coalesced_requests'])
+        if result.get('merged_fields'):
+            headers['X-Extraction-Merged-Fields'] = str(result['merged_fields'])
+
         # Adicionar metadados de tokens (se disponíveis)
         tokens = result.get('tokens', {})
         if tokens:
@@ -139,7 +308,7 @@ def extract_stream():
     Endpoint de extração com streaming SSE (Server-Sent Events).
     Retorna eventos de progresso e resultado final.
 
-    Input: Mesmo formato do /extract
+    Input: Mesmo formato do /extract (inclusive deadline_ms / X-Deadline-Ms)
 
     Output (SSE events):
     - event: status, data: {"status": "processing"}
@@ -147,6 +316,10 @@ def extract_stream():
     - event: metadata, data: {"cost": 0.002, "tokens": {...}}
     - event: result, data: {dados extraídos}
     - event: error, data: {"error": "mensagem"}
+    - event: error, data: {"error": "mensagem", "timeout": true}  (deadline excedido)
+    - ": heartbeat" (comentário SSE) a cada SSE_HEARTBEAT_SECONDS durante a extração
+
+    Se o cliente desconecta, a extração em andamento (e seus retries) é cancelada.
     """
     # Validar entrada ANTES do generator (dentro do contexto da requisição)
     try:
@@ -175,6 +348,7 @@ def extract_stream():
         label = data['label']
         extraction_schema = data['extraction_schema']
         pdf_base64 = data['pdf']
+        ctx = build_request_context(data)
     except Exception as e:
         return Response(
             f"event: error\ndata: {json.dumps({'error': f'Erro ao validar requisição: {str(e)}'}, ensure_ascii=False)}\n\n",
@@ -182,25 +356,40 @@ def extract_stream():
         )
 
     # Generator agora recebe os dados já validados
-    def generate(label, extraction_schema, pdf_base64):
+    def generate(label, extraction_schema, pdf_base64, ctx):
+        ctx.cancel_token = CancellationToken()
+        future = None
         try:
 
             # Enviar status: processando
             yield f"event: status\ndata: {json.dumps({'status': 'processing'}, ensure_ascii=False)}\n\n"
 
-            # Executar extração
+            # Executar extração (em outra thread) enviando heartbeats enquanto espera.
+            # Escrever o heartbeat é o que detecta a conexão quebrada: o servidor WSGI
+            # fecha este generator (GeneratorExit) e o finally cancela a extração.
             start_time = time.time()
-            result = extractor.extract_from_base64(
+            future = stream_executor.submit(
+                extractor.extract_from_base64,
                 pdf_base64=pdf_base64,
                 label=label,
-                extraction_schema=extraction_schema
+                extraction_schema=extraction_schema,
+                ctx=ctx
             )
+            while True:
+                try:
+                    result = future.result(timeout=SSE_HEARTBEAT_SECONDS)
+                    break
+                except FutureTimeoutError:
+                    yield ": heartbeat\n\n"
             elapsed_time = time.time() - start_time
 
             # Verificar sucesso
             if not result.get('success', False):
                 error_message = result.get('error', 'Erro desconhecido')
-                yield f"event: error\ndata: {json.dumps({'error': error_message}, ensure_ascii=False)}\n\n"
+                error_data = {'error': error_message}
+                if result.get('timeout', False):
+                    error_data['timeout'] = True
+                yield f"event: error\ndata: {json.dumps(error_data, ensure_ascii=False)}\n\n"
                 return
 
             # Enviar status: completo
@@ -222,9 +411,14 @@ def extract_stream():
 
         except Exception as e:
             yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+        finally:
+            # Cliente desconectou (ou erro) antes do fim: cancela LLM e retries
+            if future is not None and not future.done():
+                print("         [CANCEL] Cliente desconectou do stream, cancelando extracao")
+                ctx.cancel_token.cancel()
 
     return Response(
-        generate(label, extraction_schema, pdf_base64),
+        generate(label, extraction_schema, pdf_base64, ctx),
         mimetype='text/event-stream',
         headers={
             'Cache-Control': 'no-cache',
@@ -264,13 +458,36 @@ def method_not_allowed(error):
     return jsonify({"error": "Método HTTP não permitido"}), 405
 
 
+# Pré-conexão com a OpenAI em background (evita handshake TLS na 1ª requisição)
+if os.getenv('OPENAI_PRECONNECT', 'true').lower() == 'true':
+    warmup_state["openai_client"] = "warming"
+    threading.Thread(
+        target=run_warmup, args=("openai_client", extractor.preconnect),
+        name='openai-preconnect', daemon=True
+    ).start()
+
+# Aquecimento em background: caches de label em memória + modelo de embeddings
+# (import + load + encode de teste saem da 1ª requisição após deploy/restart)
+if os.getenv('WARMUP_ON_STARTUP', 'false').lower() == 'true':
+    warmup_state["label_caches"] = "warming"
+    warmup_state["embedding_model"] = "warming"
+
+    def _warmup():
+        run_warmup("label_caches", extractor.cache.preload_label_caches)
+        run_warmup("embedding_model", extractor.cache.warmup_embedding_model)
+
+    threading.Thread(target=_warmup, name='startup-warmup', daemon=True).start()
+
+
 if __name__ == '__main__':
     # Configuração para desenvolvimento
     print("=" * 80)
     print("  PDF EXTRACTOR API - ENTER AI FELLOWSHIP")
     print("=" * 80)
     print("\nEndpoints disponiveis:")
-    print("  - GET  /health           - Health check")
+    print("  - GET  /health/live      - Liveness check")
+    print("  - GET  /health/ready     - Readiness check (aquecimento)")
+    print("  - GET  /metrics          - Metricas de runtime")
     print("  - POST /extract          - Extracao sincrona")
     print("  - POST /extract/stream   - Extracao com SSE streaming")
     print("\nServidor iniciando em http://0.0.0.0:5000")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark dos backends de embedding na busca de exemplos few-shot.
+
+Compara o backend de n-gramas com hashing contra o sentence-transformers:
+- Latência de encode por documento
+- Concordância do exemplo mais similar (top-1) e sobreposição do top-3
+
+Uso:
+    python benchmark_embeddings.py                  # documentos de test_learning.py
+    python benchmark_embeddings.py --pdf-dir pdfs/  # + PDFs de um diretório
+"""
+import argparse
+import time
+from pathlib import Path
+import numpy as np
+from embedding_backends import HashedNgramBackend, SentenceTransformerBackend
+from test_learning import DOCUMENTOS_TESTE
+
+
+def load_documents(pdf_dir=None):
+    """Trechos (500 chars, como no pipeline) dos documentos de teste e dos PDFs."""
+    documents = [(doc["nome"], doc["texto"].strip()[:500]) for doc in DOCUMENTOS_TESTE]
+    if pdf_dir:
+        import fitz
+        for pdf_path in sorted(Path(pdf_dir).rglob("*.pdf")):
+            with fitz.open(pdf_path) as doc:
+                text = "\n".join(page.get_text() for page in doc)
+            documents.append((pdf_path.name, text.strip()[:500]))
+    return documents
+
+
+def encode_all(backend, texts):
+    """Embeddings normalizados (matriz) e latências de encode em ms."""
+    vectors, latencies = [], []
+    for text in texts:
+        start = time.perf_counter()
+        vector = np.asarray(backend.encode(text), dtype=np.float32)
+        latencies.append((time.perf_counter() - start) * 1000)
+        norm = np.linalg.norm(vector)
+        vectors.append(vector / norm if norm > 0 else vector)
+    return np.vstack(vectors), np.array(latencies)
+
+
+def rankings(matrix):
+    """Para cada documento, os demais ordenados por similaridade (desc)."""
+    similarities = matrix @ matrix.T
+    np.fill_diagonal(similarities, -np.inf)
+    return np.argsort(-similarities, axis=1)[:, :-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos backends de embedding")
+    parser.add_argument("--pdf-dir", help="Diretório com PDFs adicionais (busca recursiva)")
+    args = parser.parse_args()
+
+    documents = load_documents(args.pdf_dir)
+    names = [name for name, _ in documents]
+    texts = [text for _, text in documents]
+
+    print("=" * 80)
+    print("  BENCHMARK DE EMBEDDINGS (FEW-SHOT)")
+    print("=" * 80)
+    print(f"\nDocumentos: {len(texts)}")
+
+    backends = [HashedNgramBackend()]
+    reference = SentenceTransformerBackend()
+    if reference.load():
+        backends.append(reference)
+    else:
+        print("[AVISO] sentence-transformers indisponível: comparando apenas latência")
+
+    results = {}
+    for backend in backends:
+        backend.encode("warmup")
+        matrix, latencies = encode_all(backend, texts)
+        results[backend.name] = rankings(matrix)
+        print(f"\n[{backend.name}]")
+        print(f"  Encode: média {latencies.mean():.3f} ms | p95 {np.percentile(latencies, 95):.3f} ms")
+
+    hashed_rank = results[backends[0].name]
+    print("\nExemplo mais similar por documento (hashed):")
+    for i, name in enumerate(names):
+        print(f"  {name} -> {names[hashed_rank[i][0]]}")
+
+    if len(backends) > 1:
+        reference_rank = results[reference.name]
+        top1 = np.mean(hashed_rank[:, 0] == reference_rank[:, 0])
+        k = min(3, hashed_rank.shape[1])
+        overlap = np.mean([
+            len(set(hashed_rank[i, :k]) & set(reference_rank[i, :k])) / k
+            for i in range(len(texts))
+        ])
+        print(f"\nConcordância top-1 com {reference.name}: {top1:.1%}")
+        print(f"Sobreposição top-{k}: {overlap:.1%}")
+
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark do formato do cache de label: JSON antigo x formato compacto.
+
+Compara, para um cache sintético com N exemplos:
+- Tamanho em disco (cabeçalho + .npy)
+- Tempo de carga (load_cache de um processo novo)
+- Memória Python retida após a carga (tracemalloc; o .npy mapeado não conta,
+  as páginas são do arquivo e o SO as descarta sob pressão)
+
+Uso:
+    python benchmark_label_cache.py                      # 200 exemplos, dim 384
+    python benchmark_label_cache.py --examples 1000 --dim 1024
+"""
+import argparse
+import gc
+import json
+import shutil
+import tempfile
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+import numpy as np
+from label_cache_format import read_label_cache, serialize_label_cache, write_label_cache
+
+
+def build_cache(num_examples, dim, seed=0):
+    """Cache sintético no formato em memória (embeddings float32 normalizados)."""
+    rng = np.random.RandomState(seed)
+    examples = []
+    for i in range(num_examples):
+        vector = rng.randn(dim).astype(np.float32)
+        examples.append({
+            "id": uuid.uuid4().hex,
+            "added_at": time.time(),
+            "text_snippet": f"DOCUMENTO {i}\nNome: PESSOA {i}\nInscrição: {100000 + i}\n" * 6,
+            "extracted": {"nome": f"PESSOA {i}", "inscricao": str(100000 + i), "seccional": "SP"},
+            "embedding": vector / np.linalg.norm(vector),
+            "embedding_backend": "benchmark"
+        })
+    return {"schema_complete": {"nome": "Nome", "inscricao": "Inscrição"}, "examples": examples, "patterns": {}}
+
+
+def write_legacy(cache_path, cache_data):
+    """Formato antigo: embeddings como listas de floats, indent=2."""
+    legacy = {
+        **cache_data,
+        "examples": [{**example, "embedding": example["embedding"].tolist()} for example in cache_data["examples"]]
+    }
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(legacy, f, ensure_ascii=False, indent=2)
+
+
+def load_legacy(cache_path):
+    """Carga como antes: json.load com listas de floats em memória."""
+    with open(cache_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def measure(load_fn, cache_path, repeats=5):
+    """Tempo médio de carga (ms) e memória Python retida pela estrutura carregada (MB)."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        load_fn(cache_path)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    gc.collect()
+    tracemalloc.start()
+    loaded = load_fn(cache_path)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del loaded
+    return float(np.mean(timings)), retained / (1024 * 1024)
+
+
+def disk_size(directory):
+    return sum(path.stat().st_size for path in Path(directory).iterdir()) / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do formato do cache de label")
+    parser.add_argument("--examples", type=int, default=200, help="Número de exemplos")
+    parser.add_argument("--dim", type=int, default=384, help="Dimensão dos embeddings")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("  BENCHMARK DO CACHE DE LABEL (JSON x COMPACTO)")
+    print("=" * 80)
+    print(f"\nExemplos: {args.examples} | Dimensão: {args.dim}\n")
+
+    cache_data = build_cache(args.examples, args.dim)
+    variants = [
+        ("JSON antigo (indent=2)", None),
+        ("Compacto float32", np.float32),
+        ("Compacto float16", np.float16),
+    ]
+
+    print(f"{'Formato':<26}{'Disco (MB)':>12}{'Carga (ms)':>12}{'Memória (MB)':>14}")
+    for name, dtype in variants:
+        directory = tempfile.mkdtemp()
+        try:
+            cache_path = Path(directory) / "benchmark.json"
+            if dtype is None:
+                write_legacy(cache_path, cache_data)
+                load_fn = load_legacy
+            else:
+                write_label_cache(cache_path, *serialize_label_cache("benchmark", cache_data, dtype))
+                load_fn = read_label_cache
+            load_ms, memory_mb = measure(load_fn, cache_path)
+            print(f"{name:<26}{disk_size(directory):>12.2f}{load_ms:>12.2f}{memory_mb:>14.2f}")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    main()
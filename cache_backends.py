@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+Backends de cache compartilhado (chave -> bytes com TTL) entre nós da frota.
+ESTRATÉGIA: Cada nó mantém seus caches locais (cache/ e .results_cache/); um
+backend compartilhado opcional fica atrás deles como mais um tier. Resultados,
+campos, textos, falhas e exemplos few-shot gravados por um nó passam a valer
+para todos os outros. Labels ficam em uma chave por exemplo/campo do schema:
+cada nó publica só o que mudou.
+
+Interface comum (duck typing, como em embedding_backends.py):
+    get(key) -> bytes ou None
+    set(key, value, ttl=None)        ttl em segundos (None = sem expiração)
+    delete(key)
+    scan(prefix) -> iterador de chaves
+    purge_expired() -> n removidas   (Redis expira sozinho: 0)
+
+Backends:
+    file://<diretório>       Um arquivo por chave (ex: volume NFS compartilhado)
+    sqlite://<arquivo.db>    Tabela chave/valor em SQLite (WAL)
+    redis://[:senha@]host[:porta][/db]   Servidor Redis (cliente RESP mínimo, sem dependências)
+
+Variável:
+    CACHE_SHARED_BACKEND: URL do backend (vazio = sem cache compartilhado)
+"""
+import os
+import socket
+import sqlite3
+import struct
+import threading
+import time
+from pathlib import Path
+from urllib.parse import quote, unquote, urlparse
+
+
+# Cabeçalho dos arquivos do FileSystemBackend: instante de expiração (epoch, 0 = nunca)
+_EXPIRES_HEADER = struct.Struct('<d')
+
+
+class FileSystemBackend:
+    """
+    Um arquivo por chave (nome = chave com escape de URL), com o instante de
+    expiração no cabeçalho. Gravação atômica: temporário + os.replace.
+    """
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory: Diretório dos arquivos (criado se não existe)
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.name = f"file://{self.directory}"
+
+    def _path(self, key):
+        return self.directory / f"{quote(key, safe='')}.bin"
+
+    def get(self, key):
+        """Valor da chave ou None (ausente ou expirada)."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        (expires_at,) = _EXPIRES_HEADER.unpack_from(data)
+        if expires_at and expires_at <= time.time():
+            path.unlink(missing_ok=True)
+            return None
+        return data[_EXPIRES_HEADER.size:]
+
+    def set(self, key, value, ttl=None):
+        """Grava o valor (ttl em segundos; None = sem expiração)."""
+        path = self._path(key)
+        expires_at = time.time() + ttl if ttl is not None else 0.0
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(_EXPIRES_HEADER.pack(expires_at))
+            f.write(value)
+        os.replace(tmp_path, path)
+
+    def delete(self, key):
+        """Remove a chave (sem erro se não existe)."""
+        self._path(key).unlink(missing_ok=True)
+
+    def scan(self, prefix=""):
+        """Chaves válidas (não expiradas) que começam com prefix."""
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.bin'):
+                continue
+            key = unquote(entry.name[:-len('.bin')])
+            if not key.startswith(prefix):
+                continue
+            try:
+                with open(entry.path, 'rb') as f:
+                    (expires_at,) = _EXPIRES_HEADER.unpack(f.read(_EXPIRES_HEADER.size))
+            except (OSError, struct.error):
+                continue
+            if not expires_at or expires_at > now:
+                yield key
+
+    def purge_expired(self):
+        """Remove os arquivos expirados. Returns: int removidos."""
+        now = time.time()
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.bin'):
+                continue
+            try:
+                with open(entry.path, 'rb') as f:
+                    (expires_at,) = _EXPIRES_HEADER.unpack(f.read(_EXPIRES_HEADER.size))
+                if expires_at and expires_at <= now:
+                    os.unlink(entry.path)
+                    removed += 1
+            except (OSError, struct.error):
+                continue
+        return removed
+
+
+class SQLiteBackend:
+    """
+    Tabela chave/valor em SQLite (WAL), uma conexão por thread.
+    Expiração filtrada na leitura; purge_expired remove as linhas vencidas.
+    """
+
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path: Caminho do arquivo SQLite
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.name = f"sqlite://{self.db_path}"
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_expires_at ON entries(expires_at)")
+
+    def _conn(self):
+        """Retorna a conexão da thread atual (criada sob demanda)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """Valor da chave ou None (ausente ou expirada)."""
+        row = self._conn().execute(
+            "SELECT value FROM entries WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return bytes(row[0]) if row is not None else None
+
+    def set(self, key, value, ttl=None):
+        """Grava o valor (ttl em segundos; None = sem expiração)."""
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, sqlite3.Binary(value), time.time() + ttl if ttl is not None else None)
+            )
+
+    def delete(self, key):
+        """Remove a chave (sem erro se não existe)."""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def scan(self, prefix=""):
+        """Chaves válidas que começam com prefix (faixa indexada da chave primária)."""
+        rows = self._conn().execute(
+            "SELECT key FROM entries WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?)",
+            (prefix, prefix + '\U0010ffff', time.time())
+        ).fetchall()
+        return (row[0] for row in rows)
+
+    def purge_expired(self):
+        """Remove as linhas expiradas. Returns: int removidas."""
+        conn = self._conn()
+        with conn:
+            return conn.execute(
+                "DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            ).rowcount
+
+
+class RedisError(Exception):
+    """Erro devolvido pelo servidor Redis (resposta RESP "-ERR ...")."""
+
+
+class RedisBackend:
+    """
+    Cliente RESP mínimo (GET, SET PX, DEL, SCAN) sobre socket, sem dependências.
+    Uma conexão por thread; conexão quebrada (ex: servidor reiniciado) é refeita
+    e o comando repetido uma vez. O TTL fica a cargo do servidor.
+    """
+
+    def __init__(self, host="localhost", port=6379, db=0, password=None, username=None, timeout=2.0):
+        """
+        Args:
+            host: Host do servidor
+            port: Porta do servidor
+            db: Número do banco (SELECT)
+            password: Senha (AUTH) ou None
+            username: Usuário ACL (Redis 6+) ou None
+            timeout: Timeout de conexão e leitura, em segundos
+        """
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.username = username
+        self.timeout = timeout
+        self.name = f"redis://{host}:{port}/{db}"
+        self._local = threading.local()
+
+    @classmethod
+    def from_url(cls, url, timeout=2.0):
+        """Cria o backend a partir de redis://[[usuário]:senha@]host[:porta][/db]."""
+        parsed = urlparse(url)
+        db = parsed.path.lstrip('/')
+        return cls(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(db) if db else 0,
+            password=unquote(parsed.password) if parsed.password else None,
+            username=unquote(parsed.username) if parsed.username else None,
+            timeout=timeout
+        )
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = (sock, sock.makefile('rb'))
+        try:
+            if self.password is not None:
+                auth = ("AUTH", self.username, self.password) if self.username else ("AUTH", self.password)
+                self._send(connection, auth)
+            if self.db:
+                self._send(connection, ("SELECT", self.db))
+        except Exception:
+            connection[1].close()
+            sock.close()
+            raise
+        self._local.connection = connection
+        return connection
+
+    def _close(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            try:
+                connection[1].close()
+                connection[0].close()
+            except OSError:
+                pass
+
+    def execute(self, *args):
+        """
+        Executa um comando e retorna a resposta decodificada do RESP.
+
+        Raises:
+            RedisError: Erro devolvido pelo servidor
+            OSError: Falha de conexão (após uma nova tentativa)
+        """
+        for attempt in range(2):
+            connection = getattr(self._local, 'connection', None)
+            try:
+                if connection is None:
+                    connection = self._connect()
+                return self._send(connection, args)
+            except RedisError:
+                raise
+            except (OSError, EOFError):
+                self._close()
+                if attempt == 1:
+                    raise
+
+    def _send(self, connection, args):
+        sock, reader = connection
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        sock.sendall(b"".join(parts))
+        return self._read_reply(reader)
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise EOFError("conexão fechada pelo servidor Redis")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode('utf-8')
+        if kind == b"-":
+            raise RedisError(payload.decode('utf-8'))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            if len(data) != length + 2:
+                raise EOFError("resposta Redis incompleta")
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            return None if length < 0 else [self._read_reply(reader) for _ in range(length)]
+        raise RedisError(f"Resposta RESP inesperada: {line!r}")
+
+    def get(self, key):
+        """Valor da chave ou None."""
+        return self.execute("GET", key)
+
+    def set(self, key, value, ttl=None):
+        """Grava o valor (ttl em segundos; None = sem expiração)."""
+        if ttl is None:
+            self.execute("SET", key, value)
+        else:
+            self.execute("SET", key, value, "PX", max(int(ttl * 1000), 1))
+
+    def delete(self, key):
+        """Remove a chave (sem erro se não existe)."""
+        self.execute("DEL", key)
+
+    def scan(self, prefix=""):
+        """Chaves que começam com prefix (SCAN incremental: não bloqueia o servidor)."""
+        pattern = "".join(f"\\{char}" if char in "*?[]\\" else char for char in prefix) + "*"
+        cursor = "0"
+        while True:
+            cursor, keys = self.execute("SCAN", cursor, "MATCH", pattern, "COUNT", 500)
+            cursor = cursor.decode('utf-8')
+            for key in keys:
+                yield key.decode('utf-8')
+            if cursor == "0":
+                return
+
+    def purge_expired(self):
+        """O servidor expira as chaves sozinho."""
+        return 0
+
+
+def get_cache_backend(url=None):
+    """
+    Cria o backend compartilhado configurado.
+
+    Args:
+        url: URL do backend; default = CACHE_SHARED_BACKEND (vazio = nenhum)
+
+    Returns:
+        FileSystemBackend, SQLiteBackend, RedisBackend ou None
+
+    Raises:
+        ValueError: Se o esquema da URL for desconhecido
+    """
+    url = (url if url is not None else os.getenv('CACHE_SHARED_BACKEND', '')).strip()
+    if not url:
+        return None
+    scheme, _, location = url.partition('://')
+    scheme = scheme.lower()
+    if scheme == 'file':
+        return FileSystemBackend(location)
+    if scheme == 'sqlite':
+        return SQLiteBackend(location)
+    if scheme == 'redis':
+        return RedisBackend.from_url(url, timeout=float(os.getenv('CACHE_SHARED_TIMEOUT_SECONDS', '2')))
+    raise ValueError(f"CACHE_SHARED_BACKEND desconhecido: {url} (use file://, sqlite:// ou redis://)")
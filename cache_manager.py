@@ -1,214 +1,1050 @@
+import atexit
 import json
 import os
+import copy
 import hashlib
+import sys
+import threading
+import time
+import uuid
 import numpy as np
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime, timedelta
+from result_store import ResultStore
+from cache_backends import get_cache_backend
+from cache_metrics import CacheMetrics
+from file_lock import FileLock
+from label_cache_format import (
+    read_label_cache, serialize_label_cache, write_label_cache, pack_label_cache, unpack_label_cache
+)
+from embedding_index import EmbeddingIndex
+from embedding_backends import get_embedding_backend, LEGACY_BACKEND_NAME
+from minhash_lsh import MinHasher, LSHIndex, signature_to_bytes, signature_from_bytes
+
+
+# Hash de conteúdo: BLAKE2b-128 (stdlib), bem mais rápido que MD5.
+# Sempre o mesmo algoritmo: as chaves precisam ser iguais em todos os nós.
+def _new_content_hasher():
+    return hashlib.blake2b(digest_size=16)
+
+
+_HASH_CHUNK_SIZE = 1 << 20  # 1 MB
+
+
+def hash_bytes(data):
+    """Hash do conteúdo em memória (mesmo valor de CacheManager.get_pdf_hash para o arquivo)."""
+    hasher = _new_content_hasher()
+    hasher.update(data)
+    return hasher.hexdigest()
+
+# Trecho do texto usado na assinatura MinHash (detecção de templates)
+_TEMPLATE_TEXT_CHARS = 1000
+
+# Texto guardado com o resultado e no cache de textos (mesmo limite do
+# truncamento no extractor); usado no diff de template
+_STORED_TEXT_CHARS = 2000
+
+# Custo fixo estimado de um exemplo em memória (dict, id, timestamps, backend)
+_EXAMPLE_OVERHEAD_BYTES = 600
+
+# Classes de falha do cache negativo. Só falhas determinísticas (o mesmo PDF
+# falha de novo); erros de rede/API e deadline não entram.
+# Falhas do PDF valem para qualquer schema; saída inválida do LLM, por label+schema.
+FAILURE_NO_TEXT = "no_text"
+FAILURE_UNREADABLE_PDF = "unreadable_pdf"
+FAILURE_INVALID_LLM_OUTPUT = "invalid_llm_output"
 
 class CacheManager:
     """
     Gerencia cache inteligente por label E por PDF.
     - Cache de padrões: Armazena exemplos e schemas por label (acurácia)
     - Cache de resultados: Armazena resultados por hash de PDF (velocidade)
+      com tier em memória (LRU) na frente do tier em disco (SQLite)
+    - Cache de campos: Armazena cada campo extraído por hash de PDF (reuso parcial)
+    - Cache negativo: Falhas determinísticas por hash de PDF com TTL curto (falha rápida)
+    - Cache compartilhado (opcional): tier atrás de todos os outros (resultados, campos,
+      textos, falhas e exemplos/schema dos labels), visível para todos os nós
     """
 
-    def __init__(self, cache_dir="cache", results_cache_dir=".results_cache", ttl_hours=24):
+    def __init__(self, cache_dir="cache", results_cache_dir=".results_cache", ttl_hours=24,
+                 results_memory_size=256, max_examples=None, embedding_cache_size=1024,
+                 embedding_backend=None, flush_interval=None, sweep_interval=None,
+                 max_results=None, max_results_mb=None, negative_ttl_seconds=None, shared_backend=None):
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
 
-        # Novo: Cache de resultados por PDF
+        # Contadores (hits, misses, expirações, despejos) por label e latências
+        self.metrics = CacheMetrics()
+
+        # Cache compartilhado entre nós (CACHE_SHARED_BACKEND: file://, sqlite:// ou redis://):
+        # tier atrás de cada cache local (resultados, campos, textos, falhas e labels).
+        # Backend com erro fica de fora por shared_retry_seconds (caches locais seguem sozinhos)
+        self.shared = shared_backend if shared_backend is not None else get_cache_backend()
+        self.shared_retry_seconds = 30
+        self._shared_down_until = 0.0
+
+        # Novo: Cache de resultados por PDF (SQLite em modo WAL)
         self.results_cache_dir = Path(results_cache_dir)
         self.results_cache_dir.mkdir(exist_ok=True)
         self.ttl = timedelta(hours=ttl_hours)
-
-        # Embedding model para semantic search (lazy loading)
-        self._embedding_model = None
-
-        # Cache em memória para labels já carregados (pre-load optimization)
+        self.results_store = ResultStore(self.results_cache_dir / "results.db")
+
+        # Limpeza em background: expirados por TTL e, acima do limite (entradas ou
+        # MB, 0 = sem limite), os acessados há mais tempo. Em lotes pequenos.
+        # Intervalo 0 = sem thread (limpeza via compact_results_cache.py)
+        if sweep_interval is None:
+            sweep_interval = float(os.getenv('RESULT_CACHE_SWEEP_INTERVAL_SECONDS', '300'))
+        if max_results is None:
+            max_results = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '0'))
+        if max_results_mb is None:
+            max_results_mb = float(os.getenv('RESULT_CACHE_MAX_MB', '0'))
+        self.sweep_interval = sweep_interval
+        self.max_results = max_results
+        self.max_results_bytes = int(max_results_mb * 1024 * 1024)
+        self.sweep_batch_size = 500
+        self._accessed_results = set()
+        self._sweeper = None
+
+        # Cache negativo: reenvio de PDF sem texto (ou que o LLM não consegue
+        # responder em JSON) falha rápido, sem parse nem chamadas LLM (0 = desligado)
+        if negative_ttl_seconds is None:
+            negative_ttl_seconds = float(os.getenv('NEGATIVE_CACHE_TTL_SECONDS', '600'))
+        self.negative_ttl = timedelta(seconds=negative_ttl_seconds)
+
+        # Compatibilidade: entradas antigas foram gravadas com hash MD5 do PDF.
+        # Ligado, todo miss relê o PDF para calcular o MD5 e buscar a chave antiga;
+        # por isso vem desligado. Migração única: migrate_results_cache.py --rehash-md5
+        self.legacy_hash_lookup = os.getenv('CACHE_LEGACY_MD5_LOOKUP', 'false').lower() == 'true'
+
+        # Segunda chave do cache de resultados: hash do texto limpo enviado ao LLM
+        # (mesmo documento reexportado/reassinado = bytes diferentes, texto igual)
+        self.text_key_lookup = os.getenv('RESULT_CACHE_TEXT_KEY', 'true').lower() == 'true'
+
+        # Tier em memória do cache de resultados: LRU limitado por nº de entradas
+        # (repetições "quentes" retornam sem I/O de arquivo JSON)
+        self.results_memory_size = results_memory_size
+        self._results_lru = OrderedDict()
+        self._results_lock = threading.Lock()
+
+        # Backend de embeddings para semantic search (default: sentence-transformers,
+        # carregado sob demanda ou no warmup; EMBEDDING_BACKEND=hashed dispensa o modelo)
+        self.embedding_backend = embedding_backend or get_embedding_backend()
+
+        # LRU de embeddings por hash do trecho: documentos repetidos não passam pelo modelo
+        self.embedding_cache_size = embedding_cache_size
+        self._embedding_lru = OrderedDict()
+        self._embedding_lock = threading.Lock()
+
+        # Tempo mínimo restante no deadline para valer a pena gerar embedding
+        self.embedding_budget_seconds = 1.0
+
+        # Cache em memória para labels já carregados (pre-load optimization).
+        # Limitado por orçamento de bytes (LABEL_CACHE_MEMORY_MB, 0 = sem limite):
+        # labels frios saem (LRU) e são recarregados do disco sob demanda;
+        # labels fixados (pin_label / LABEL_CACHE_PINNED) nunca saem
         self._memory_cache = {}
+        self.label_memory_budget = int(float(os.getenv('LABEL_CACHE_MEMORY_MB', '256')) * 1024 * 1024)
+        self._label_bytes = {}
+        self._label_last_used = {}
+        self._pinned_labels = {label.strip() for label in os.getenv('LABEL_CACHE_PINNED', '').split(',') if label.strip()}
+
+        # Write-behind: mutações ficam em memória e um flusher em background grava
+        # os labels alterados a cada intervalo (0 = gravação síncrona a cada save)
+        if flush_interval is None:
+            flush_interval = float(os.getenv('CACHE_FLUSH_INTERVAL_SECONDS', '2'))
+        self.flush_interval = flush_interval
+        self._labels_lock = threading.Lock()
+        self._label_locks = {}
+        self._dirty_labels = set()
+        self._flushing_labels = {}
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        # Chaves do label já presentes no cache compartilhado -> versão publicada
+        self._shared_published = {}
+        atexit.register(self.flush)
+
+        # Formato compacto: embeddings em .npy (mmap) ao lado do cabeçalho JSON;
+        # float16 reduz o arquivo pela metade (suficiente para ranquear exemplos)
+        self.embedding_dtype = np.dtype(os.getenv('LABEL_CACHE_EMBEDDING_DTYPE', 'float32'))
+
+        # Exemplos few-shot por label e índice vetorizado dos seus embeddings.
+        # Store grande (despejo por diversidade) e top-k dentro de um orçamento de tokens
+        if max_examples is None:
+            max_examples = int(os.getenv('MAX_EXAMPLES_PER_LABEL', '200'))
+        self.max_examples = max_examples
+        self.few_shot_k = int(os.getenv('FEW_SHOT_TOP_K', '1'))
+        self.few_shot_token_budget = int(os.getenv('FEW_SHOT_TOKEN_BUDGET', '800'))
+        self._embedding_indexes = {}
+
+        # Detecção de templates: assinatura MinHash por documento e um índice LSH
+        # por (label, schema, limiar), construído sob demanda a partir do SQLite
+        self.template_threshold = float(os.getenv('TEMPLATE_SIMILARITY_THRESHOLD', '0.85'))
+        self._minhasher = MinHasher()
+        self._template_indexes = {}
+        self._template_lock = threading.Lock()
+
+        # Sweeper por último: a thread usa os atributos acima
+        if self.sweep_interval > 0:
+            self._sweeper = threading.Thread(target=self._sweep_loop, name='result-cache-sweeper', daemon=True)
+            self._sweeper.start()
     
     def get_cache_path(self, label):
         """Retorna caminho do arquivo de cache para um label"""
         return self.cache_dir / f"{label}.json"
     
+    def get_lock_path(self, label):
+        """Arquivo de lock (entre processos) do cache de um label"""
+        return self.cache_dir / f"{label}.json.lock"
+
+    @contextmanager
+    def _get_label_lock(self, label):
+        """
+        Segura o lock (em processo) do label: mutações de labels diferentes não se
+        bloqueiam. Conta quem está usando ou esperando o lock, para que a remoção
+        do label da memória só descarte o lock quando ninguém depende dele.
+        """
+        entry = self._acquire_label_lock_entry(label)
+        try:
+            with entry[0]:
+                yield
+        finally:
+            self._release_label_lock_entry(label, entry)
+
+    def _acquire_label_lock_entry(self, label):
+        """Entrada [RLock, usuários] do label, já contando este usuário."""
+        with self._labels_lock:
+            entry = self._label_locks.get(label)
+            if entry is None:
+                entry = self._label_locks[label] = [threading.RLock(), 0]
+            entry[1] += 1
+            return entry
+
+    def _release_label_lock_entry(self, label, entry):
+        """Desconta o usuário; label fora da memória e sem usuários perde o lock e o LRU."""
+        with self._labels_lock:
+            entry[1] -= 1
+            if entry[1] == 0 and label not in self._memory_cache and self._label_locks.get(label) is entry:
+                del self._label_locks[label]
+                self._label_last_used.pop(label, None)
+
+    @contextmanager
+    def _loaded_label(self, label):
+        """
+        Segura o lock do label com o cache em memória (o label não sai pelo
+        orçamento entre carga e mutação). A carga, com a leitura do cache
+        compartilhado, acontece fora do lock; removido nesse meio tempo, carrega de novo.
+        """
+        while True:
+            self.load_cache(label)
+            with self._get_label_lock(label):
+                cache = self._memory_cache.get(label)
+                if cache is not None:
+                    yield cache
+                    return
+
+    def _read_cache_file(self, label):
+        """
+        Lê o cache do label do disco.
+
+        Returns:
+            dict ou None: Cache do label (None se não existe ou está corrompido)
+        """
+        cache_path = self.get_cache_path(label)
+        if not cache_path.exists():
+            return None
+        try:
+            cache_data = read_label_cache(cache_path)
+        except (OSError, ValueError) as e:
+            print(f"[AVISO] Cache do label {label} ilegível, ignorando: {e}")
+            return None
+
+        # Exemplos antigos sem id: id determinístico pelo conteúdo (igual em todos os processos)
+        for example in cache_data.get("examples", []):
+            if "id" not in example:
+                example["id"] = self._example_id(example)
+        return cache_data
+
+    def _example_id(self, example):
+        """Id de um exemplo antigo (sem id) derivado do conteúdo."""
+        hasher = _new_content_hasher()
+        hasher.update(example.get("text_snippet", "").encode('utf-8'))
+        hasher.update(json.dumps(example.get("extracted"), sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        return hasher.hexdigest()
+
     def load_cache(self, label):
         """
         Carrega cache de um label específico.
         OTIMIZAÇÃO: Usa cache em memória para evitar I/O repetido.
         """
         # Verificar se já está em memória
-        if label in self._memory_cache:
-            return self._memory_cache[label]
+        self._label_last_used[label] = time.monotonic()
+        cache_data = self._memory_cache.get(label)
+        if cache_data is not None:
+            self.metrics.increment("label_cache", "hits", label)
+            return cache_data
+
+        # Exemplos aprendidos pelos outros nós: leitura de rede fora do lock do label
+        shared_cache, shared_versions = self._read_shared_label(label)
+
+        with self._get_label_lock(label):
+            # Outra thread pode ter carregado enquanto esperávamos o lock
+            if label in self._memory_cache:
+                self.metrics.increment("label_cache", "hits", label)
+                return self._memory_cache[label]
+
+            # Carregar do disco
+            self.metrics.increment("label_cache", "misses", label)
+            with self.metrics.timer("label_cache.load"):
+                cache_data = self._read_cache_file(label) or {
+                    "schema_complete": {},
+                    "examples": [],
+                    "patterns": {}
+                }
+                if shared_cache is not None:
+                    self._merge_cache(label, cache_data, shared_cache)
+
+            # Armazenar em memória
+            self._memory_cache[label] = cache_data
+            self._shared_published[label] = shared_versions
+            self._update_label_bytes(label)
+
+        self._enforce_label_memory_budget(keep=label)
+        return cache_data
 
-        # Carregar do disco
-        cache_path = self.get_cache_path(label)
-        if cache_path.exists():
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
-        else:
-            cache_data = {
-                "schema_complete": {},
-                "examples": [],
-                "patterns": {}
-            }
+    def pin_label(self, label):
+        """
+        Fixa o label em memória (carrega se preciso): nunca sai pelo orçamento.
+
+        Args:
+            label: Label do documento
+        """
+        with self._labels_lock:
+            self._pinned_labels.add(label)
+        self.load_cache(label)
+
+    def unpin_label(self, label):
+        """Volta o label ao LRU (pode sair quando o orçamento de memória estourar)."""
+        with self._labels_lock:
+            self._pinned_labels.discard(label)
+        self._enforce_label_memory_budget()
+
+    def label_memory_bytes(self):
+        """Bytes estimados de todos os labels em memória."""
+        with self._labels_lock:
+            return sum(self._label_bytes.values())
+
+    def _estimate_label_bytes(self, label, cache):
+        """
+        Bytes aproximados do label em memória: exemplos (texto, dados extraídos,
+        custo fixo do dict), embeddings (nbytes exato) e o índice vetorizado.
+        Chamado sob o lock do label.
+        """
+        size = sys.getsizeof(cache["schema_complete"]) + sum(
+            sys.getsizeof(field_name) + sys.getsizeof(description)
+            for field_name, description in cache["schema_complete"].items()
+        )
+        for example in cache["examples"]:
+            size += _EXAMPLE_OVERHEAD_BYTES + sys.getsizeof(example.get("text_snippet", ""))
+            extracted = example.get("extracted")
+            if isinstance(extracted, dict):
+                size += sys.getsizeof(extracted) + sum(
+                    sys.getsizeof(field_name) + sys.getsizeof(value) for field_name, value in extracted.items()
+                )
+            embedding = example.get("embedding")
+            if embedding is not None:
+                size += getattr(embedding, "nbytes", 0)
+        index = self._embedding_indexes.get(label)
+        if index is not None:
+            size += index.nbytes
+        return size
+
+    def _update_label_bytes(self, label):
+        """Recalcula o tamanho estimado do label (chamado sob o lock do label)."""
+        cache = self._memory_cache.get(label)
+        if cache is None:
+            return
+        size = self._estimate_label_bytes(label, cache)
+        with self._labels_lock:
+            self._label_bytes[label] = size
+
+    def _enforce_label_memory_budget(self, keep=None):
+        """
+        Remove da memória os labels usados há mais tempo até caber no orçamento.
+        Não saem: fixados, o label em uso (keep), labels com alterações ainda não
+        gravadas e labels cujo lock está ocupado (mutação em andamento).
+
+        Args:
+            keep: Label que acabou de ser usado
+
+        Returns:
+            int: Número de labels removidos da memória
+        """
+        if self.label_memory_budget <= 0:
+            return 0
+        with self._labels_lock:
+            total = sum(self._label_bytes.values())
+            if total <= self.label_memory_budget:
+                return 0
+            candidates = sorted(
+                (label for label in self._label_bytes
+                 if label != keep and label not in self._pinned_labels
+                 and label not in self._dirty_labels and label not in self._flushing_labels),
+                key=lambda label: self._label_last_used.get(label, 0)
+            )
+
+        evicted = 0
+        for label in candidates:
+            if total <= self.label_memory_budget:
+                break
+            entry = self._acquire_label_lock_entry(label)
+            if not entry[0].acquire(blocking=False):
+                self._release_label_lock_entry(label, entry)
+                continue
+            try:
+                with self._labels_lock:
+                    if label in self._dirty_labels or label in self._flushing_labels:
+                        continue
+                    total -= self._label_bytes.pop(label, 0)
+                self._memory_cache.pop(label, None)
+                self._embedding_indexes.pop(label, None)
+                self._shared_published.pop(label, None)
+                evicted += 1
+                self.metrics.increment("label_cache", "evictions", label)
+            finally:
+                entry[0].release()
+                # Sem outros usuários: lock e LRU do label saem junto
+                self._release_label_lock_entry(label, entry)
+        return evicted
 
-        # Armazenar em memória
-        self._memory_cache[label] = cache_data
-        return cache_data
-    
     def save_cache(self, label, cache_data):
         """
         Salva cache de um label.
-        OTIMIZAÇÃO: Atualiza cache em memória também.
+        OTIMIZAÇÃO: Atualiza a memória e marca o label como alterado; o disco é
+        gravado pelo flusher em background (ou na hora, se flush_interval == 0).
+        Não chamar segurando o lock do label (a gravação síncrona pega o lock de arquivo).
         """
-        # Atualizar memória
-        self._memory_cache[label] = cache_data
+        with self._get_label_lock(label):
+            self._memory_cache[label] = cache_data
+            self._update_label_bytes(label)
+        self._mark_dirty(label)
+        self._schedule_flush()
+
+    def _mark_dirty(self, label):
+        """Marca o label para a próxima gravação (pode ser chamado segurando o lock do label)."""
+        with self._labels_lock:
+            self._dirty_labels.add(label)
+
+    def _schedule_flush(self):
+        """Grava já (modo síncrono) ou garante o flusher em background."""
+        if self.flush_interval <= 0:
+            self.flush()
+        else:
+            self._ensure_flusher()
+
+    def flush(self):
+        """
+        Grava em disco os labels alterados desde o último flush.
+        Entre processos: sob o lock de arquivo do label, relê o disco e faz merge
+        (exemplos por id) antes de gravar — nenhum worker perde exemplos de outro.
+        Escrita atômica: arquivo temporário + os.replace (leitor nunca vê arquivo pela metade).
+        Um flush por vez: quem chama flush() enquanto o flusher grava espera a
+        gravação em andamento (ao retornar, tudo que foi alterado antes está no disco).
+        Ordem dos locks: flush -> arquivo -> label.
+
+        Returns:
+            int: Número de labels gravados
+        """
+        with self._flush_lock:
+            with self._labels_lock:
+                dirty = self._dirty_labels
+                self._dirty_labels = set()
+                # Em gravação: não pode sair da memória pelo orçamento até terminar
+                for label in dirty:
+                    self._flushing_labels[label] = self._flushing_labels.get(label, 0) + 1
+
+            written = 0
+            for label in dirty:
+                try:
+                    self._flush_label(label)
+                    written += 1
+                except Exception as e:
+                    print(f"[AVISO] Falha ao gravar cache do label {label}: {e}")
+                    self._mark_dirty(label)
+                finally:
+                    with self._labels_lock:
+                        self._flushing_labels[label] -= 1
+                        if not self._flushing_labels[label]:
+                            del self._flushing_labels[label]
+            return written
+
+    def _flush_label(self, label):
+        """
+        Merge com o disco + gravação atômica de um label (ordem dos locks: arquivo -> label).
+        Formato compacto: cabeçalho JSON + embeddings em .npy (ver label_cache_format.py).
+        Com cache compartilhado: antes, lê só as chaves que os outros nós criaram
+        desde a última leitura; depois, publica só as chaves novas/alteradas deste
+        nó (I/O de rede fora dos locks).
+        """
+        shared_cache = None
+        if self.shared is not None:
+            with self._get_label_lock(label):
+                known = set(self._shared_published.get(label, {}))
+                cache = self._memory_cache.get(label)
+                if cache is not None:
+                    known.update(self._shared_label_entries(label, cache))
+            shared_cache, shared_versions = self._read_shared_label(label, known)
+
+        with FileLock(self.get_lock_path(label)):
+            disk_cache = self._read_cache_file(label)
+
+            with self._get_label_lock(label):
+                cache = self._memory_cache.get(label)
+                if cache is None:
+                    return
+                for other_cache in (disk_cache, shared_cache):
+                    if other_cache is not None:
+                        self._merge_cache(label, cache, other_cache)
+                if disk_cache is not None or shared_cache is not None:
+                    self._update_label_bytes(label)
+                # Serializa sob o lock: snapshot consistente mesmo com requisições mutando
+                content, embeddings_file, matrix = serialize_label_cache(label, cache, self.embedding_dtype)
+                if self.shared is not None:
+                    self._shared_published.setdefault(label, {}).update(shared_versions)
+                    changed, removed = self._shared_label_changes(label, cache)
+
+            write_label_cache(self.get_cache_path(label), content, embeddings_file, matrix)
+
+        if self.shared is not None and (changed or removed):
+            self._publish_label_changes(label, changed, removed)
+
+    def _merge_cache(self, label, cache, disk_cache):
+        """
+        Incorpora ao cache em memória o que outros processos gravaram.
+        Schema e padrões: união (memória prevalece). Exemplos: união por id,
+        ordenada por added_at; acima de max_examples, despejo por diversidade.
+        """
+        cache["schema_complete"] = {**disk_cache.get("schema_complete", {}), **cache["schema_complete"]}
+        cache["patterns"] = {**disk_cache.get("patterns", {}), **cache.get("patterns", {})}
+
+        by_id = {}
+        for example in disk_cache.get("examples", []) + cache["examples"]:
+            by_id[example["id"]] = example
+        if len(by_id) == len(cache["examples"]):
+            return
+
+        merged = sorted(by_id.values(), key=lambda example: example.get("added_at", 0))
+        if len(merged) > self.max_examples:
+            index = EmbeddingIndex.from_embeddings(example.get('embedding') for example in merged)
+            while len(merged) > self.max_examples:
+                position = index.most_redundant()
+                index.remove(position)
+                merged.pop(position)
+                self.metrics.increment("examples", "evictions", label)
+
+        # Nova lista: o índice de embeddings do label é reconstruído no próximo uso
+        cache["examples"] = merged
+
+    def _ensure_flusher(self):
+        """Inicia (uma vez) a thread que grava os labels alterados a cada intervalo."""
+        if self._flusher is not None:
+            return
+        with self._labels_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name='label-cache-flusher', daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
 
-        # Salvar disco
-        cache_path = self.get_cache_path(label)
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            json.dump(cache_data, f, ensure_ascii=False, indent=2)
-    
     def update_schema(self, label, new_fields):
         """
         Atualiza o schema completo do label com novos campos descobertos.
         ESTRATÉGIA: Acumula conhecimento sobre o schema ao longo do tempo.
+        Schema sem mudança não marca o label para gravação.
         """
-        cache = self.load_cache(label)
-        cache["schema_complete"].update(new_fields)
-        self.save_cache(label, cache)
-    
-    def add_example(self, label, pdf_text, extracted_data):
+        with self._loaded_label(label) as cache:
+            schema = cache["schema_complete"]
+            if all(schema.get(field_name) == description for field_name, description in new_fields.items()):
+                return
+            schema.update(new_fields)
+            self._mark_dirty(label)
+        self._schedule_flush()
+
+    def add_example(self, label, pdf_text, extracted_data, ctx=None):
         """
         Adiciona exemplo de extração bem-sucedida COM embedding.
         ESTRATÉGIA: Usa embeddings para semantic search de exemplos relevantes.
+        O embedding já calculado na busca (get_context, mesmo ctx) é reusado.
+        Store cheio: sai o exemplo mais próximo do seu vizinho (não o mais antigo),
+        então uma rajada de documentos quase iguais não expulsa as outras variantes.
         """
-        cache = self.load_cache(label)
-
-        # Gerar embedding do texto (lazy load do modelo)
+        # Gerar embedding do texto (lazy load do modelo) fora do lock
         text_snippet = pdf_text[:500]  # Primeiros 500 chars
-        embedding = self._get_embedding(text_snippet)
-
-        # Limita a 5 exemplos (aumentado porque usaremos semantic search)
-        if len(cache["examples"]) >= 5:
-            cache["examples"].pop(0)
-
-        cache["examples"].append({
-            "text_snippet": text_snippet,
-            "extracted": extracted_data,
-            "embedding": embedding.tolist() if embedding is not None else None
-        })
-
-        self.save_cache(label, cache)
+        embedding = self._get_text_embedding(text_snippet, ctx, label)
+
+        with self._loaded_label(label) as cache:
+            # Índice vetorizado atualizado incrementalmente junto com a lista
+            index = self._get_embedding_index(label, cache)
+
+            cache["examples"].append({
+                "id": uuid.uuid4().hex,
+                "added_at": time.time(),
+                "text_snippet": text_snippet,
+                "extracted": extracted_data,
+                "embedding": np.asarray(embedding, dtype=np.float32) if embedding is not None else None,
+                "embedding_backend": self.embedding_backend.name
+            })
+            index.append(embedding)
+            self.metrics.increment("examples", "added", label)
+
+            # Limita a max_examples (despejo por diversidade)
+            while len(cache["examples"]) > self.max_examples:
+                position = index.most_redundant()
+                index.remove(position)
+                cache["examples"].pop(position)
+                self.metrics.increment("examples", "evictions", label)
+
+            self._mark_dirty(label)
+            self._update_label_bytes(label)
+        self._schedule_flush()
+        self._enforce_label_memory_budget(keep=label)
     
-    def get_context(self, label, extraction_schema, current_pdf_text=None):
+    def get_context(self, label, extraction_schema, current_pdf_text=None, ctx=None):
         """
         Retorna contexto relevante do cache usando semantic search.
-        ESTRATÉGIA: Retorna apenas o exemplo MAIS similar (embedding-based).
+        ESTRATÉGIA: Retorna os k exemplos MAIS similares (embedding-based, default
+        k=1) que cabem no orçamento de tokens do few-shot.
+        Se o deadline (ctx) não comporta o embedding, usa o último exemplo.
         """
         cache = self.load_cache(label)
 
         # Se não há exemplos, retorna vazio
         if not cache["examples"]:
+            self.metrics.increment("retrieval", "misses", label)
             return {"known_fields": cache["schema_complete"], "examples": []}
+        self.metrics.increment("retrieval", "hits", label)
+
+        # Sem tempo para gerar embedding: cai para o último exemplo
+        if ctx is not None and not ctx.has_time_for(self.embedding_budget_seconds):
+            current_pdf_text = None
 
         # Se não forneceu PDF atual, retorna último exemplo
         if current_pdf_text is None:
+            self.metrics.increment("retrieval", "fallbacks", label)
             return {
                 "known_fields": cache["schema_complete"],
                 "examples": cache["examples"][-1:]
             }
 
         # Semantic search: encontrar exemplo mais similar
-        most_similar = self._find_most_similar_example(
-            current_pdf_text[:500],
-            cache["examples"]
-        )
+        # (embedding fora do lock; busca sob o lock do label, lista e índice alinhados)
+        query_embedding = self._get_text_embedding(current_pdf_text[:500], ctx, label)
+        with self._get_label_lock(label), self.metrics.timer("retrieval.search"):
+            similar = self._find_similar_examples(
+                query_embedding,
+                cache["examples"],
+                self._get_embedding_index(label, cache),
+                k=self.few_shot_k
+            )
 
         return {
             "known_fields": cache["schema_complete"],
-            "examples": [most_similar] if most_similar else []
+            "examples": self._fit_token_budget(similar)
         }
 
-    def _get_embedding(self, text):
+    def _fit_token_budget(self, examples):
+        """
+        Mantém os exemplos (em ordem de similaridade) que cabem no orçamento de
+        tokens do few-shot. O primeiro sempre entra (comportamento com k=1).
+        Estimativa: ~4 caracteres por token do JSON extraído (o que vai no prompt).
         """
-        Gera embedding de um texto usando sentence-transformers.
-        Lazy loading do modelo para não impactar startup.
+        selected = []
+        used_tokens = 0
+        for example in examples:
+            tokens = len(json.dumps(example['extracted'], ensure_ascii=False)) // 4 + 1
+            if selected and used_tokens + tokens > self.few_shot_token_budget:
+                break
+            selected.append(example)
+            used_tokens += tokens
+        return selected
+
+    def _get_embedding(self, text, label=None):
+        """
+        Gera embedding de um texto com o backend configurado.
+        Lazy loading do modelo (se houver) para não impactar startup.
 
         Args:
             text: Texto para gerar embedding
+            label: Label do documento (só para as métricas) ou None
 
         Returns:
             np.ndarray ou None: Embedding do texto
         """
-        if self._embedding_model is None:
-            try:
-                from sentence_transformers import SentenceTransformer
-                self._embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-            except Exception as e:
-                print(f"[AVISO] Falha ao carregar modelo de embeddings: {e}")
-                return None
+        key = self._embedding_cache_key(text)
+        with self._embedding_lock:
+            embedding = self._embedding_lru.get(key)
+            if embedding is not None:
+                self._embedding_lru.move_to_end(key)
+        if embedding is not None:
+            self.metrics.increment("embedding", "hits", label)
+            return embedding
+
+        # Embeddings persistidos (ex: pré-aquecidos por prewarm_cache.py)
+        try:
+            embedding = self.results_store.get_embedding(key, self.embedding_backend.name, self._min_cached_at())
+        except Exception:
+            embedding = None
+        if embedding is not None:
+            self.metrics.increment("embedding", "hits", label)
+            self.metrics.increment("embedding", "disk_hits", label)
+            self._put_embedding(key, embedding, label)
+            return embedding
+        self.metrics.increment("embedding", "misses", label)
+
+        if not self.embedding_backend.load():
+            return None
 
         try:
-            return self._embedding_model.encode(text)
+            with self.metrics.timer("embedding.encode"):
+                embedding = self.embedding_backend.encode(text)
         except Exception as e:
             print(f"[AVISO] Falha ao gerar embedding: {e}")
             return None
 
-    def _find_most_similar_example(self, query_text, examples):
+        self._put_embedding(key, embedding, label)
+        return embedding
+
+    def _put_embedding(self, key, embedding, label=None):
+        """Insere no LRU de embeddings, removendo os menos usados se cheio."""
+        evicted = 0
+        with self._embedding_lock:
+            self._embedding_lru[key] = embedding
+            self._embedding_lru.move_to_end(key)
+            while len(self._embedding_lru) > self.embedding_cache_size:
+                self._embedding_lru.popitem(last=False)
+                evicted += 1
+        self.metrics.increment("embedding", "evictions", label, evicted)
+
+    def warm_embeddings(self, snippets, batch_size=64):
         """
-        Encontra o exemplo mais similar usando cosine similarity.
+        Calcula em lotes e persiste os embeddings dos trechos que ainda não têm.
+        ESTRATÉGIA: Pré-aquecimento (prewarm_cache.py): a primeira requisição de
+        cada documento encontra o embedding no disco em vez de passar pelo modelo.
 
         Args:
-            query_text: Texto atual do PDF
-            examples: Lista de exemplos com embeddings
+            snippets: Trechos (os mesmos 500 primeiros chars usados na busca)
+            batch_size: Trechos por lote do backend
 
         Returns:
-            dict: Exemplo mais similar ou último exemplo se falhar
+            int: Número de embeddings calculados
         """
-        query_embedding = self._get_embedding(query_text)
-        if query_embedding is None:
-            return examples[-1] if examples else None
+        by_key = {self._embedding_cache_key(snippet): snippet for snippet in snippets}
+        missing = self.results_store.missing_embeddings(
+            by_key.keys(), self.embedding_backend.name, self._min_cached_at()
+        )
+        if not missing or not self.embedding_backend.load():
+            return 0
+
+        keys = sorted(missing)
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            with self.metrics.timer("embedding.encode_batch"):
+                vectors = self.embedding_backend.encode_batch([by_key[key] for key in batch])
+            self.results_store.put_embeddings(zip(batch, vectors), self.embedding_backend.name)
+        return len(keys)
+
+    @property
+    def embedding_model_loaded(self):
+        """True se o backend de embeddings já está pronto (modelo em memória)."""
+        return self.embedding_backend.loaded
+
+    def warmup_embedding_model(self):
+        """
+        Carrega o backend de embeddings e roda um encode de aquecimento.
+        ESTRATÉGIA: O import + load (segundos) sai da primeira requisição.
+
+        Returns:
+            bool: True se o backend está pronto
+        """
+        start = time.time()
+        if not self.embedding_backend.load():
+            return False
+
+        try:
+            self.embedding_backend.encode("warmup")
+        except Exception as e:
+            print(f"[AVISO] Falha no encode de aquecimento: {e}")
+            return False
 
-        max_similarity = -1
-        most_similar = None
+        print(f"[WARMUP] Embeddings ({self.embedding_backend.name}) prontos em {time.time() - start:.3f}s")
+        return True
 
-        for example in examples:
-            if example.get('embedding') is None:
+    def preload_label_caches(self):
+        """
+        Carrega em memória os caches de todos os labels (e seus índices de embeddings).
+
+        Returns:
+            int: Número de labels carregados
+        """
+        loaded = 0
+        labels = {cache_path.stem for cache_path in self.cache_dir.glob("*.json")}
+        # Nó novo: labels que só existem no cache compartilhado também entram
+        if self.shared is not None:
+            shared_keys = self._shared_call(lambda: list(self.shared.scan("label:"))) or []
+            # label:<label>:example:<id> / label:<label>:schema:<hash>
+            labels.update(key[len("label:"):].rsplit(":", 2)[0] for key in shared_keys)
+
+        # Fixados primeiro: os demais só entram enquanto couberem no orçamento
+        for label in sorted(labels, key=lambda label: (label not in self._pinned_labels, label)):
+            if self.label_memory_budget > 0 and self.label_memory_bytes() >= self.label_memory_budget:
+                print("[WARMUP] Orçamento de memória dos labels atingido, demais labels sob demanda")
+                break
+            try:
+                cache = self.load_cache(label)
+                self._get_embedding_index(label, cache)
+                loaded += 1
+            except Exception as e:
+                print(f"[AVISO] Falha ao pré-carregar cache do label {label}: {e}")
+        print(f"[WARMUP] {loaded} cache(s) de label pré-carregado(s)")
+        return loaded
+
+    def _embedding_cache_key(self, text):
+        """Chave do LRU de embeddings: hash do conteúdo do trecho."""
+        hasher = _new_content_hasher()
+        hasher.update(text.encode('utf-8'))
+        return hasher.hexdigest()
+
+    def _get_text_embedding(self, text_snippet, ctx=None, label=None):
+        """
+        Embedding do trecho do documento da requisição, calculado UMA vez por ctx.
+
+        Args:
+            text_snippet: Trecho inicial do texto do PDF
+            ctx: RequestContext ou None
+            label: Label do documento (só para as métricas) ou None
+
+        Returns:
+            np.ndarray ou None: Embedding do trecho
+        """
+        if ctx is not None and ctx.text_embedding is not None:
+            return ctx.text_embedding
+
+        embedding = self._get_embedding(text_snippet, label)
+        if ctx is not None:
+            ctx.text_embedding = embedding
+        return embedding
+
+    def _get_embedding_index(self, label, cache):
+        """
+        Retorna o índice de embeddings do label, (re)construindo se estiver
+        desalinhado com a lista de exemplos (ex: cache recarregado do disco).
+
+        Args:
+            label: Label do documento
+            cache: Cache do label (dict com "examples")
+
+        Returns:
+            EmbeddingIndex
+        """
+        with self._get_label_lock(label):
+            examples = cache["examples"]
+            index = self._embedding_indexes.get(label)
+            if index is None or index.examples is not examples or len(index) != len(examples):
+                self._reembed_stale_examples(label, cache)
+                index = EmbeddingIndex.from_embeddings(example.get('embedding') for example in examples)
+                index.examples = examples
+                # Cache que já saiu da memória (orçamento): índice só para esta chamada
+                if self._memory_cache.get(label) is cache:
+                    self._embedding_indexes[label] = index
+                    self._update_label_bytes(label)
+            return index
+
+    def _reembed_stale_examples(self, label, cache):
+        """
+        Recalcula embeddings de exemplos gerados por outro backend (vetores de
+        backends diferentes não são comparáveis) e marca o label para gravação.
+        Chamado sob o lock do label.
+
+        Args:
+            label: Label do documento
+            cache: Cache do label (dict com "examples")
+        """
+        backend_name = self.embedding_backend.name
+        updated = 0
+        for example in cache["examples"]:
+            if example.get('embedding_backend', LEGACY_BACKEND_NAME) == backend_name:
                 continue
+            embedding = self._get_embedding(example.get('text_snippet', ''), label)
+            if embedding is None:
+                continue
+            example['embedding'] = np.asarray(embedding, dtype=np.float32)
+            example['embedding_backend'] = backend_name
+            updated += 1
 
-            example_embedding = np.array(example['embedding'])
+        if updated:
+            print(f"[CACHE] {updated} exemplo(s) de '{label}' re-embeddados com {backend_name}")
+            self._mark_dirty(label)
 
-            # Calcular cosine similarity
-            similarity = np.dot(query_embedding, example_embedding) / (
-                np.linalg.norm(query_embedding) * np.linalg.norm(example_embedding)
-            )
+    def _find_similar_examples(self, query_embedding, examples, index, k=1):
+        """
+        Encontra os k exemplos mais similares usando cosine similarity.
+        OTIMIZAÇÃO: Um produto matriz-vetor sobre embeddings pré-normalizados + argpartition.
 
-            if similarity > max_similarity:
-                max_similarity = similarity
-                most_similar = example
+        Args:
+            query_embedding: Embedding do texto atual do PDF (ou None)
+            examples: Lista de exemplos do label
+            index: EmbeddingIndex alinhado com examples
+            k: Número de exemplos
 
-        return most_similar if most_similar else (examples[-1] if examples else None)
+        Returns:
+            list: Exemplos em ordem decrescente de similaridade (último exemplo se falhar)
+        """
+        if query_embedding is None:
+            return examples[-1:]
+
+        top = index.search(query_embedding, k=k)
+        if not top:
+            return examples[-1:]
+
+        return [examples[position] for position, _ in top]
 
     # ===== CACHE DE RESULTADOS (NOVO) =====
 
     def get_pdf_hash(self, pdf_path):
         """
-        Calcula hash MD5 do arquivo PDF.
+        Calcula hash do conteúdo do arquivo PDF.
+        OTIMIZAÇÃO: Leitura em blocos (sem carregar o arquivo inteiro) com hash rápido.
 
         Args:
             pdf_path: Caminho para o PDF
 
         Returns:
-            str: Hash MD5 hexadecimal
+            str: Hash hexadecimal (128 bits)
         """
         try:
+            hasher = _new_content_hasher()
             with open(pdf_path, 'rb') as f:
-                pdf_content = f.read()
-                return hashlib.md5(pdf_content).hexdigest()
+                for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+            return hasher.hexdigest()
         except Exception as e:
             raise Exception(f"Erro ao calcular hash do PDF: {str(e)}")
 
+    def get_bytes_hash(self, pdf_bytes):
+        """
+        Calcula hash do conteúdo já em memória (ex: PDF decodificado do Base64).
+
+        Args:
+            pdf_bytes: Conteúdo do PDF
+
+        Returns:
+            str: Hash hexadecimal (mesmo valor de get_pdf_hash para o mesmo conteúdo)
+        """
+        return hash_bytes(pdf_bytes)
+
+    def get_legacy_pdf_hash(self, pdf_path):
+        """
+        Calcula o hash MD5 antigo do PDF (chaves gravadas antes da troca de hash).
+
+        Args:
+            pdf_path: Caminho para o PDF
+
+        Returns:
+            str: Hash MD5 hexadecimal
+        """
+        hasher = hashlib.md5()
+        with open(pdf_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def resolve_pdf_hash(self, pdf_path, ctx=None):
+        """
+        Retorna o hash do conteúdo da requisição, calculando UMA única vez.
+        ESTRATÉGIA: O hash viaja no RequestContext; as etapas seguintes reusam.
+
+        Args:
+            pdf_path: Caminho do PDF
+            ctx: RequestContext ou None
+
+        Returns:
+            str: Hash do conteúdo
+        """
+        if ctx is not None and ctx.content_hash is not None:
+            return ctx.content_hash
+        pdf_hash = self.get_pdf_hash(pdf_path)
+        if ctx is not None:
+            ctx.content_hash = pdf_hash
+        return pdf_hash
+
+    def _resolve_legacy_pdf_hash(self, pdf_path, ctx=None):
+        """Hash MD5 antigo da requisição (calculado só em miss, uma vez)."""
+        if ctx is not None and ctx.legacy_content_hash is not None:
+            return ctx.legacy_content_hash
+        legacy_hash = self.get_legacy_pdf_hash(pdf_path)
+        if ctx is not None:
+            ctx.legacy_content_hash = legacy_hash
+        return legacy_hash
+
+    def get_cached_text(self, pdf_path, ctx=None):
+        """
+        Texto já extraído (e limpo) deste PDF, pelo hash do conteúdo.
+
+        Args:
+            pdf_path: Caminho do PDF
+            ctx: RequestContext (hash do conteúdo) ou None
+
+        Returns:
+            str ou None: Texto ou None se não está no cache
+        """
+        try:
+            pdf_hash = self.resolve_pdf_hash(pdf_path, ctx)
+            text = self.results_store.get_text(pdf_hash, self._min_cached_at())
+            if text is None:
+                # Tier compartilhado: texto extraído por outro nó
+                cached_data = self._get_shared(f"text:{pdf_hash}", self._min_cached_at())
+                if cached_data is not None and isinstance(cached_data.get("text"), str):
+                    text = cached_data["text"]
+                    self.results_store.put_texts([(pdf_hash, text)], cached_at=cached_data["cached_at"])
+        except Exception:
+            return None
+        self.metrics.increment("text", "hits" if text is not None else "misses")
+        return text
+
+    def save_text(self, pdf_path, text, ctx=None):
+        """
+        Salva o texto extraído (e limpo) do PDF no cache de textos.
+
+        Args:
+            pdf_path: Caminho do PDF
+            text: Texto limpo
+            ctx: RequestContext (hash do conteúdo) ou None
+        """
+        try:
+            self.save_texts([(self.resolve_pdf_hash(pdf_path, ctx), text)])
+        except Exception as e:
+            print(f"[AVISO] Falha ao salvar cache de texto: {e}")
+
+    def save_texts(self, items):
+        """
+        Salva textos de PDFs em uma transação, truncados em _STORED_TEXT_CHARS.
+        OTIMIZAÇÃO: O extractor só usa os primeiros 2000 chars; guardar o texto
+        inteiro de PDFs grandes só aumentaria o banco e o I/O de cada miss.
+
+        Args:
+            items: Lista de (pdf_hash, texto)
+        """
+        items = [(pdf_hash, text[:_STORED_TEXT_CHARS]) for pdf_hash, text in items]
+        self.results_store.put_texts(items)
+        if self.shared is not None:
+            cached_at = datetime.now()
+            for pdf_hash, text in items:
+                self._share(f"text:{pdf_hash}", cached_at, {"text": text}, self.ttl)
+
     def get_schema_hash(self, extraction_schema):
         """
         Calcula hash do schema de extração.
@@ -222,7 +1058,25 @@ class CacheManager:
         schema_str = json.dumps(extraction_schema, sort_keys=True)
         return hashlib.md5(schema_str.encode()).hexdigest()[:8]
 
-    def get_result_cache_key(self, pdf_path, label, extraction_schema):
+    def get_text_hash(self, pdf_text, ctx=None):
+        """
+        Hash do texto limpo (e truncado) que vai ao LLM, calculado uma vez por requisição.
+
+        Args:
+            pdf_text: Texto limpo e truncado
+            ctx: RequestContext ou None
+
+        Returns:
+            str: Hash hexadecimal do texto
+        """
+        if ctx is not None and ctx.text_hash is not None:
+            return ctx.text_hash
+        text_hash = hash_bytes(pdf_text.encode('utf-8'))
+        if ctx is not None:
+            ctx.text_hash = text_hash
+        return text_hash
+
+    def get_result_cache_key(self, pdf_path, label, extraction_schema, ctx=None):
         """
         Gera chave única para cache de resultado.
 
@@ -230,103 +1084,746 @@ class CacheManager:
             pdf_path: Caminho do PDF
             label: Label do documento
             extraction_schema: Schema de extração
+            ctx: RequestContext (reusa o hash já calculado) ou None
 
         Returns:
             str: Chave de cache
         """
-        pdf_hash = self.get_pdf_hash(pdf_path)
+        pdf_hash = self.resolve_pdf_hash(pdf_path, ctx)
         schema_hash = self.get_schema_hash(extraction_schema)
         return f"{pdf_hash}_{label}_{schema_hash}"
 
-    def get_cached_result(self, pdf_path, label, extraction_schema):
+    def get_cached_result(self, pdf_path, label, extraction_schema, ctx=None):
         """
         Busca resultado cacheado de uma extração.
+        ESTRATÉGIA: Tier em memória (LRU) → tier em disco (promove para memória).
 
         Args:
             pdf_path: Caminho do PDF
             label: Label do documento
             extraction_schema: Schema de extração
+            ctx: RequestContext (hash do conteúdo) ou None
 
         Returns:
             dict ou None: Resultado cacheado ou None se não existe/expirou
         """
         try:
-            cache_key = self.get_result_cache_key(pdf_path, label, extraction_schema)
-            cache_path = self.results_cache_dir / f"{cache_key}.json"
-
-            if not cache_path.exists():
-                return None
+            with self.metrics.timer("result_cache.lookup"):
+                return self._lookup_result(pdf_path, label, extraction_schema, ctx)
+        except Exception:
+            # Se houver qualquer erro, retorna None (sem cache)
+            return None
 
-            # Ler cache
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                cached_data = json.load(f)
+    def _lookup_result(self, pdf_path, label, extraction_schema, ctx=None):
+        """Busca nos dois tiers contabilizando hits/misses de cada um."""
+        cache_key = self.get_result_cache_key(pdf_path, label, extraction_schema, ctx)
+
+        # 1. Tier em memória
+        cached_data = self._get_memory_result(cache_key, label)
+        if cached_data is not None:
+            self.metrics.increment("result_memory", "hits", label)
+            self._record_access(cache_key)
+            # Cópia: quem chama adiciona flags (from_cache etc) ao resultado
+            return copy.deepcopy(cached_data['result'])
+        self.metrics.increment("result_memory", "misses", label)
+
+        # 2. Tier em disco (consulta indexada, já filtrando expirados)
+        cached_data = self.results_store.get_result(cache_key, self._min_cached_at())
+        if cached_data is None and self.legacy_hash_lookup:
+            cached_data = self._migrate_legacy_result(pdf_path, label, extraction_schema, ctx)
+        if cached_data is None:
+            self.metrics.increment("result_disk", "misses", label)
+            return self._lookup_shared_result(pdf_path, label, extraction_schema, f"result:{cache_key}", ctx)
+
+        # Cache válido - promover para memória e retornar resultado
+        self.metrics.increment("result_disk", "hits", label)
+        self._record_access(cache_key)
+        cached_time = datetime.fromtimestamp(cached_data['cached_at'])
+        self._put_memory_result(cache_key, cached_time, cached_data['result'], label)
+        return cached_data['result']
+
+    def get_cached_result_by_text(self, pdf_path, pdf_text, label, extraction_schema, ctx=None):
+        """
+        Busca resultado de um PDF com o MESMO texto limpo (bytes diferentes).
+        ESTRATÉGIA: Chave = hash do texto enviado ao LLM + label + schema. Consultada
+        após a leitura do texto (barata) e antes de embeddings/LLM. Em hit, o
+        resultado é regravado com a chave de bytes deste PDF (mantendo cached_at):
+        a próxima requisição com os mesmos bytes acerta já no tier em memória.
 
-            # Verificar TTL
-            cached_time = datetime.fromisoformat(cached_data['cached_at'])
-            if datetime.now() - cached_time > self.ttl:
-                # Cache expirado, deletar
-                cache_path.unlink()
-                return None
+        Args:
+            pdf_path: Caminho do PDF
+            pdf_text: Texto limpo e truncado (o mesmo que vai ao LLM)
+            label: Label do documento
+            extraction_schema: Schema de extração
+            ctx: RequestContext (hash do conteúdo e do texto) ou None
 
-            # Cache válido - retornar resultado
+        Returns:
+            dict ou None: Resultado cacheado ou None
+        """
+        if not self.text_key_lookup or not pdf_text:
+            return None
+        try:
+            text_hash = self.get_text_hash(pdf_text, ctx)
+            schema_hash = self.get_schema_hash(extraction_schema)
+            with self.metrics.timer("result_cache.text_lookup"):
+                cached_data = self.results_store.find_by_text_hash(
+                    text_hash, label, schema_hash, self._min_cached_at()
+                )
+            if cached_data is None:
+                self.metrics.increment("result_text", "misses", label)
+                return self._lookup_shared_result(
+                    pdf_path, label, extraction_schema, f"result_text:{text_hash}_{label}_{schema_hash}",
+                    ctx, text_hash=text_hash
+                )
+
+            self.metrics.increment("result_text", "hits", label)
+            self._record_access(cached_data['cache_key'])
+            self._store_result(
+                pdf_path, label, extraction_schema, cached_data['result'], ctx=ctx,
+                cached_at=datetime.fromtimestamp(cached_data['cached_at']),
+                text_hash=text_hash, share=False
+            )
             return cached_data['result']
-
         except Exception:
-            # Se houver qualquer erro, retorna None (sem cache)
             return None
 
-    def save_result(self, pdf_path, label, extraction_schema, result):
+    # ===== CACHE COMPARTILHADO (ENTRE NÓS) =====
+
+    def _shared_call(self, operation, label=None):
+        """
+        Executa operation() no backend compartilhado. Erro = aviso e backend
+        ignorado por shared_retry_seconds (requisições não esperam um servidor fora do ar).
+
+        Returns:
+            Retorno de operation() ou None (sem backend, fora do ar ou erro)
+        """
+        if self.shared is None or time.monotonic() < self._shared_down_until:
+            return None
+        try:
+            return operation()
+        except Exception as e:
+            self._shared_down_until = time.monotonic() + self.shared_retry_seconds
+            self.metrics.increment("shared", "errors", label)
+            print(f"[AVISO] Cache compartilhado ({self.shared.name}) indisponível por "
+                  f"{self.shared_retry_seconds}s: {e}")
+            return None
+
+    def _share(self, shared_key, cached_at, payload, ttl, label=None):
+        """
+        Publica uma entrada JSON ({"cached_at", **payload}) no backend compartilhado
+        com o TTL que ainda resta (ttl: timedelta do tier).
+        """
+        remaining = (cached_at + ttl - datetime.now()).total_seconds()
+        if remaining <= 0:
+            return
+        data = json.dumps({"cached_at": cached_at.timestamp(), **payload}, ensure_ascii=False)
+        self._shared_call(lambda: self.shared.set(shared_key, data.encode('utf-8'), remaining), label)
+
+    def _get_shared(self, shared_key, min_cached_at, label=None):
+        """
+        Entrada JSON do backend compartilhado ainda dentro do TTL deste nó (o TTL
+        de outro nó pode ser maior).
+
+        Returns:
+            dict ou None: {"cached_at", ...} ou None (ausente, expirada, ilegível ou fora do ar)
+        """
+        if self.shared is None:
+            return None
+        with self.metrics.timer("shared.get"):
+            payload = self._shared_call(lambda: self.shared.get(shared_key), label)
+        try:
+            cached_data = json.loads(payload) if payload is not None else None
+        except ValueError:
+            cached_data = None
+        if not isinstance(cached_data, dict) or cached_data.get("cached_at", 0) < min_cached_at:
+            self.metrics.increment("shared", "misses", label)
+            return None
+        self.metrics.increment("shared", "hits", label)
+        return cached_data
+
+    def _share_result(self, shared_key, cached_at, result, label):
+        """Publica um resultado no backend compartilhado com o TTL que ainda resta."""
+        self._share(shared_key, cached_at, {"result": result}, self.ttl, label)
+
+    def _lookup_shared_result(self, pdf_path, label, extraction_schema, shared_key, ctx=None, text_hash=None):
+        """
+        Tier compartilhado (depois dos locais): em hit, o resultado é gravado nos
+        tiers locais deste nó (sem republicar).
+
+        Returns:
+            dict ou None: Resultado ou None
+        """
+        cached_data = self._get_shared(shared_key, self._min_cached_at(), label)
+        if cached_data is None or "result" not in cached_data:
+            return None
+        self._store_result(
+            pdf_path, label, extraction_schema, cached_data['result'], ctx=ctx,
+            cached_at=datetime.fromtimestamp(cached_data['cached_at']), text_hash=text_hash, share=False
+        )
+        return cached_data['result']
+
+    # Cache de label no backend: uma chave por exemplo e uma por campo do schema.
+    # O flush publica só as chaves novas ou alteradas (e remove as dos exemplos
+    # despejados); nenhum nó regrava o label inteiro.
+
+    def _shared_example_key(self, label, example_id):
+        return f"label:{label}:example:{example_id}"
+
+    def _shared_schema_key(self, label, field_name):
+        return f"label:{label}:schema:{hash_bytes(field_name.encode('utf-8'))}"
+
+    def _shared_label_entries(self, label, cache):
+        """
+        Chaves do label no backend -> versão (exemplo: id + backend do embedding;
+        campo: descrição). Versão diferente da publicada = chave a regravar.
+        """
+        entries = {
+            self._shared_example_key(label, example["id"]): (example["id"], example.get("embedding_backend"))
+            for example in cache["examples"]
+        }
+        entries.update(
+            (self._shared_schema_key(label, field_name), description)
+            for field_name, description in cache["schema_complete"].items()
+        )
+        return entries
+
+    def _read_shared_label(self, label, known=None):
+        """
+        Lê do backend as chaves do label (fora de qualquer lock: é I/O de rede).
+        Chaves já conhecidas (known) não são lidas de novo.
+
+        Returns:
+            tuple: (cache do label ou None, {chave: versão} das chaves lidas)
+        """
+        if self.shared is None:
+            return None, {}
+        prefix = f"label:{label}:"
+        keys = self._shared_call(lambda: list(self.shared.scan(prefix)), label)
+        if keys is None:
+            return None, {}
+
+        cache = {"schema_complete": {}, "examples": [], "patterns": {}}
+        versions = {}
+        with self.metrics.timer("shared.get"):
+            for key in keys:
+                if known is not None and key in known:
+                    continue
+                blob = self._shared_call(lambda: self.shared.get(key), label)
+                if blob is None:
+                    continue  # expirou/removida entre o scan e o get (ou backend fora do ar)
+                try:
+                    if key.startswith(prefix + "example:"):
+                        example = unpack_label_cache(blob)["examples"][0]
+                        cache["examples"].append(example)
+                        versions[key] = (example["id"], example.get("embedding_backend"))
+                    else:
+                        field = json.loads(blob)
+                        cache["schema_complete"][field["field"]] = field["description"]
+                        versions[key] = field["description"]
+                except (ValueError, KeyError, IndexError, TypeError) as e:
+                    print(f"[AVISO] Entrada {key} do cache compartilhado ilegível, ignorando: {e}")
+        self.metrics.increment("shared", "hits" if versions else "misses", label)
+        return (cache if versions else None), versions
+
+    def _shared_label_changes(self, label, cache):
+        """
+        Chaves a publicar e a remover desde o último flush. Chamar sob o lock do
+        label (serializa os exemplos novos num snapshot consistente).
+
+        Returns:
+            tuple: ({chave: (versão, bytes)}, [chaves a remover])
+        """
+        published = self._shared_published.setdefault(label, {})
+        entries = self._shared_label_entries(label, cache)
+        examples = {example["id"]: example for example in cache["examples"]}
+        fields = {self._shared_schema_key(label, field_name): field_name for field_name in cache["schema_complete"]}
+
+        changed = {}
+        for key, version in entries.items():
+            if published.get(key) == version:
+                continue
+            if key in fields:
+                field_name = fields[key]
+                data = json.dumps({"field": field_name, "description": cache["schema_complete"][field_name]},
+                                  ensure_ascii=False).encode('utf-8')
+            else:
+                example_cache = {"schema_complete": {}, "examples": [examples[version[0]]], "patterns": {}}
+                content, _, matrix = serialize_label_cache(label, example_cache, self.embedding_dtype)
+                data = pack_label_cache(content, matrix)
+            changed[key] = (version, data)
+        removed = [key for key in published if key not in entries]
+        return changed, removed
+
+    def _publish_label_changes(self, label, changed, removed):
+        """Grava/remove no backend (fora dos locks) e registra o que foi publicado."""
+        done = {}
+        for key, (version, data) in changed.items():
+            if self._shared_call(lambda: self.shared.set(key, data) or True, label) is None:
+                break  # backend fora do ar: o resto fica para um próximo flush
+            done[key] = version
+        deleted = [key for key in removed if self._shared_call(lambda: self.shared.delete(key) or True, label)]
+        with self._get_label_lock(label):
+            published = self._shared_published.get(label)
+            if published is not None:
+                published.update(done)
+                for key in deleted:
+                    published.pop(key, None)
+
+    def _migrate_legacy_result(self, pdf_path, label, extraction_schema, ctx=None):
+        """
+        Busca resultado gravado com a chave MD5 antiga; se existir, regrava com
+        a chave nova (mantendo cached_at) para os próximos acessos.
+
+        Returns:
+            dict ou None: {"cached_at", "result"} ou None
+        """
+        legacy_hash = self._resolve_legacy_pdf_hash(pdf_path, ctx)
+        schema_hash = self.get_schema_hash(extraction_schema)
+        cached_data = self.results_store.get_result(f"{legacy_hash}_{label}_{schema_hash}", self._min_cached_at())
+        if cached_data is None:
+            return None
+
+        pdf_hash = self.resolve_pdf_hash(pdf_path, ctx)
+        self.results_store.put_result(
+            f"{pdf_hash}_{label}_{schema_hash}", pdf_hash, label, schema_hash,
+            extraction_schema.keys(), cached_data['result'],
+            pdf_path=str(pdf_path), cached_at=cached_data['cached_at']
+        )
+        return cached_data
+
+    def _min_cached_at(self):
+        """Timestamp (epoch) mínimo para uma entrada ainda estar dentro do TTL."""
+        return (datetime.now() - self.ttl).timestamp()
+
+    def purge_expired_results(self):
+        """
+        Remove resultados, campos, textos e embeddings expirados do disco, em lotes (DELETE indexado
+        por lote; entre lotes outras conexões conseguem escrever). Falhas expiram pelo TTL próprio.
+
+        Returns:
+            int: Número de entradas removidas
+        """
+        removed = 0
+        try:
+            removed += self.results_store.delete_expired_failures((datetime.now() - self.negative_ttl).timestamp())
+            min_cached_at = self._min_cached_at()
+            while True:
+                batch = self.results_store.delete_expired(min_cached_at, self.sweep_batch_size)
+                for label, count in batch["results"].items():
+                    self.metrics.increment("result_disk", "expirations", label, count)
+                batch_removed = sum(batch["results"].values()) + batch["other"]
+                removed += batch_removed
+                if batch_removed == 0:
+                    return removed
+                time.sleep(0)  # cede o GIL às requisições entre lotes
+        except Exception as e:
+            print(f"[AVISO] Falha ao expirar cache de resultados: {e}")
+            return removed
+
+    def enforce_results_limit(self):
+        """
+        Aplica o limite do cache de resultados (RESULT_CACHE_MAX_ENTRIES /
+        RESULT_CACHE_MAX_MB): remove, em lotes, os resultados acessados há mais tempo.
+
+        Returns:
+            int: Número de resultados removidos
+        """
+        if self.max_results <= 0 and self.max_results_bytes <= 0:
+            return 0
+        removed = 0
+        try:
+            while True:
+                evicted = self.results_store.evict_least_recently_used(
+                    self.max_results, self.max_results_bytes, self.sweep_batch_size
+                )
+                if not evicted:
+                    return removed
+                for label, count in evicted.items():
+                    self.metrics.increment("result_disk", "evictions", label, count)
+                removed += sum(evicted.values())
+                time.sleep(0)
+        except Exception as e:
+            print(f"[AVISO] Falha ao aplicar limite do cache de resultados: {e}")
+            return removed
+
+    def sweep_results(self):
+        """
+        Uma passada de manutenção do cache de resultados: grava os últimos
+        acessos (ordem do LRU), remove expirados e aplica o limite de tamanho.
+
+        Returns:
+            dict: {"expired": n, "evicted": n}
+        """
+        with self._results_lock:
+            accessed = self._accessed_results
+            self._accessed_results = set()
+        if accessed:
+            try:
+                self.results_store.touch(accessed)
+            except Exception as e:
+                print(f"[AVISO] Falha ao gravar acessos do cache de resultados: {e}")
+
+        with self.metrics.timer("result_cache.sweep"):
+            report = {"expired": self.purge_expired_results(), "evicted": self.enforce_results_limit()}
+            if self.shared is not None:
+                report["expired"] += self._shared_call(self.shared.purge_expired) or 0
+        if report["expired"] or report["evicted"]:
+            print(f"[CACHE] Limpeza: {report['expired']} expirado(s), {report['evicted']} removido(s) pelo limite")
+        return report
+
+    def _sweep_loop(self):
+        while True:
+            self.sweep_results()
+            time.sleep(self.sweep_interval)
+
+    def _record_access(self, cache_key):
+        """Registra o acesso em memória; o sweeper grava em lote (sem escrita no caminho de leitura)."""
+        with self._results_lock:
+            self._accessed_results.add(cache_key)
+
+    def _get_memory_result(self, cache_key, label=None):
+        """Busca no LRU em memória (respeitando TTL). Retorna entrada ou None."""
+        with self._results_lock:
+            entry = self._results_lru.get(cache_key)
+            if entry is None:
+                return None
+            if datetime.now() - entry['cached_at'] > self.ttl:
+                del self._results_lru[cache_key]
+                expired = True
+            else:
+                self._results_lru.move_to_end(cache_key)
+                expired = False
+        if expired:
+            self.metrics.increment("result_memory", "expirations", label)
+            return None
+        return entry
+
+    def _put_memory_result(self, cache_key, cached_at, result, label=None):
+        """Insere no LRU em memória, removendo a entrada menos usada se cheio."""
+        if self.results_memory_size <= 0:
+            return
+        evicted = []
+        with self._results_lock:
+            self._results_lru[cache_key] = {"cached_at": cached_at, "result": copy.deepcopy(result), "label": label}
+            self._results_lru.move_to_end(cache_key)
+            while len(self._results_lru) > self.results_memory_size:
+                evicted.append(self._results_lru.popitem(last=False)[1]["label"])
+        for evicted_label in evicted:
+            self.metrics.increment("result_memory", "evictions", evicted_label)
+
+    def get_result_cache_stats(self):
+        """
+        Retorna hits/misses por tier do cache de resultados.
+
+        Returns:
+            dict: {"memory": {...}, "disk": {...}} com contadores e entradas em memória
+        """
+        stats = {
+            tier: {"hits": 0, "misses": 0, **self.metrics.counters(f"result_{tier}")}
+            for tier in ("memory", "disk")
+        }
+        with self._results_lock:
+            stats["memory"]["entries"] = len(self._results_lru)
+        stats["memory"]["max_entries"] = self.results_memory_size
+        return stats
+
+    def get_metrics(self):
         """
-        Salva resultado de extração no cache.
+        Métricas de todos os caches: contadores por label (hits, misses,
+        expirações, despejos), histogramas de latência e ocupação (entradas e
+        bytes em disco por label).
+        Ocupação do SQLite: agregação por label (varre a tabela; para o endpoint
+        de métricas, não para o caminho quente).
+
+        Returns:
+            dict: {"caches": {...}, "latency": {...}, "sizes": {...}}
+        """
+        metrics = self.metrics.snapshot()
+
+        npy_bytes = {}
+        for npy_path in self.cache_dir.glob("*.npy"):
+            label = npy_path.name[:-len(".npy")].rpartition(".")[0]
+            npy_bytes[label] = npy_bytes.get(label, 0) + npy_path.stat().st_size
+
+        label_caches = {}
+        for cache_path in sorted(self.cache_dir.glob("*.json")):
+            label = cache_path.stem
+            loaded = self._memory_cache.get(label)
+            label_caches[label] = {
+                "bytes": cache_path.stat().st_size + npy_bytes.get(label, 0),
+                "entries": len(loaded["examples"]) if loaded is not None else None,
+                "memory_bytes": self._label_bytes.get(label, 0)
+            }
+
+        with self._results_lock:
+            memory_entries = len(self._results_lru)
+        with self._embedding_lock:
+            embedding_entries = len(self._embedding_lru)
+
+        metrics["sizes"] = {
+            "label_cache": {
+                "max_examples": self.max_examples,
+                "memory_bytes": self.label_memory_bytes(),
+                "memory_budget_bytes": self.label_memory_budget,
+                "pinned": sorted(self._pinned_labels),
+                "by_label": label_caches
+            },
+            "result_memory": {"entries": memory_entries, "max_entries": self.results_memory_size},
+            "result_disk": {
+                "bytes": self.results_store.file_bytes(),
+                "max_entries": self.max_results,
+                "max_bytes": self.max_results_bytes,
+                "by_label": self.results_store.stats_by_label()
+            },
+            "embedding": {"entries": embedding_entries, "max_entries": self.embedding_cache_size},
+            "shared": {
+                "backend": self.shared.name if self.shared is not None else None,
+                "available": self.shared is not None and time.monotonic() >= self._shared_down_until
+            }
+        }
+        return metrics
+
+    def save_result(self, pdf_path, label, extraction_schema, result, ctx=None):
+        """
+        Salva resultado de extração no cache (memória + disco).
 
         Args:
             pdf_path: Caminho do PDF
             label: Label do documento
             extraction_schema: Schema de extração
             result: Resultado da extração (dict completo)
+            ctx: RequestContext (hash do conteúdo) ou None
         """
         try:
-            cache_key = self.get_result_cache_key(pdf_path, label, extraction_schema)
-            cache_path = self.results_cache_dir / f"{cache_key}.json"
-
-            # Preparar dados do cache
-            cache_data = {
-                "cached_at": datetime.now().isoformat(),
-                "pdf_path": str(pdf_path),
-                "label": label,
-                "schema_fields": list(extraction_schema.keys()),
-                "result": result
-            }
-
-            # Salvar
-            with open(cache_path, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, ensure_ascii=False, indent=2)
-
+            self._store_result(pdf_path, label, extraction_schema, result, ctx=ctx)
         except Exception as e:
             # Falha ao salvar cache não deve quebrar o sistema
             print(f"[AVISO] Falha ao salvar cache de resultado: {e}")
 
-    def generate_document_fingerprint(self, pdf_text, label):
+    def _store_result(self, pdf_path, label, extraction_schema, result, pdf_text=None, ctx=None, cached_at=None,
+                      text_hash=None, share=True):
+        """Grava o resultado no LRU em memória e no SQLite (e publica no cache compartilhado)."""
+        pdf_hash = self.resolve_pdf_hash(pdf_path, ctx)
+        schema_hash = self.get_schema_hash(extraction_schema)
+        cache_key = f"{pdf_hash}_{label}_{schema_hash}"
+        cached_at = cached_at or datetime.now()
+
+        signature = self.get_minhash(pdf_text, ctx) if pdf_text else None
+
+        self._put_memory_result(cache_key, cached_at, result, label)
+        self.results_store.put_result(
+            cache_key, pdf_hash, label, schema_hash, extraction_schema.keys(), result,
+            pdf_path=str(pdf_path),
+            pdf_text=pdf_text,
+            cached_at=cached_at.timestamp(),
+            minhash=signature_to_bytes(signature) if signature is not None else None,
+            text_hash=text_hash
+        )
+
+        if share and self.shared is not None:
+            self._share_result(f"result:{cache_key}", cached_at, result, label)
+            if text_hash is not None:
+                self._share_result(f"result_text:{text_hash}_{label}_{schema_hash}", cached_at, result, label)
+
+        # Índices LSH já carregados (um por limiar): entra incrementalmente
+        if signature is not None:
+            with self._template_lock:
+                for (index_label, index_schema, _), index in self._template_indexes.items():
+                    if index_label == label and index_schema == schema_hash:
+                        index.insert(cache_key, signature)
+
+    # ===== CACHE NEGATIVO (FALHAS) =====
+
+    def _failure_keys(self, pdf_path, label, extraction_schema, ctx=None):
+        """Chaves de falha: do conteúdo (qualquer schema) e do conteúdo + label + schema."""
+        keys = [self.resolve_pdf_hash(pdf_path, ctx)]
+        if extraction_schema is not None:
+            keys.append(self.get_result_cache_key(pdf_path, label, extraction_schema, ctx))
+        return keys
+
+    def get_cached_failure(self, pdf_path, label, extraction_schema, ctx=None):
         """
-        Gera fingerprint do documento baseado na estrutura.
-        FASE 3: Detectar documentos similares (mesmo template).
+        Busca falha recente deste PDF (ou deste PDF com este label + schema).
+        ESTRATÉGIA: Consultada antes do parse; em hit a requisição falha com o
+        erro gravado, sem ler o PDF nem chamar o LLM.
 
         Args:
-            pdf_text: Texto extraído do PDF
+            pdf_path: Caminho do PDF
+            label: Label do documento
+            extraction_schema: Schema de extração
+            ctx: RequestContext (hash do conteúdo) ou None
+
+        Returns:
+            dict ou None: {"failure_class", "error", "cached_at", ...} ou None
+        """
+        if self.negative_ttl.total_seconds() <= 0:
+            return None
+        try:
+            failure_keys = self._failure_keys(pdf_path, label, extraction_schema, ctx)
+            min_cached_at = (datetime.now() - self.negative_ttl).timestamp()
+            failure = self.results_store.get_failure(failure_keys, min_cached_at)
+            if failure is None and self.shared is not None:
+                failure = self._lookup_shared_failure(failure_keys, min_cached_at, label)
+        except Exception:
+            return None
+        self.metrics.increment("negative", "hits" if failure is not None else "misses", label)
+        return failure
+
+    def save_failure(self, pdf_path, label, extraction_schema, failure_class, error, ctx=None):
+        """
+        Registra uma falha determinística (TTL curto: NEGATIVE_CACHE_TTL_SECONDS).
+
+        Args:
+            pdf_path: Caminho do PDF
             label: Label do documento
+            extraction_schema: Schema (falha do LLM) ou None (falha do PDF, vale para qualquer schema)
+            failure_class: FAILURE_NO_TEXT, FAILURE_UNREADABLE_PDF ou FAILURE_INVALID_LLM_OUTPUT
+            error: Mensagem da falha original (repetida sem alteração nos reenvios)
+            ctx: RequestContext (hash do conteúdo) ou None
+        """
+        if self.negative_ttl.total_seconds() <= 0:
+            return
+        try:
+            failure_key = self._failure_keys(pdf_path, label, extraction_schema, ctx)[-1]
+            self.results_store.put_failure(failure_key, label, failure_class, error)
+            self.metrics.increment("negative", "stored", label)
+            if self.shared is not None:
+                self._share(f"failure:{failure_key}", datetime.now(),
+                            {"failure_class": failure_class, "error": error}, self.negative_ttl, label)
+        except Exception as e:
+            print(f"[AVISO] Falha ao salvar cache negativo: {e}")
+
+    def clear_failures(self, pdf_path, label, extraction_schema, ctx=None):
+        """Remove as falhas deste PDF/schema (ex: reprocessamento forçado deu certo)."""
+        try:
+            failure_keys = self._failure_keys(pdf_path, label, extraction_schema, ctx)
+            self.results_store.delete_failures(failure_keys)
+            for failure_key in failure_keys:
+                self._shared_call(lambda: self.shared.delete(f"failure:{failure_key}"), label)
+        except Exception as e:
+            print(f"[AVISO] Falha ao limpar cache negativo: {e}")
+
+    def _lookup_shared_failure(self, failure_keys, min_cached_at, label):
+        """
+        Tier compartilhado do cache negativo: falha mais recente registrada por
+        outro nó, gravada também no SQLite deste nó.
+
+        Returns:
+            dict ou None: {"failure_key", "failure_class", "error", "cached_at"} ou None
+        """
+        found = []
+        for failure_key in failure_keys:
+            cached_data = self._get_shared(f"failure:{failure_key}", min_cached_at, label)
+            if cached_data is not None and "failure_class" in cached_data and "error" in cached_data:
+                found.append({
+                    "failure_key": failure_key, "failure_class": cached_data["failure_class"],
+                    "error": cached_data["error"], "cached_at": cached_data["cached_at"]
+                })
+        if not found:
+            return None
+        failure = max(found, key=lambda failure: failure["cached_at"])
+        self.results_store.put_failure(
+            failure["failure_key"], label, failure["failure_class"], failure["error"], cached_at=failure["cached_at"]
+        )
+        return failure
+
+    # ===== CACHE DE CAMPOS =====
+
+    def get_field_key(self, field_name, field_description):
+        """
+        Gera chave de um campo: nome + hash da descrição.
+        Mesma descrição = mesmo significado = valor reutilizável.
+
+        Args:
+            field_name: Nome do campo
+            field_description: Descrição do campo no schema
 
         Returns:
-            str: Fingerprint (hash dos primeiros 500 chars + label)
+            str: Chave do campo (ex: "nome:1a2b3c4d")
         """
-        # Usar primeiros 500 chars (estrutura/cabeçalho do documento)
-        structure = pdf_text[:500] if len(pdf_text) >= 500 else pdf_text
-        fingerprint_str = f"{label}:{structure}"
-        return hashlib.md5(fingerprint_str.encode()).hexdigest()
+        description_hash = hashlib.md5(str(field_description).encode()).hexdigest()[:8]
+        return f"{field_name}:{description_hash}"
+
+    def get_cached_fields(self, pdf_path, label, extraction_schema, ctx=None):
+        """
+        Busca valores já extraídos para os campos do schema.
+        ESTRATÉGIA: Subconjuntos (ou schemas com campos extras) reaproveitam
+        tudo que já foi extraído deste PDF, campo a campo.
+
+        Args:
+            pdf_path: Caminho do PDF
+            label: Label do documento
+            extraction_schema: Schema de extração
+            ctx: RequestContext (hash do conteúdo) ou None
+
+        Returns:
+            dict: {field_name: valor} apenas dos campos cacheados e válidos
+        """
+        try:
+            field_keys = {
+                self.get_field_key(field_name, field_description): field_name
+                for field_name, field_description in extraction_schema.items()
+            }
+            pdf_hash = self.resolve_pdf_hash(pdf_path, ctx)
+            cached_fields = self.results_store.get_fields(
+                pdf_hash, label, field_keys.keys(), self._min_cached_at()
+            )
+            if not cached_fields and self.legacy_hash_lookup:
+                # Compatibilidade: campos gravados com hash MD5 → migrar para o hash novo
+                cached_fields = self.results_store.get_fields(
+                    self._resolve_legacy_pdf_hash(pdf_path, ctx), label, field_keys.keys(), self._min_cached_at()
+                )
+                if cached_fields:
+                    self.results_store.put_fields(pdf_hash, label, cached_fields)
+            if self.shared is not None:
+                # Tier compartilhado: campos que faltam, extraídos por outro nó
+                for field_key in field_keys.keys() - cached_fields.keys():
+                    shared_key = f"field:{pdf_hash}_{label}_{field_key}"
+                    cached_data = self._get_shared(shared_key, self._min_cached_at(), label)
+                    if cached_data is not None and "value" in cached_data:
+                        cached_fields[field_key] = cached_data["value"]
+                        self.results_store.put_fields(
+                            pdf_hash, label, {field_key: cached_data["value"]}, cached_at=cached_data["cached_at"]
+                        )
+            return {field_keys[field_key]: value for field_key, value in cached_fields.items()}
+
+        except Exception:
+            return {}
+
+    def save_fields(self, pdf_path, label, extraction_schema, data, ctx=None):
+        """
+        Salva os valores extraídos no cache de campos (merge com os existentes).
+
+        Args:
+            pdf_path: Caminho do PDF
+            label: Label do documento
+            extraction_schema: Schema usado na extração
+            data: Dict {field_name: valor} extraído
+            ctx: RequestContext (hash do conteúdo) ou None
+        """
+        try:
+            values = {
+                self.get_field_key(field_name, field_description): data[field_name]
+                for field_name, field_description in extraction_schema.items()
+                if field_name in data
+            }
+            if values:
+                pdf_hash = self.resolve_pdf_hash(pdf_path, ctx)
+                self.results_store.put_fields(pdf_hash, label, values)
+                if self.shared is not None:
+                    cached_at = datetime.now()
+                    for field_key, value in values.items():
+                        shared_key = f"field:{pdf_hash}_{label}_{field_key}"
+                        self._share(shared_key, cached_at, {"value": value}, self.ttl, label)
+
+        except Exception as e:
+            print(f"[AVISO] Falha ao salvar cache de campos: {e}")
 
     def calculate_text_similarity(self, text1, text2):
         """
         Calcula similaridade entre dois textos (0.0 a 1.0).
-        Método simples: % de caracteres comuns nos primeiros 500 chars.
+        Jaccard dos shingles de caracteres: inserções/remoções afetam só os
+        shingles vizinhos (a comparação posicional antiga desalinhava tudo).
 
         Args:
             text1: Primeiro texto
@@ -335,77 +1832,104 @@ class CacheManager:
         Returns:
             float: Similaridade (0.0 a 1.0)
         """
-        # Usar primeiros 500 chars
-        t1 = text1[:500] if len(text1) >= 500 else text1
-        t2 = text2[:500] if len(text2) >= 500 else text2
+        return self._minhasher.jaccard(text1[:_TEMPLATE_TEXT_CHARS], text2[:_TEMPLATE_TEXT_CHARS])
+
+    def get_minhash(self, pdf_text, ctx=None):
+        """
+        Assinatura MinHash do documento, calculada UMA vez por requisição (ctx).
 
-        # Calcular caracteres comuns
-        common_chars = sum(1 for c1, c2 in zip(t1, t2) if c1 == c2)
-        max_len = max(len(t1), len(t2))
+        Args:
+            pdf_text: Texto do PDF
+            ctx: RequestContext ou None
+
+        Returns:
+            np.ndarray: Assinatura uint32
+        """
+        if ctx is not None and ctx.minhash is not None:
+            return ctx.minhash
 
-        if max_len == 0:
-            return 0.0
+        signature = self._minhasher.signature(pdf_text[:_TEMPLATE_TEXT_CHARS])
+        if ctx is not None:
+            ctx.minhash = signature
+        return signature
 
-        return common_chars / max_len
+    def _get_template_index(self, label, schema_hash, threshold):
+        """
+        Índice LSH do (label, schema), construído do SQLite no primeiro uso.
+        As bandas do LSH dependem do limiar: um índice por limiar usado.
+        Entradas antigas sem assinatura gravada têm a assinatura calculada do texto.
 
-    def find_similar_template(self, pdf_text, label, extraction_schema, threshold=0.85):
+        Returns:
+            LSHIndex
+        """
+        key = (label, schema_hash, threshold)
+        with self._template_lock:
+            index = self._template_indexes.get(key)
+            if index is not None:
+                return index
+
+        index = LSHIndex(num_perm=self._minhasher.num_perm, threshold=threshold)
+        for row in self.results_store.iter_template_candidates(label, schema_hash, self._min_cached_at()):
+            if row["minhash"] is not None:
+                signature = signature_from_bytes(row["minhash"])
+            else:
+                signature = self._minhasher.signature(row["pdf_text"][:_TEMPLATE_TEXT_CHARS])
+            index.insert(row["cache_key"], signature)
+
+        with self._template_lock:
+            return self._template_indexes.setdefault(key, index)
+
+    def find_similar_template(self, pdf_text, label, extraction_schema, threshold=None, ctx=None,
+                              include_text=False):
         """
         Busca documento similar (template) no cache.
-        FASE 3: Se encontrar documento 85%+ similar, reusa resultado.
+        FASE 3: Se encontrar documento com a mesma estrutura, reusa resultado.
+        MinHash + LSH: só os candidatos do índice são verificados (sublinear).
 
         Args:
             pdf_text: Texto do PDF atual
             label: Label do documento
             extraction_schema: Schema de extração
-            threshold: Limiar de similaridade (0.85 = 85%)
+            threshold: Jaccard mínimo (default TEMPLATE_SIMILARITY_THRESHOLD = 0.85)
+            ctx: RequestContext (assinatura reusada ao salvar) ou None
+            include_text: Incluir o texto do template em 'text' (diff de template)
 
         Returns:
             dict ou None: Template encontrado ou None
         """
         try:
-            fingerprint = self.generate_document_fingerprint(pdf_text, label)
-
-            # Buscar TODOS os resultados cacheados do mesmo label
-            for cache_file in self.results_cache_dir.glob(f"*_{label}_*.json"):
-                try:
-                    with open(cache_file, 'r', encoding='utf-8') as f:
-                        cached_data = json.load(f)
-
-                    # Verificar se é do mesmo label e schema
-                    if cached_data['label'] != label:
-                        continue
-                    if cached_data['schema_fields'] != list(extraction_schema.keys()):
-                        continue
-
-                    # Verificar TTL
-                    cached_time = datetime.fromisoformat(cached_data['cached_at'])
-                    if datetime.now() - cached_time > self.ttl:
-                        continue
-
-                    # Ler texto do PDF cacheado (se disponível)
-                    # Por enquanto, comparar fingerprint diretamente
-                    cached_fingerprint = self.generate_document_fingerprint(
-                        cached_data.get('pdf_text', ''),
-                        label
-                    )
-
-                    # Se fingerprints muito similares
-                    if fingerprint == cached_fingerprint:
-                        return {
-                            'template': cached_data['result'],
-                            'similarity': 1.0,
-                            'source': str(cache_file)
-                        }
-
-                except Exception:
+            threshold = self.template_threshold if threshold is None else threshold
+            index = self._get_template_index(label, self.get_schema_hash(extraction_schema), threshold)
+            signature = self.get_minhash(pdf_text, ctx)
+
+            with self._template_lock:
+                matches = index.query(signature, threshold)
+
+            min_cached_at = self._min_cached_at()
+            for cache_key, similarity in matches:
+                cached = self.results_store.get_result(cache_key, min_cached_at)
+                if cached is None:
+                    # Expirada (ou removida): sai do índice
+                    with self._template_lock:
+                        index.remove(cache_key)
                     continue
 
+                template = {
+                    'template': cached['result'],
+                    'similarity': similarity,
+                    'source': cache_key
+                }
+                if include_text:
+                    template['text'] = self.results_store.get_pdf_text(cache_key)
+                return template
             return None
 
-        except Exception:
+        except Exception as e:
+            print(f"[AVISO] Falha na busca de template: {e}")
             return None
 
-    def save_result_with_text(self, pdf_path, pdf_text, label, extraction_schema, result):
+    def save_result_with_text(self, pdf_path, pdf_text, label, extraction_schema, result, ctx=None,
+                              cached_at=None):
         """
         Salva resultado COM texto do PDF (para template matching).
         FASE 3: Incluir pdf_text no cache para comparação futura.
@@ -416,24 +1940,16 @@ class CacheManager:
             label: Label do documento
             extraction_schema: Schema de extração
             result: Resultado da extração
+            ctx: RequestContext (hash do conteúdo) ou None
+            cached_at: datetime da extração (ex: resultados importados); default = agora
         """
         try:
-            cache_key = self.get_result_cache_key(pdf_path, label, extraction_schema)
-            cache_path = self.results_cache_dir / f"{cache_key}.json"
-
-            # Preparar dados do cache (com pdf_text para template matching)
-            cache_data = {
-                "cached_at": datetime.now().isoformat(),
-                "pdf_path": str(pdf_path),
-                "pdf_text": pdf_text[:1000],  # Salvar primeiros 1000 chars
-                "label": label,
-                "schema_fields": list(extraction_schema.keys()),
-                "result": result
-            }
-
-            # Salvar
-            with open(cache_path, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, ensure_ascii=False, indent=2)
-
+            # Texto (truncado) para assinatura MinHash e diff de template;
+            # hash do texto inteiro enviado ao LLM para a chave por texto
+            self._store_result(
+                pdf_path, label, extraction_schema, result,
+                pdf_text=pdf_text[:_STORED_TEXT_CHARS], ctx=ctx, cached_at=cached_at,
+                text_hash=self.get_text_hash(pdf_text, ctx)
+            )
         except Exception as e:
-            print(f"[AVISO] Falha ao salvar cache com texto: {e}")
\ No newline at end of file
+            print(f"[AVISO] Falha ao salvar cache com texto: {e}")
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Métricas dos caches - Hit ratio, latência, expirações e despejos por label.
+ESTRATÉGIA: Contadores por (cache, label) e histogramas de latência com buckets
+fixos (custo O(1) por observação, sem guardar amostras). O snapshot agrega os
+totais e estima percentis pelos buckets, para ajustar tamanhos e TTLs com dados.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Limites superiores dos buckets de latência (ms); o último bucket é +inf
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class LatencyHistogram:
+    """
+    Histograma de latências com buckets fixos (não é thread-safe sozinho:
+    CacheMetrics serializa o acesso).
+    """
+
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        """
+        Args:
+            buckets_ms: Limites superiores dos buckets, em ms (ordem crescente)
+        """
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, seconds):
+        """Registra uma latência (em segundos)."""
+        elapsed_ms = seconds * 1000
+        self.counts[bisect.bisect_left(self.buckets_ms, elapsed_ms)] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def percentile(self, fraction):
+        """
+        Percentil estimado: limite superior do bucket que contém a fração pedida
+        (no último bucket, a maior latência observada).
+
+        Args:
+            fraction: Fração entre 0 e 1 (ex: 0.95)
+
+        Returns:
+            float: Latência em ms (0.0 sem observações)
+        """
+        if self.count == 0:
+            return 0.0
+        target = fraction * self.count
+        cumulative = 0
+        for position, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target and count:
+                if position == len(self.buckets_ms):
+                    return self.max_ms
+                return min(self.buckets_ms[position], self.max_ms)
+        return self.max_ms
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: Contagem, média, máximo, p50/p95/p99 (ms) e contagens por bucket
+        """
+        labels = [f"le_{bucket:g}ms" for bucket in self.buckets_ms] + ["le_inf"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": round(self.percentile(0.50), 3),
+            "p95_ms": round(self.percentile(0.95), 3),
+            "p99_ms": round(self.percentile(0.99), 3),
+            "buckets": dict(zip(labels, self.counts))
+        }
+
+
+class CacheMetrics:
+    """
+    Contadores e histogramas de todos os caches de um CacheManager.
+    - increment("result_memory", "hits", label): contador por cache/evento/label
+    - observe("result_cache.lookup", segundos): histograma por operação
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # cache -> label (ou None) -> evento -> n
+        self._histograms = {}  # operação -> LatencyHistogram
+
+    def increment(self, cache, event, label=None, count=1):
+        """
+        Soma ao contador de um evento.
+
+        Args:
+            cache: Nome do cache (ex: "result_memory", "embedding")
+            event: Evento (hits, misses, expirations, evictions...)
+            label: Label do documento (None = sem label, só entra no total)
+            count: Quanto somar
+        """
+        if count <= 0:
+            return
+        with self._lock:
+            events = self._counters.setdefault(cache, {}).setdefault(label, {})
+            events[event] = events.get(event, 0) + count
+
+    def observe(self, operation, seconds):
+        """Registra a latência (segundos) de uma operação."""
+        with self._lock:
+            histogram = self._histograms.get(operation)
+            if histogram is None:
+                histogram = self._histograms[operation] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, operation):
+        """Context manager que mede o bloco e registra em observe()."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(operation, time.perf_counter() - start)
+
+    def counters(self, cache):
+        """
+        Totais de um cache (somando todos os labels).
+
+        Returns:
+            dict: {evento: n}
+        """
+        totals = {}
+        with self._lock:
+            for events in self._counters.get(cache, {}).values():
+                for event, count in events.items():
+                    totals[event] = totals.get(event, 0) + count
+        return totals
+
+    def snapshot(self):
+        """
+        Retorna todas as métricas.
+
+        Returns:
+            dict: {
+                "caches": {cache: {"total": {...}, "by_label": {label: {...}}}},
+                "latency": {operação: histograma}
+            }
+            (contadores com hits/misses incluem "hit_ratio")
+        """
+        with self._lock:
+            caches = {}
+            for cache, by_label in self._counters.items():
+                total = {}
+                labels = {}
+                for label, events in by_label.items():
+                    for event, count in events.items():
+                        total[event] = total.get(event, 0) + count
+                    if label is not None:
+                        labels[label] = _with_hit_ratio(dict(events))
+                caches[cache] = {"total": _with_hit_ratio(total), "by_label": labels}
+            latency = {operation: histogram.snapshot() for operation, histogram in self._histograms.items()}
+        return {"caches": caches, "latency": latency}
+
+
+def _with_hit_ratio(events):
+    """Acrescenta hit_ratio aos contadores que têm hits/misses."""
+    lookups = events.get("hits", 0) + events.get("misses", 0)
+    if lookups:
+        events["hit_ratio"] = round(events.get("hits", 0) / lookups, 4)
+    return events
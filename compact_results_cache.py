@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compactação do cache de resultados (SQLite).
+
+Remove expirados, aplica o limite de tamanho (LRU), devolve o espaço livre ao
+sistema de arquivos (VACUUM) e relata o que sobrou de arquivos soltos no disco:
+JSONs do formato antigo e temporários de gravações interrompidas.
+
+Uso:
+    python compact_results_cache.py                       # .results_cache e cache/
+    python compact_results_cache.py --max-entries 50000   # limite só nesta execução
+    python compact_results_cache.py --dry-run             # apenas relatório
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+from cache_manager import CacheManager
+
+# Temporário de gravação (<arquivo>.<pid>.<thread>.tmp) só é removido se for
+# abandonado: idade mínima (gravação em andamento leva milissegundos) e processo
+# dono morto, ou idade máxima atingida
+_TMP_MIN_AGE_SECONDS = 60
+_TMP_MAX_AGE_SECONDS = 3600
+
+
+def _mb(size):
+    return f"{size / (1024 * 1024):.2f} MB"
+
+
+def _pid_alive(pid):
+    """True se o processo existe (neste host)."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _is_stale_tmp(tmp_path, now):
+    """True se o temporário foi abandonado por uma gravação interrompida."""
+    try:
+        age = now - tmp_path.stat().st_mtime
+    except FileNotFoundError:
+        return False  # os.replace já concluiu
+    if age < _TMP_MIN_AGE_SECONDS:
+        return False
+    if age >= _TMP_MAX_AGE_SECONDS:
+        return True
+    try:
+        pid = int(tmp_path.name.split(".")[-3])
+    except (IndexError, ValueError):
+        return False
+    return not _pid_alive(pid)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compacta o cache de resultados")
+    parser.add_argument("--dir", default=".results_cache", help="Diretório do cache de resultados")
+    parser.add_argument("--cache-dir", default="cache", help="Diretório dos caches de label")
+    parser.add_argument("--max-entries", type=int, help="Limite de resultados (default: RESULT_CACHE_MAX_ENTRIES)")
+    parser.add_argument("--max-mb", type=float, help="Limite em MB (default: RESULT_CACHE_MAX_MB)")
+    parser.add_argument("--dry-run", action="store_true", help="Só relata, sem remover nada")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("  COMPACTACAO DO CACHE DE RESULTADOS")
+    print("=" * 80)
+
+    # sweep_interval=0: sem thread; a limpeza roda aqui, em primeiro plano
+    cache = CacheManager(
+        cache_dir=args.cache_dir, results_cache_dir=args.dir, sweep_interval=0,
+        max_results=args.max_entries, max_results_mb=args.max_mb
+    )
+    store = cache.results_store
+
+    print(f"\nResultados: {store.count_results()} | Campos: {store.count_fields()}")
+    print(f"Banco: {_mb(store.file_bytes())} em disco, {_mb(store.used_bytes())} em uso")
+
+    legacy_files = list(Path(args.dir).glob("*.json")) + list(Path(args.dir).glob("fields/*.json"))
+    now = time.time()
+    tmp_files = [tmp_path for tmp_path in Path(args.cache_dir).glob("*.tmp") if _is_stale_tmp(tmp_path, now)]
+    if legacy_files:
+        print(f"[AVISO] {len(legacy_files)} JSON(s) do formato antigo: python migrate_results_cache.py --delete")
+    if tmp_files:
+        print(f"[AVISO] {len(tmp_files)} temporário(s) de gravação interrompida em {args.cache_dir}/")
+
+    if args.dry_run:
+        print("=" * 80)
+        return
+
+    report = cache.sweep_results()
+    print(f"\n[OK] Expirados removidos: {report['expired']}")
+    print(f"[OK] Removidos pelo limite (LRU): {report['evicted']}")
+
+    for tmp_path in tmp_files:
+        tmp_path.unlink(missing_ok=True)
+    if tmp_files:
+        print(f"[OK] {len(tmp_files)} temporário(s) removido(s)")
+
+    compacted = store.compact()
+    print(f"[OK] VACUUM: {_mb(compacted['bytes_before'])} -> {_mb(compacted['bytes_after'])}")
+    print(f"[OK] Resultados restantes: {store.count_results()}")
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Backends de embedding para a busca de exemplos few-shot.
+ESTRATÉGIA: Para ranquear no máximo alguns exemplos por label não é preciso um
+modelo neural. O backend "hashed" usa n-gramas de caracteres com feature hashing
+(NumPy puro, sem arquivos de modelo, bem abaixo de 1 ms por documento).
+O padrão continua sendo sentence-transformers até a comparação de qualidade
+(benchmark_embeddings.py) ser feita com o modelo instalado.
+
+Variável:
+    EMBEDDING_BACKEND: "sentence-transformers" (default) ou "hashed"
+"""
+import os
+import re
+import threading
+import numpy as np
+
+
+# Exemplos gravados antes dos backends plugáveis não têm tag: vieram do MiniLM
+LEGACY_BACKEND_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class HashedNgramBackend:
+    """
+    Vetor de contagens de n-gramas de caracteres (feature hashing), com
+    amortecimento log1p e norma L2 = 1.
+    - Dígitos viram "0": o que importa é o layout do documento, não os valores
+    - Hash polinomial vetorizado sobre os bytes UTF-8 do texto
+    """
+
+    _PRIME = np.uint64(1099511628211)
+
+    def __init__(self, dim=1024, ngram_range=(3, 5)):
+        """
+        Args:
+            dim: Dimensão do vetor (número de buckets do hashing)
+            ngram_range: Tamanhos mínimo e máximo dos n-gramas (inclusive)
+        """
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.name = f"hashed-ngram/{dim}/{ngram_range[0]}-{ngram_range[1]}"
+
+    @property
+    def loaded(self):
+        """Sem modelo para carregar: sempre pronto."""
+        return True
+
+    def load(self):
+        """Nada a carregar (interface comum dos backends)."""
+        return True
+
+    def encode(self, text):
+        """
+        Gera o embedding do texto.
+
+        Args:
+            text: Texto do documento
+
+        Returns:
+            np.ndarray: Vetor float32 (dim,) normalizado (zeros se texto vazio)
+        """
+        text = re.sub(r'\s+', ' ', re.sub(r'\d', '0', text.lower())).strip()
+        data = np.frombuffer(f" {text} ".encode('utf-8'), dtype=np.uint8).astype(np.uint64)
+
+        counts = np.zeros(self.dim, dtype=np.float64)
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            windows = data.size - n + 1
+            if windows <= 0:
+                continue
+            # Hash polinomial de todas as janelas de n bytes de uma vez
+            # (overflow de uint64 é intencional: aritmética módulo 2^64)
+            hashes = np.full(windows, n, dtype=np.uint64)
+            for offset in range(n):
+                hashes = hashes * self._PRIME + data[offset:offset + windows]
+            hashes ^= hashes >> np.uint64(29)
+            counts += np.bincount((hashes % np.uint64(self.dim)).astype(np.intp), minlength=self.dim)
+
+        vector = np.log1p(counts).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def encode_batch(self, texts):
+        """
+        Gera os embeddings de vários textos.
+
+        Args:
+            texts: Lista de textos
+
+        Returns:
+            list: Vetores float32 (dim,), na ordem dos textos
+        """
+        return [self.encode(text) for text in texts]
+
+
+class SentenceTransformerBackend:
+    """
+    Embeddings de um modelo sentence-transformers (carregado sob demanda, uma vez).
+    Custa centenas de MB de RSS (torch) e segundos de startup por worker.
+    """
+
+    def __init__(self, model_name='all-MiniLM-L6-v2'):
+        """
+        Args:
+            model_name: Nome do modelo sentence-transformers
+        """
+        self.model_name = model_name
+        self.name = f"sentence-transformers/{model_name}"
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        """True se o modelo já está em memória."""
+        return self._model is not None
+
+    def load(self):
+        """
+        Carrega o modelo uma única vez (thread-safe: warmup em background e
+        requisições concorrentes não carregam o modelo duas vezes).
+
+        Returns:
+            bool: True se o modelo está disponível
+        """
+        if self._model is not None:
+            return True
+
+        with self._lock:
+            if self._model is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name)
+                except Exception as e:
+                    print(f"[AVISO] Falha ao carregar modelo de embeddings: {e}")
+                    return False
+        return True
+
+    def encode(self, text):
+        """
+        Gera o embedding do texto (requer load() bem-sucedido).
+
+        Args:
+            text: Texto do documento
+
+        Returns:
+            np.ndarray: Embedding do texto
+        """
+        return self._model.encode(text)
+
+    def encode_batch(self, texts, batch_size=64):
+        """
+        Gera os embeddings de vários textos em lotes (uma passada do modelo por lote).
+
+        Args:
+            texts: Lista de textos
+            batch_size: Textos por passada do modelo
+
+        Returns:
+            list: Embeddings, na ordem dos textos
+        """
+        return list(self._model.encode(list(texts), batch_size=batch_size))
+
+
+def get_embedding_backend(name=None):
+    """
+    Cria o backend de embeddings configurado.
+
+    Args:
+        name: "hashed" ou "sentence-transformers"; default = EMBEDDING_BACKEND
+
+    Returns:
+        HashedNgramBackend ou SentenceTransformerBackend
+
+    Raises:
+        ValueError: Se o backend for desconhecido
+    """
+    name = (name or os.getenv('EMBEDDING_BACKEND', 'sentence-transformers')).lower()
+    if name == 'hashed':
+        return HashedNgramBackend()
+    if name in ('sentence-transformers', 'sentence_transformers'):
+        return SentenceTransformerBackend()
+    raise ValueError(f"EMBEDDING_BACKEND desconhecido: {name} (use 'hashed' ou 'sentence-transformers')")
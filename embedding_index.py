@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Índice de embeddings por label para busca de exemplos few-shot.
+ESTRATÉGIA: Embeddings guardados como UMA matriz float32 contígua já
+normalizada. Similaridade = um produto matriz-vetor; top-k via argpartition.
+Sem conversão de listas JSON nem cálculo de normas a cada busca.
+Para despejo por diversidade, cada linha guarda o vizinho mais próximo
+(atualizado incrementalmente a cada append/remove).
+"""
+import numpy as np
+
+
+class EmbeddingIndex:
+    """
+    Matriz (n, dim) de embeddings normalizados, alinhada com a lista de exemplos
+    do label: a linha i corresponde a examples[i]. Exemplos sem embedding (ou com
+    dimensão diferente) ocupam uma linha inválida que nunca é retornada.
+    """
+
+    def __init__(self, capacity=16):
+        """
+        Args:
+            capacity: Capacidade inicial (cresce por duplicação)
+        """
+        self._capacity = capacity
+        self._matrix = None
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._size = 0
+        self.dim = None
+
+        # Vizinho mais próximo de cada linha (similaridade e posição; -inf/-1 = nenhum)
+        self._nn_sim = np.full(capacity, -np.inf, dtype=np.float32)
+        self._nn_pos = np.full(capacity, -1, dtype=np.intp)
+
+        # Lista de exemplos à qual as linhas estão alinhadas (mantida pelo CacheManager)
+        self.examples = None
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        """Bytes dos arrays do índice (matriz + vizinhos + máscara)."""
+        matrix_bytes = self._matrix.nbytes if self._matrix is not None else 0
+        return matrix_bytes + self._valid.nbytes + self._nn_sim.nbytes + self._nn_pos.nbytes
+
+    @classmethod
+    def from_embeddings(cls, embeddings):
+        """
+        Constrói o índice a partir de uma sequência de embeddings (listas, arrays ou None).
+
+        Args:
+            embeddings: Iterável de embeddings na ordem dos exemplos
+
+        Returns:
+            EmbeddingIndex
+        """
+        embeddings = list(embeddings)
+        index = cls(capacity=max(16, len(embeddings)))
+        for embedding in embeddings:
+            index._append_row(embedding)
+        index._recompute_neighbours(np.arange(index._size))
+        return index
+
+    def append(self, embedding):
+        """
+        Adiciona embedding no fim (normalizado). None = linha inválida.
+
+        Args:
+            embedding: Lista/array de floats ou None
+        """
+        position = self._append_row(embedding)
+        if not self._valid[position] or position == 0:
+            return
+
+        # Vizinhos: um produto matriz-vetor contra as linhas existentes
+        similarities = self._similarities(self._matrix[position])
+        similarities[position] = -np.inf
+        closer = similarities > self._nn_sim[:self._size]
+        self._nn_sim[:self._size][closer] = similarities[closer]
+        self._nn_pos[:self._size][closer] = position
+        best = int(np.argmax(similarities))
+        if np.isfinite(similarities[best]):
+            self._nn_sim[position] = similarities[best]
+            self._nn_pos[position] = best
+
+    def _append_row(self, embedding):
+        """Grava a linha no fim (sem atualizar vizinhos). Retorna a posição."""
+        vector = self._normalize(embedding)
+        if vector is not None and self._matrix is None:
+            self.dim = vector.shape[0]
+            self._matrix = np.zeros((self._capacity, self.dim), dtype=np.float32)
+
+        if self._size == self._capacity:
+            self._grow()
+
+        valid = vector is not None and vector.shape[0] == self.dim
+        if self._matrix is not None:
+            self._matrix[self._size] = vector if valid else 0.0
+        self._valid[self._size] = valid
+        self._nn_sim[self._size] = -np.inf
+        self._nn_pos[self._size] = -1
+        self._size += 1
+        return self._size - 1
+
+    def remove(self, position):
+        """
+        Remove a linha `position`, deslocando as seguintes (mantém alinhamento com a lista).
+
+        Args:
+            position: Índice do exemplo removido
+        """
+        if position < 0:
+            position += self._size
+        last = self._size - 1
+        if self._matrix is not None:
+            self._matrix[position:last] = self._matrix[position + 1:self._size]
+        self._valid[position:last] = self._valid[position + 1:self._size]
+        self._valid[last] = False
+        self._nn_sim[position:last] = self._nn_sim[position + 1:self._size]
+        self._nn_pos[position:last] = self._nn_pos[position + 1:self._size]
+        self._size = last
+
+        # Linhas cujo vizinho era a removida recalculam; as demais só reajustam a posição
+        nn_pos = self._nn_pos[:self._size]
+        orphans = np.flatnonzero(nn_pos == position)
+        nn_pos[nn_pos > position] -= 1
+        self._recompute_neighbours(orphans)
+
+    def most_redundant(self):
+        """
+        Posição a despejar mantendo a diversidade: primeiro linhas sem embedding
+        (inúteis para a busca), senão a linha mais próxima do seu vizinho
+        (em empate, a mais antiga).
+
+        Returns:
+            int ou None: Posição (None se o índice está vazio)
+        """
+        if self._size == 0:
+            return None
+        invalid = np.flatnonzero(~self._valid[:self._size])
+        if invalid.size:
+            return int(invalid[0])
+        return int(np.argmax(self._nn_sim[:self._size]))
+
+    def _similarities(self, vector):
+        """Similaridade do vetor com todas as linhas (-inf nas inválidas)."""
+        similarities = self._matrix[:self._size] @ vector
+        similarities[~self._valid[:self._size]] = -np.inf
+        return similarities
+
+    def _recompute_neighbours(self, positions, chunk_size=512):
+        """Recalcula o vizinho mais próximo das posições (produto matricial em blocos)."""
+        positions = np.asarray(positions, dtype=np.intp)
+        self._nn_sim[positions] = -np.inf
+        self._nn_pos[positions] = -1
+        if self._matrix is None:
+            return
+        positions = positions[self._valid[positions]]
+
+        for start in range(0, positions.size, chunk_size):
+            rows = positions[start:start + chunk_size]
+            similarities = self._matrix[rows] @ self._matrix[:self._size].T
+            similarities[:, ~self._valid[:self._size]] = -np.inf
+            similarities[np.arange(rows.size), rows] = -np.inf
+            best = np.argmax(similarities, axis=1)
+            best_sim = similarities[np.arange(rows.size), best]
+            found = np.isfinite(best_sim)
+            self._nn_sim[rows[found]] = best_sim[found]
+            self._nn_pos[rows[found]] = best[found]
+
+    def search(self, query_embedding, k=1):
+        """
+        Busca os k exemplos mais similares (cosine similarity).
+
+        Args:
+            query_embedding: Embedding da consulta
+            k: Número de resultados
+
+        Returns:
+            list: [(posição, similaridade)] em ordem decrescente de similaridade
+        """
+        query = self._normalize(query_embedding)
+        if query is None or self._matrix is None or self._size == 0 or query.shape[0] != self.dim:
+            return []
+
+        similarities = self._similarities(query)
+
+        k = min(k, self._size)
+        if k < self._size:
+            candidates = np.argpartition(-similarities, k - 1)[:k]
+        else:
+            candidates = np.arange(self._size)
+        ordered = candidates[np.argsort(-similarities[candidates])]
+
+        return [
+            (int(position), float(similarities[position]))
+            for position in ordered
+            if np.isfinite(similarities[position])
+        ]
+
+    def _grow(self):
+        """Duplica a capacidade (amortizado O(1) por append)."""
+        self._capacity *= 2
+        valid = np.zeros(self._capacity, dtype=bool)
+        valid[:self._size] = self._valid[:self._size]
+        self._valid = valid
+        nn_sim = np.full(self._capacity, -np.inf, dtype=np.float32)
+        nn_sim[:self._size] = self._nn_sim[:self._size]
+        self._nn_sim = nn_sim
+        nn_pos = np.full(self._capacity, -1, dtype=np.intp)
+        nn_pos[:self._size] = self._nn_pos[:self._size]
+        self._nn_pos = nn_pos
+        if self._matrix is not None:
+            matrix = np.zeros((self._capacity, self.dim), dtype=np.float32)
+            matrix[:self._size] = self._matrix[:self._size]
+            self._matrix = matrix
+
+    @staticmethod
+    def _normalize(embedding):
+        """Converte para float32 com norma 1 (None se vazio/nulo)."""
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        if vector.size == 0 or norm == 0:
+            return None
+        return vector / norm
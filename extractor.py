@@ -1,16 +1,35 @@
 import os
 import json
 import re
+import time
 import unicodedata
+import httpx
 from openai import OpenAI
+from openai.types import CompletionUsage
 import fitz  # PyMuPDF
-from cache_manager import CacheManager
+from cache_manager import CacheManager, FAILURE_NO_TEXT, FAILURE_UNREADABLE_PDF, FAILURE_INVALID_LLM_OUTPUT
+from http_pool import get_shared_http_client
 from pattern_matcher import PatternMatcher
+from template_diff import plan_template_reuse
+from request_context import RequestContext, DeadlineExceeded, ExtractionCancelled, ExtractionInterrupted
 from dotenv import load_dotenv
 
 # Carrega variáveis de ambiente
 load_dotenv()
 
+
+class CachedExtractionFailure(Exception):
+    """
+    Falha de leitura do PDF servida pelo cache negativo.
+    Levantada com a mesma mensagem da falha original: o chamador a trata (e
+    formata) exatamente como da primeira vez.
+    """
+
+    def __init__(self, failure):
+        super().__init__(failure['error'])
+        self.failure_class = failure['failure_class']
+
+
 class PDFExtractor:
     """
     Motor de extração de dados de PDFs usando gpt-5-mini com cache inteligente.
@@ -21,15 +40,51 @@ class PDFExtractor:
         api_key = os.getenv('OPENAI_API_KEY')
         if not api_key:
             raise ValueError("OPENAI_API_KEY não encontrada no arquivo .env")
-        self.client = OpenAI(api_key=api_key)
+        # Pool HTTP compartilhado e configurável (ver http_pool.py)
+        http_client, self.http_metrics = get_shared_http_client()
+        self.client = OpenAI(api_key=api_key, http_client=http_client)
+        self.client_ready = False
         self.cache = CacheManager()
         self.pattern_matcher = PatternMatcher()  # Extração local
         self.model = "gpt-5-mini"  # Modelo especificado no desafio
 
-    def clean_text(self, text):
+        # Extrair também os campos já conhecidos do label (aquece o cache de campos)
+        self.eager_schema = os.getenv('EAGER_SCHEMA_EXTRACTION', 'false').lower() == 'true'
+
+        # Diff de template: documento do mesmo template envia ao LLM só os trechos alterados
+        self.template_diff_mode = os.getenv('TEMPLATE_DIFF_MODE', 'false').lower() == 'true'
+        self.template_diff_threshold = float(os.getenv('TEMPLATE_DIFF_THRESHOLD', '0.45'))
+
+        # Timeouts: teto por chamada LLM e tempo mínimo para valer a pena iniciar uma tentativa
+        self.llm_timeout = float(os.getenv('LLM_TIMEOUT_SECONDS', '60'))
+        self.connect_timeout = float(os.getenv('OPENAI_CONNECT_TIMEOUT_SECONDS', '5'))
+        self.min_llm_attempt_seconds = float(os.getenv('MIN_LLM_ATTEMPT_SECONDS', '2'))
+
+    def preconnect(self):
+        """
+        Abre (e aquece) uma conexão com a API antes da primeira extração.
+        ESTRATÉGIA: O handshake TCP+TLS sai do caminho da primeira requisição;
+        a conexão fica no pool (keep-alive) para ser reusada.
+
+        Returns:
+            bool: True se a conexão foi estabelecida
+        """
+        try:
+            start = time.time()
+            self.client.with_options(timeout=self.connect_timeout * 2, max_retries=0).models.list()
+            self.client_ready = True
+            print(f"[HTTP] Conexao com OpenAI pre-estabelecida em {time.time() - start:.3f}s")
+            return True
+        except Exception as e:
+            print(f"[AVISO] Falha ao pre-conectar com OpenAI: {e}")
+            return False
+
+    @staticmethod
+    def clean_text(text):
         """
         Limpa e otimiza o texto extraído do PDF.
         ESTRATÉGIA: Reduzir tokens sem perder informação relevante.
+        Estático: usado também fora do extrator (ex: prewarm_cache.py).
         """
         # Normaliza Unicode (corrige caracteres especiais)
         text = unicodedata.normalize('NFKC', text)
@@ -48,26 +103,41 @@ class PDFExtractor:
 
         return text.strip()
     
-    def extract_text_from_pdf(self, pdf_path):
+    def extract_text_from_pdf(self, pdf_path, ctx=None, use_cache=False):
         """
         Extrai texto do PDF usando PyMuPDF (fitz).
         ESTRATÉGIA: Extração local (custo ZERO) com performance 35x superior.
+        Deadline e cancelamento (ctx) são verificados entre páginas.
+        Com use_cache, o texto de um PDF já visto (mesmo hash) vem do cache de textos.
         """
+        if use_cache:
+            text = self.cache.get_cached_text(pdf_path, ctx)
+            if text is not None:
+                return text
+
         try:
             doc = fitz.open(pdf_path)
             text = ""
-            for page in doc:
-                text += page.get_text()
-            doc.close()
+            try:
+                for page in doc:
+                    if ctx is not None:
+                        ctx.check("extracao de texto")
+                    text += page.get_text()
+            finally:
+                doc.close()
 
             # Limpa e otimiza o texto extraído
             text = self.clean_text(text)
 
+            if use_cache and text:
+                self.cache.save_text(pdf_path, text, ctx)
             return text
+        except ExtractionInterrupted:
+            raise
         except Exception as e:
             raise Exception(f"Erro ao extrair texto do PDF: {str(e)}")
 
-    def extract_from_base64(self, pdf_base64, label, extraction_schema, max_retries=2, use_cache=True):
+    def extract_from_base64(self, pdf_base64, label, extraction_schema, max_retries=2, use_cache=True, ctx=None):
         """
         Extrai dados de PDF codificado em Base64.
         ESTRATÉGIA: Decodifica → Salva temp → Extrai → Remove temp
@@ -78,16 +148,53 @@ class PDFExtractor:
             extraction_schema: Schema de extração
             max_retries: Número máximo de tentativas
             use_cache: Se deve usar cache
+            ctx: RequestContext (deadline) ou None
 
         Returns:
             dict: Resultado da extração
         """
+        ctx = ctx if ctx is not None else RequestContext()
+        return self._run_with_temp_pdf(
+            pdf_base64, ctx,
+            lambda temp_path: self.extract(temp_path, label, extraction_schema, max_retries, use_cache, ctx)
+        )
+
+    def extract_multi_from_base64(self, pdf_base64, label, extraction_schemas, max_retries=2, use_cache=True, ctx=None):
+        """
+        Versão Base64 de extract_multi (vários schemas, uma chamada LLM).
+
+        Args:
+            pdf_base64: PDF codificado em Base64
+            label: Label do documento
+            extraction_schemas: Dict {nome_schema: extraction_schema}
+            max_retries: Número máximo de tentativas
+            use_cache: Se deve usar cache
+            ctx: RequestContext (deadline) ou None
+
+        Returns:
+            dict: Resultado da extração com 'results' separado por schema
+        """
+        ctx = ctx if ctx is not None else RequestContext()
+        return self._run_with_temp_pdf(
+            pdf_base64, ctx,
+            lambda temp_path: self.extract_multi(temp_path, label, extraction_schemas, max_retries, use_cache, ctx)
+        )
+
+    def _run_with_temp_pdf(self, pdf_base64, ctx, extract_fn):
+        """
+        Decodifica o Base64 em um arquivo temporário e executa extract_fn(temp_path).
+        O hash do conteúdo é calculado aqui, sobre os bytes já em memória, e
+        segue no ctx (o arquivo não é relido para hashing).
+        O arquivo temporário é sempre removido ao final.
+        """
         import base64
         import tempfile
 
         try:
             # Decodificar Base64
             pdf_bytes = base64.b64decode(pdf_base64)
+            if ctx.content_hash is None:
+                ctx.content_hash = self.cache.get_bytes_hash(pdf_bytes)
 
             # Criar arquivo temporário
             with tempfile.NamedTemporaryFile(mode='wb', suffix='.pdf', delete=False) as temp_file:
@@ -96,20 +203,180 @@ class PDFExtractor:
 
             try:
                 # Extrair dados do PDF temporário
-                result = self.extract(temp_path, label, extraction_schema, max_retries, use_cache)
-                return result
+                return extract_fn(temp_path)
             finally:
                 # Remover arquivo temporário
-                import os
                 if os.path.exists(temp_path):
                     os.remove(temp_path)
 
+        except ExtractionInterrupted as e:
+            return self._interrupted_result(e)
         except Exception as e:
-            return {
+            result = {
                 "success": False,
                 "error": f"Erro ao processar PDF Base64: {str(e)}"
             }
-    
+            if isinstance(e, CachedExtractionFailure):
+                result["failure_class"] = e.failure_class
+                result["from_negative_cache"] = True
+            return result
+
+    def _interrupted_result(self, error):
+        """
+        Resultado padrão de extração interrompida.
+        Deadline excedido → 'timeout' (a API responde 504); cancelamento → 'cancelled'.
+        """
+        if isinstance(error, ExtractionCancelled):
+            print(f"         [CANCEL] {error}")
+            return {
+                "success": False,
+                "cancelled": True,
+                "error": str(error)
+            }
+
+        print(f"         [DEADLINE] {error}")
+        return {
+            "success": False,
+            "timeout": True,
+            "error": str(error)
+        }
+
+    def _request_timeout(self, ctx):
+        """Timeout HTTP da chamada: leitura limitada pelo deadline, conexão pela config do pool."""
+        read_timeout = ctx.timeout(self.llm_timeout)
+        connect_timeout = min(self.connect_timeout, read_timeout)
+        return httpx.Timeout(read_timeout, connect=connect_timeout, pool=connect_timeout)
+
+    def _call_llm(self, messages, ctx):
+        """
+        Executa a chamada ao LLM respeitando deadline e cancelamento.
+        ESTRATÉGIA: Requisição cancelável usa streaming; o cancelamento fecha a
+        conexão HTTP, o que interrompe a geração no servidor e libera a thread.
+
+        Args:
+            messages: Mensagens do chat
+            ctx: RequestContext
+
+        Returns:
+            tuple: (conteúdo da resposta, usage)
+        """
+        # Timeout = tempo restante do deadline; sem retries internos do SDK
+        # (os retries são controlados em extract, respeitando o deadline)
+        client = self.client
+        if ctx.deadline is not None or ctx.cancel_token is not None:
+            client = self.client.with_options(max_retries=0)
+
+        request_args = dict(
+            model=self.model,
+            messages=messages,
+            # FASE 4A: 2500 tokens (mais confortável para reasoning)
+            # Reasoning tokens variável (~800-1200) + JSON compacto (~200-300)
+            # Aumentado de 1500 para reduzir tempo de reasoning
+            max_completion_tokens=2500,
+            timeout=self._request_timeout(ctx)
+        )
+
+        if ctx.cancel_token is None:
+            response = client.chat.completions.create(**request_args)
+            return response.choices[0].message.content, response.usage
+
+        stream = client.chat.completions.create(
+            stream=True,
+            stream_options={"include_usage": True},
+            **request_args
+        )
+        close_stream = getattr(stream, 'close', lambda: None)
+        ctx.cancel_token.add_callback(close_stream)
+        try:
+            content_parts = []
+            usage = None
+            for chunk in stream:
+                ctx.check("chamada LLM")
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                for choice in chunk.choices:
+                    if choice.delta.content:
+                        content_parts.append(choice.delta.content)
+        except Exception:
+            # Conexão fechada pelo cancelamento aparece como erro de leitura
+            ctx.check("chamada LLM")
+            raise
+        finally:
+            ctx.cancel_token.remove_callback(close_stream)
+
+        if usage is None:
+            # Stream sem chunk de usage: tokens zerados (custo subestimado), não erro a repetir
+            print("[AVISO] Stream do LLM terminou sem usage; tokens e custo registrados como 0")
+            usage = CompletionUsage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+        return "".join(content_parts), usage
+
+    def merge_schemas(self, extraction_schemas):
+        """
+        Une vários schemas em um único conjunto de campos sem duplicatas.
+        ESTRATÉGIA: Campo com mesmo nome é pedido UMA vez ao LLM; se as descrições
+        divergem, elas são concatenadas para o LLM ter o contexto de ambas.
+
+        Args:
+            extraction_schemas: Dict {nome_schema: extraction_schema}
+
+        Returns:
+            tuple: (schema_unificado, {nome_schema: [campos]})
+        """
+        merged_schema = {}
+        fields_by_schema = {}
+        # Descrições já incluídas por campo, normalizadas (comparação inteira,
+        # não por substring: "Nome" não some ao lado de "Nome completo")
+        seen_descriptions = {}
+
+        for schema_name, extraction_schema in extraction_schemas.items():
+            fields_by_schema[schema_name] = list(extraction_schema.keys())
+            for field_name, field_description in extraction_schema.items():
+                normalized = " ".join(str(field_description).split()).casefold()
+                seen = seen_descriptions.setdefault(field_name, set())
+                if field_name not in merged_schema:
+                    merged_schema[field_name] = field_description
+                elif field_description and normalized not in seen:
+                    merged_schema[field_name] = f"{merged_schema[field_name]} / {field_description}"
+                seen.add(normalized)
+
+        return merged_schema, fields_by_schema
+
+    def extract_multi(self, pdf_path, label, extraction_schemas, max_retries=2, use_cache=True, ctx=None):
+        """
+        Extrai vários schemas do MESMO PDF com uma única chamada ao LLM.
+        ESTRATÉGIA: Merge dos schemas → Extração única → Resultado separado por schema
+
+        Args:
+            pdf_path: Caminho do PDF
+            label: Label do documento
+            extraction_schemas: Dict {nome_schema: extraction_schema}
+            max_retries: Número máximo de tentativas
+            use_cache: Se deve usar cache
+            ctx: RequestContext (deadline) ou None
+
+        Returns:
+            dict: Resultado da extração unificada + 'results' {nome_schema: dados}
+        """
+        merged_schema, fields_by_schema = self.merge_schemas(extraction_schemas)
+        if len(extraction_schemas) > 1:
+            print(f"         [MERGE] {len(extraction_schemas)} schemas -> {len(merged_schema)} campo(s) unico(s)")
+
+        result = self.extract(
+            pdf_path, label, merged_schema, max_retries, use_cache, ctx,
+            learned_schemas=list(extraction_schemas.values())
+        )
+        if not result.get('success', False):
+            return result
+
+        data = result.get('data', {})
+        result = dict(result)
+        result['results'] = {
+            schema_name: {field_name: data.get(field_name) for field_name in fields}
+            for schema_name, fields in fields_by_schema.items()
+        }
+        result['merged_fields'] = len(merged_schema)
+        return result
+
     def build_system_message(self, label, extraction_schema, use_examples=False, context=None):
         """
         Constrói mensagem de system OTIMIZADA: compacta + precisa.
@@ -130,11 +397,14 @@ class PDFExtractor:
         if label == "carteira_oab":
             system_msg += "\nESTRUTURA OAB: Nome | Labels | Inscrição(5-6 dig) | Seccional(2 letras) | Subseção(texto completo) | Categoria\n"
 
-        # Exemplo compacto se disponível
+        # Exemplo(s) compacto(s) se disponível (top-k já limitado pelo orçamento de tokens)
         if use_examples and context and context.get('examples'):
-            example = context['examples'][0]
-            example_json = json.dumps(example['extracted'], ensure_ascii=False)
-            system_msg += f"\nEXEMPLO:\n{example_json}\n"
+            examples_json = [
+                json.dumps(example['extracted'], ensure_ascii=False)
+                for example in context['examples']
+            ]
+            header = "EXEMPLO" if len(examples_json) == 1 else "EXEMPLOS"
+            system_msg += f"\n{header}:\n" + "\n".join(examples_json) + "\n"
 
         return system_msg
 
@@ -153,29 +423,96 @@ class PDFExtractor:
         msg += "RESPOSTA (JSON compacto):"
         return msg
     
-    def extract(self, pdf_path, label, extraction_schema, max_retries=2, use_cache=True):
+    def extract(self, pdf_path, label, extraction_schema, max_retries=2, use_cache=True, ctx=None,
+                learned_schemas=None):
         """
         Método principal de extração com retry logic e cache inteligente.
         ESTRATÉGIA: Cache → Extração local → LLM otimizado → Retry se falhar
+
+        Com deadline (ctx), cada etapa usa apenas o tempo restante e nenhuma
+        tentativa LLM é iniciada se não puder terminar a tempo.
+        PDF que falhou recentemente (sem texto, ilegível, JSON inválido do LLM)
+        falha rápido pelo cache negativo, exceto com ctx.retry_failed.
+
+        learned_schemas: schemas gravados no schema conhecido do label (default:
+        extraction_schema). extract_multi passa os schemas originais, para a
+        descrição unida "A / B" não ficar no schema aprendido.
         """
+        if ctx is None:
+            ctx = RequestContext()
 
         # 0. Verificar cache de resultados (velocidade máxima)
         if use_cache:
-            import time
             cache_start = time.time()
-            cached_result = self.cache.get_cached_result(pdf_path, label, extraction_schema)
+            cached_result = self.cache.get_cached_result(pdf_path, label, extraction_schema, ctx)
             if cached_result:
                 cache_time = time.time() - cache_start
                 print(f"         [CACHE HIT] Resultado cacheado retornado em {cache_time:.3f}s")
-                # Adicionar flag indicando que veio do cache
+                # Adicionar flag indicando que veio do cache (sem chamada LLM = custo zero)
                 cached_result['from_cache'] = True
                 cached_result['cache_retrieval_time'] = cache_time
+                cached_result['cost'] = 0.0
+                cached_result['tokens'] = {"input": 0, "output": 0, "total": 0}
                 return cached_result
 
+        # 0.5 Verificar cache de campos (subconjunto ou schema com campos extras)
+        cached_fields = {}
+        llm_schema = extraction_schema
+        if use_cache:
+            cached_fields = self.cache.get_cached_fields(pdf_path, label, extraction_schema, ctx)
+            if len(cached_fields) == len(extraction_schema):
+                print(f"         [FIELD CACHE] Todos os {len(cached_fields)} campo(s) cacheados, LLM NAO chamado")
+                return {
+                    "success": True,
+                    "data": {field_name: cached_fields[field_name] for field_name in extraction_schema},
+                    "label": label,
+                    "cost": 0.0,
+                    "tokens": {
+                        "input": 0,
+                        "output": 0,
+                        "total": 0
+                    },
+                    "from_cache": True,
+                    "used_examples": False,
+                    "fields_from_cache": len(cached_fields)
+                }
+            if cached_fields:
+                llm_schema = {
+                    field_name: field_description
+                    for field_name, field_description in extraction_schema.items()
+                    if field_name not in cached_fields
+                }
+                print(f"         [FIELD CACHE] {len(cached_fields)} campo(s) cacheados, {len(llm_schema)} enviados ao LLM")
+
+        # 0.7 Cache negativo: falha recente deste PDF → mesmo erro, sem parse nem LLM
+        if use_cache and not ctx.retry_failed:
+            failure = self.cache.get_cached_failure(pdf_path, label, extraction_schema, ctx)
+            if failure:
+                print(f"         [NEGATIVE CACHE] Falha recente ({failure['failure_class']}), LLM NAO chamado")
+                # Falhas de leitura foram levantadas da primeira vez: levantar de novo (mesma mensagem)
+                if failure['failure_class'] != FAILURE_INVALID_LLM_OUTPUT:
+                    raise CachedExtractionFailure(failure)
+                return {
+                    "success": False,
+                    "error": failure['error'],
+                    "failure_class": failure['failure_class'],
+                    "from_negative_cache": True
+                }
+
         # 1. Extrair texto do PDF (custo zero)
-        pdf_text = self.extract_text_from_pdf(pdf_path)
+        ctx.check("leitura do cache")
+        try:
+            pdf_text = self.extract_text_from_pdf(pdf_path, ctx, use_cache=use_cache)
+        except ExtractionInterrupted:
+            raise
+        except Exception as e:
+            if use_cache:
+                self.cache.save_failure(pdf_path, label, None, FAILURE_UNREADABLE_PDF, str(e), ctx)
+            raise
 
         if not pdf_text:
+            if use_cache:
+                self.cache.save_failure(pdf_path, label, None, FAILURE_NO_TEXT, "PDF vazio ou sem texto extraível", ctx)
             raise Exception("PDF vazio ou sem texto extraível")
 
         # FASE 4A: Truncar texto para reduzir prompt tokens e reasoning time
@@ -183,6 +520,16 @@ class PDFExtractor:
             pdf_text = pdf_text[:2000]
             print(f"         [TRUNCATE] Texto reduzido para 2000 chars")
 
+        # 1.5 Cache por texto: mesmo texto com bytes diferentes (reexportado, reassinado)
+        if use_cache:
+            cached_result = self.cache.get_cached_result_by_text(pdf_path, pdf_text, label, extraction_schema, ctx)
+            if cached_result:
+                print("         [TEXT CACHE] Mesmo texto já extraído, LLM NAO chamado")
+                cached_result['from_cache'] = True
+                cached_result['cost'] = 0.0
+                cached_result['tokens'] = {"input": 0, "output": 0, "total": 0}
+                return cached_result
+
         # 2. Pattern matching DESABILITADO (estava causando mais confusão que ajuda)
         # FASE 2 ROLLBACK: pattern matching agressivo piorou acurácia de 94.59% → 83.78%
         local_extracted = {}
@@ -194,65 +541,115 @@ class PDFExtractor:
         if all_dates and len(all_dates) > 1:
             print(f"         [DATAS] {len(all_dates)} data(s) encontrada(s): {all_dates}")
 
-        # FASE 4A: Template matching DESABILITADO (não funciona, adiciona overhead)
-        # # 2.5 FASE 3: Buscar template similar (documento repetido)
-        # template_match = self.cache.find_similar_template(pdf_text, label, extraction_schema)
-        # if template_match and use_cache:
-        #     similarity = template_match['similarity']
-        #     print(f"         [TEMPLATE] Documento similar encontrado ({int(similarity*100)}% match)")
-        #     print(f"         [TEMPLATE] Reusando estrutura, LLM NÃO chamado")
-        #
-        #     # Reusar resultado do template (assumindo valores idênticos para docs idênticos)
-        #     # Em produção, poderia extrair apenas campos variáveis
-        #     template_result = template_match['template']
-        #
-        #     # Retornar resultado do template
-        #     return {
-        #         "success": True,
-        #         "data": template_result['data'],
-        #         "label": label,
-        #         "cost": 0.0,  # Cache = custo zero
-        #         "tokens": {
-        #             "input": 0,
-        #             "output": 0,
-        #             "total": 0
-        #         },
-        #         "from_cache": True,
-        #         "from_template": True,
-        #         "template_similarity": similarity
-        #     }
+        # 2.5 Template similar (MinHash + LSH) NÃO reusa o resultado inteiro: documentos
+        # do mesmo template trazem valores diferentes (outra pessoa, outra fatura) e o
+        # reuso piorava a acurácia. A detecção alimenta só o diff de template (2.6).
+
+        # 2.6 Diff de template: campos cujo valor está em trecho inalterado são reusados;
+        # o LLM recebe só os trechos alterados e só os campos que estão neles
+        template_fields = {}
+        llm_text = pdf_text
+        regions_only = False
+        if use_cache and self.template_diff_mode and llm_schema:
+            template_match = self.cache.find_similar_template(
+                pdf_text, label, extraction_schema,
+                threshold=self.template_diff_threshold, ctx=ctx, include_text=True
+            )
+            if template_match and template_match.get('text'):
+                plan = plan_template_reuse(
+                    template_match['text'], template_match['template'].get('data', {}), pdf_text, llm_schema
+                )
+                template_fields = plan['reused']
+                llm_schema = {
+                    field_name: field_description
+                    for field_name, field_description in llm_schema.items()
+                    if field_name not in template_fields
+                }
+                if plan['regions_only']:
+                    llm_text = plan['text']
+                    regions_only = True
+                print(f"         [TEMPLATE DIFF] {int(template_match['similarity']*100)}% match: "
+                      f"{len(template_fields)} campo(s) reusado(s), {len(llm_schema)} enviado(s) ao LLM "
+                      f"({len(llm_text)}/{len(pdf_text)} chars)")
+
+                if not llm_schema:
+                    return {
+                        "success": True,
+                        "data": {
+                            field_name: cached_fields.get(field_name, template_fields.get(field_name))
+                            for field_name in extraction_schema
+                        },
+                        "label": label,
+                        "cost": 0.0,
+                        "tokens": {
+                            "input": 0,
+                            "output": 0,
+                            "total": 0
+                        },
+                        "from_cache": True,
+                        "from_template": True,
+                        "template_similarity": template_match['similarity'],
+                        "fields_from_cache": len(cached_fields),
+                        "fields_from_template": len(template_fields)
+                    }
 
         # 3. Atualizar schema conhecido ANTES de buscar contexto
-        self.cache.update_schema(label, extraction_schema)
+        for learned_schema in (learned_schemas or [extraction_schema]):
+            self.cache.update_schema(label, learned_schema)
+
+        # 3.5 Modo eager: pedir também os campos conhecidos do label para aquecer o cache de campos
+        # Não com o texto reduzido aos trechos alterados: campos fora deles viriam null
+        # e o null seria gravado no cache de campos
+        if use_cache and self.eager_schema and not regions_only:
+            known_fields = self.cache.load_cache(label)["schema_complete"]
+            extra_fields = {
+                field_name: field_description
+                for field_name, field_description in known_fields.items()
+                if field_name not in llm_schema and field_name not in cached_fields
+                and field_name not in template_fields
+            }
+            if extra_fields:
+                llm_schema = {**llm_schema, **extra_fields}
+                print(f"         [EAGER] +{len(extra_fields)} campo(s) conhecido(s) do label")
 
         # 4. Buscar contexto do cache para few-shot learning com semantic search
         # IMPORTANTE: Busca DEPOIS de atualizar schema para pegar exemplos mais recentes
-        context = self.cache.get_context(label, extraction_schema, pdf_text)
+        context = self.cache.get_context(label, extraction_schema, pdf_text, ctx)
         has_examples = context and len(context.get('examples', [])) > 0
 
         if has_examples:
             print(f"         [FEW-SHOT] Usando {len(context['examples'])} exemplo(s) similar(es)")
 
         # 5. Tentar extração com retry
+        last_attempt_time = 0.0
         for attempt in range(max_retries):
+            # Cancelado (cliente desconectou): nenhuma nova tentativa
+            if ctx.cancelled:
+                return self._interrupted_result(ExtractionCancelled(f"chamada LLM (tentativa {attempt + 1})"))
+
+            # Não iniciar tentativa que não pode terminar antes do deadline
+            attempt_budget = max(self.min_llm_attempt_seconds, last_attempt_time)
+            if not ctx.has_time_for(attempt_budget):
+                return self._interrupted_result(DeadlineExceeded(f"chamada LLM (tentativa {attempt + 1})"))
+
+            attempt_start = time.time()
             try:
                 # 6. Construir mensagens OTIMIZADAS (system cacheable + user conciso)
                 system_message = self.build_system_message(
-                    label, extraction_schema,
+                    label, llm_schema,
                     use_examples=has_examples,
                     context=context
                 )
 
                 user_message = self.build_user_message(
-                    pdf_text, extraction_schema,
+                    llm_text, llm_schema,
                     local_extracted=None,  # FASE 2 conservador: sem pattern matching
                     all_dates=all_dates if len(all_dates) > 1 else None
                 )
 
                 # 7. Chamar LLM (formato simples e otimizado)
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
+                result_text, usage = self._call_llm(
+                    [
                         {
                             "role": "system",
                             "content": system_message
@@ -262,24 +659,18 @@ class PDFExtractor:
                             "content": user_message
                         }
                     ],
-                    # FASE 4A: 2500 tokens (mais confortável para reasoning)
-                    # Reasoning tokens variável (~800-1200) + JSON compacto (~200-300)
-                    # Aumentado de 1500 para reduzir tempo de reasoning
-                    max_completion_tokens=2500
+                    ctx
                 )
 
                 # 7. Calcular custo (pricing oficial gpt-5-mini)
-                usage = response.usage
                 input_cost = (usage.prompt_tokens / 1_000_000) * 0.25
                 output_cost = (usage.completion_tokens / 1_000_000) * 2.00
                 total_cost = input_cost + output_cost
 
                 # 8. Parsear resposta
-                result_text = response.choices[0].message.content
-
                 # DEBUG: Verificar se conteúdo existe
                 if not result_text or result_text.strip() == "":
-                    raise ValueError(f"LLM retornou resposta vazia. Response object: {response}")
+                    raise ValueError(f"LLM retornou resposta vazia. Usage: {usage}")
 
                 result_text = result_text.strip()
 
@@ -292,16 +683,26 @@ class PDFExtractor:
                 extracted_data = json.loads(result_text)
 
                 # 9. Validar schema da resposta e MERGE com dados locais
-                validated_data = {}
-                for field_name in extraction_schema.keys():
+                llm_data = {}
+                for field_name in llm_schema.keys():
                     # Prioridade: dados locais (mais precisos) > dados LLM
                     if local_extracted.get(field_name) is not None:
-                        validated_data[field_name] = local_extracted[field_name]
+                        llm_data[field_name] = local_extracted[field_name]
+                    else:
+                        llm_data[field_name] = extracted_data.get(field_name, None)
+
+                # 9.5 Montar resposta final: campos cacheados + reusados do template + campos do LLM
+                validated_data = {}
+                for field_name in extraction_schema.keys():
+                    if field_name in cached_fields:
+                        validated_data[field_name] = cached_fields[field_name]
+                    elif field_name in template_fields:
+                        validated_data[field_name] = template_fields[field_name]
                     else:
-                        validated_data[field_name] = extracted_data.get(field_name, None)
+                        validated_data[field_name] = llm_data.get(field_name)
 
                 # 10. Salvar no cache para aprendizado (few-shot futuro)
-                self.cache.add_example(label, pdf_text, validated_data)
+                self.cache.add_example(label, pdf_text, validated_data, ctx)
 
                 # 11. Preparar resultado
                 result = {
@@ -315,31 +716,47 @@ class PDFExtractor:
                         "total": usage.total_tokens
                     },
                     "from_cache": False,
-                    "used_examples": has_examples  # Indica se usou few-shot
+                    "used_examples": has_examples,  # Indica se usou few-shot
+                    "fields_from_cache": len(cached_fields),
+                    "fields_from_template": len(template_fields)
                 }
 
                 # 12. Salvar resultado no cache para futuras consultas
-                # FASE 4A: Salvar SEM texto (template matching desabilitado)
+                # (com texto e assinatura MinHash, para detecção de templates)
                 if use_cache:
-                    # self.cache.save_result_with_text(pdf_path, pdf_text, label, extraction_schema, result)
-                    pass  # Cache de resultado já gerenciado por get_cached_result
+                    self.cache.save_fields(pdf_path, label, llm_schema, llm_data, ctx)
+                    self.cache.save_result_with_text(pdf_path, pdf_text, label, extraction_schema, result, ctx)
+                    if ctx.retry_failed:
+                        self.cache.clear_failures(pdf_path, label, extraction_schema, ctx)
 
                 return result
 
             except json.JSONDecodeError as e:
                 # Se JSON inválido e ainda há tentativas, retry
+                last_attempt_time = time.time() - attempt_start
                 if attempt < max_retries - 1:
                     continue
+                error = f"Erro ao parsear JSON após {max_retries} tentativas: {str(e)}"
+                if use_cache:
+                    self.cache.save_failure(
+                        pdf_path, label, extraction_schema, FAILURE_INVALID_LLM_OUTPUT, error, ctx
+                    )
                 # DEBUG: Mostrar resposta completa
                 return {
                     "success": False,
-                    "error": f"Erro ao parsear JSON após {max_retries} tentativas: {str(e)}",
+                    "error": error,
                     "raw_response": result_text,
                     "response_length": len(result_text),
                     "response_preview": result_text[:200] if result_text else "VAZIO"
                 }
+            except ExtractionInterrupted as e:
+                return self._interrupted_result(e)
             except Exception as e:
+                # Timeout causado pelo deadline: resposta rápida e bem definida
+                if ctx.deadline is not None and ctx.deadline.expired():
+                    return self._interrupted_result(DeadlineExceeded(f"chamada LLM (tentativa {attempt + 1})"))
                 # Se erro genérico e ainda há tentativas, retry
+                last_attempt_time = time.time() - attempt_start
                 if attempt < max_retries - 1:
                     continue
                 return {
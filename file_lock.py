@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Lock de arquivo entre processos (ex: vários workers gunicorn no mesmo cache/).
+ESTRATÉGIA: fcntl.flock no POSIX, msvcrt.locking no Windows, sobre um arquivo
+.lock ao lado do arquivo protegido. Locks de flock valem por descritor aberto,
+então também serializam threads do mesmo processo.
+"""
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    Lock exclusivo (bloqueante) usado como context manager:
+
+        with FileLock("cache/label.json.lock"):
+            ...
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: Caminho do arquivo de lock (criado se não existir)
+        """
+        self.path = str(path)
+        self._fd = None
+
+    def acquire(self):
+        """Bloqueia até obter o lock."""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                # msvcrt.LK_LOCK desiste após ~10s: tenta de novo até conseguir
+                os.lseek(fd, 0, os.SEEK_SET)
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.05)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def release(self):
+        """Libera o lock (fechar o descritor também libera)."""
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Pool de conexões HTTP compartilhado para o cliente OpenAI.
+ESTRATÉGIA: Com Flask threaded=True, limites do pool, reuso de keep-alive e
+HTTP/2 definem a latência de cauda. Um único httpx.Client por processo é
+compartilhado por todos os PDFExtractor, com métricas de reuso e espera no pool.
+"""
+import os
+import threading
+import time
+import httpx
+
+
+class ConnectionPoolMetrics:
+    """
+    Métricas do pool via trace do httpcore.
+    - Conexão reusada: headers enviados sem abrir conexão TCP antes
+    - Espera no pool: tempo entre o envio pedido e o primeiro evento de conexão
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.pool_wait_total = 0.0
+        self.pool_wait_max = 0.0
+
+    def on_request(self, request):
+        """Event hook do httpx: instala o trace na requisição."""
+        started = time.perf_counter()
+        state = {"waited": False, "connected": False, "done": False}
+
+        def trace(event_name, info):
+            if state["done"]:
+                return
+            if not state["waited"]:
+                # Primeiro evento de rede = conexão obtida do pool
+                state["waited"] = True
+                self._record_wait(time.perf_counter() - started)
+            if event_name == "connection.connect_tcp.started":
+                state["connected"] = True
+            elif event_name.endswith("send_request_headers.started"):
+                state["done"] = True
+                self._record_connection(reused=not state["connected"])
+
+        request.extensions["trace"] = trace
+
+    def _record_wait(self, seconds):
+        with self._lock:
+            self.requests += 1
+            self.pool_wait_total += seconds
+            self.pool_wait_max = max(self.pool_wait_max, seconds)
+
+    def _record_connection(self, reused):
+        with self._lock:
+            if reused:
+                self.reused_connections += 1
+            else:
+                self.new_connections += 1
+
+    def snapshot(self):
+        """
+        Retorna as métricas atuais.
+
+        Returns:
+            dict: Contadores de conexões e tempos de espera no pool (ms)
+        """
+        with self._lock:
+            connections = self.new_connections + self.reused_connections
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": self.reused_connections,
+                "reuse_ratio": round(self.reused_connections / connections, 4) if connections else 0.0,
+                "pool_wait_avg_ms": round(self.pool_wait_total / self.requests * 1000, 3) if self.requests else 0.0,
+                "pool_wait_max_ms": round(self.pool_wait_max * 1000, 3)
+            }
+
+
+def _http2_available():
+    """HTTP/2 no httpx depende do pacote opcional h2."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def build_http_client(metrics=None):
+    """
+    Cria um httpx.Client configurado pelas variáveis de ambiente.
+
+    Variáveis:
+        OPENAI_POOL_MAX_CONNECTIONS: Conexões simultâneas (default 32)
+        OPENAI_POOL_MAX_KEEPALIVE: Conexões ociosas mantidas (default 16)
+        OPENAI_KEEPALIVE_EXPIRY: Segundos até fechar conexão ociosa (default 60)
+        OPENAI_CONNECT_TIMEOUT_SECONDS: Timeout de conexão (default 5)
+        LLM_TIMEOUT_SECONDS: Timeout de leitura (default 60)
+        OPENAI_HTTP2: Habilita HTTP/2 se o pacote h2 estiver instalado (default false)
+
+    Args:
+        metrics: ConnectionPoolMetrics ou None
+
+    Returns:
+        httpx.Client
+    """
+    limits = httpx.Limits(
+        max_connections=int(os.getenv('OPENAI_POOL_MAX_CONNECTIONS', '32')),
+        max_keepalive_connections=int(os.getenv('OPENAI_POOL_MAX_KEEPALIVE', '16')),
+        keepalive_expiry=float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', '60'))
+    )
+    connect_timeout = float(os.getenv('OPENAI_CONNECT_TIMEOUT_SECONDS', '5'))
+    timeout = httpx.Timeout(
+        float(os.getenv('LLM_TIMEOUT_SECONDS', '60')),
+        connect=connect_timeout,
+        pool=connect_timeout
+    )
+
+    http2 = os.getenv('OPENAI_HTTP2', 'false').lower() == 'true'
+    if http2 and not _http2_available():
+        print("[AVISO] OPENAI_HTTP2=true mas o pacote 'h2' não está instalado. Usando HTTP/1.1")
+        http2 = False
+
+    event_hooks = {"request": [metrics.on_request]} if metrics is not None else None
+    return httpx.Client(limits=limits, timeout=timeout, http2=http2, event_hooks=event_hooks)
+
+
+_shared_client = None
+_shared_metrics = ConnectionPoolMetrics()
+_shared_lock = threading.Lock()
+
+
+def get_shared_http_client():
+    """
+    Retorna o httpx.Client compartilhado do processo (criado sob demanda).
+
+    Returns:
+        tuple: (httpx.Client, ConnectionPoolMetrics)
+    """
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = build_http_client(_shared_metrics)
+        return _shared_client, _shared_metrics
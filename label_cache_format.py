@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Formato compacto do cache de label: cabeçalho JSON + bloco .npy de embeddings.
+ESTRATÉGIA: No JSON antigo cada embedding era uma lista de floats (texto ~10x
+maior que os dados, parse lento e um objeto Python de 24 bytes por float em
+memória). Agora o cabeçalho (cache/<label>.json) guarda schema, padrões e os
+metadados dos exemplos; os embeddings ficam numa matriz float32/float16 em
+cache/<label>.<token>.npy, carregada com mmap (páginas lidas sob demanda).
+
+Gravação: .npy novo (nome único) e depois o cabeçalho, ambos via arquivo
+temporário + os.replace; o cabeçalho só aponta para um .npy já completo.
+O formato antigo (embeddings inline) continua sendo lido.
+Para o cache compartilhado (cache_backends.py), cabeçalho e matriz viajam num
+único blob (pack_label_cache / unpack_label_cache).
+"""
+import glob
+import io
+import json
+import os
+import re
+import struct
+import threading
+import uuid
+import numpy as np
+
+
+FORMAT_VERSION = 2
+
+# Tentativas de leitura se o .npy apontado for substituído entre ler o cabeçalho e abri-lo
+_READ_ATTEMPTS = 3
+
+# Prefixo do blob compartilhado: tamanho do cabeçalho JSON (o .npy vem logo depois)
+_BLOB_HEADER = struct.Struct('<I')
+
+
+def embeddings_file_pattern(label):
+    """Regex dos arquivos .npy de um label (não casa com labels que só começam igual)."""
+    return re.compile(re.escape(label) + r'\.[0-9a-f]{32}\.npy')
+
+
+def read_label_cache(cache_path):
+    """
+    Lê o cache de um label nos dois formatos.
+    Embeddings viram arrays NumPy (linhas do .npy mapeado em memória, ou
+    float32 convertidos das listas do formato antigo).
+
+    Args:
+        cache_path: Caminho do cabeçalho (cache/<label>.json)
+
+    Returns:
+        dict: Cache do label ({"schema_complete", "examples", "patterns"})
+
+    Raises:
+        OSError, ValueError: Arquivo ausente, ilegível ou corrompido
+    """
+    for attempt in range(_READ_ATTEMPTS):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache_data = json.load(f)
+
+        if cache_data.get("format") != FORMAT_VERSION:
+            # Formato antigo: embeddings inline como listas
+            for example in cache_data.get("examples", []):
+                if example.get("embedding") is not None:
+                    example["embedding"] = np.asarray(example["embedding"], dtype=np.float32)
+            return cache_data
+
+        matrix = None
+        if cache_data.get("embeddings_file"):
+            try:
+                matrix = np.load(cache_path.with_name(cache_data["embeddings_file"]), mmap_mode='r')
+            except FileNotFoundError:
+                # Outro processo gravou um cabeçalho mais novo e removeu este .npy
+                if attempt < _READ_ATTEMPTS - 1:
+                    continue
+                raise
+
+        return _attach_embeddings(cache_data, matrix)
+
+
+def _attach_embeddings(cache_data, matrix):
+    """Troca embedding_row de cada exemplo pela linha da matriz e remove os campos do formato."""
+    for example in cache_data.get("examples", []):
+        row = example.pop("embedding_row", None)
+        example["embedding"] = matrix[row] if row is not None and matrix is not None else None
+
+    del cache_data["format"]
+    cache_data.pop("embeddings_file", None)
+    return cache_data
+
+
+def serialize_label_cache(label, cache_data, dtype=np.float32):
+    """
+    Separa o cache em cabeçalho (texto JSON) e matriz de embeddings.
+    Rápido o bastante para rodar sob o lock do label (snapshot consistente).
+    Embeddings de dimensão diferente da maioria (backend antigo) não entram na
+    matriz; o exemplo fica sem backend e é re-embeddado no próximo uso.
+
+    Args:
+        label: Label do cache (nome do .npy)
+        cache_data: Cache do label em memória
+        dtype: Tipo dos embeddings no .npy (float32 ou float16)
+
+    Returns:
+        tuple: (cabeçalho JSON, nome do .npy ou None, matriz np.ndarray ou None)
+    """
+    dims = [np.shape(example["embedding"])[-1] for example in cache_data["examples"]
+            if example.get("embedding") is not None]
+    dim = max(set(dims), key=dims.count) if dims else None
+
+    rows = []
+    examples = []
+    for example in cache_data["examples"]:
+        header = {key: value for key, value in example.items() if key != "embedding"}
+        embedding = example.get("embedding")
+        if embedding is not None and np.shape(embedding)[-1] == dim:
+            header["embedding_row"] = len(rows)
+            rows.append(embedding)
+        else:
+            header["embedding_row"] = None
+            if embedding is not None:
+                header["embedding_backend"] = None
+        examples.append(header)
+
+    embeddings_file = f"{label}.{uuid.uuid4().hex}.npy" if rows else None
+    content = json.dumps({
+        "format": FORMAT_VERSION,
+        "embeddings_file": embeddings_file,
+        "schema_complete": cache_data["schema_complete"],
+        "patterns": cache_data.get("patterns", {}),
+        "examples": examples
+    }, ensure_ascii=False)
+    matrix = np.asarray(rows, dtype=dtype) if rows else None
+    return content, embeddings_file, matrix
+
+
+def write_label_cache(cache_path, content, embeddings_file, matrix):
+    """
+    Grava a matriz e depois o cabeçalho (saída de serialize_label_cache) de
+    forma atômica e remove os .npy antigos do label. Chamar sob o lock de
+    arquivo do label.
+
+    Args:
+        cache_path: Caminho do cabeçalho (cache/<label>.json)
+        content: Cabeçalho JSON
+        embeddings_file: Nome do .npy (None = sem embeddings)
+        matrix: Matriz de embeddings ou None
+    """
+    label = cache_path.stem
+    suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+
+    if embeddings_file is not None:
+        tmp_path = cache_path.with_name(f"{embeddings_file}.{suffix}")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, matrix)
+        os.replace(tmp_path, cache_path.with_name(embeddings_file))
+
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{suffix}")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, cache_path)
+
+    # .npy antigos: leitores com mmap aberto continuam válidos no POSIX;
+    # no Windows a remoção falha enquanto mapeados e fica para a próxima gravação
+    pattern = embeddings_file_pattern(label)
+    for path in cache_path.parent.glob(f"{glob.escape(label)}.*.npy"):
+        if path.name != embeddings_file and pattern.fullmatch(path.name):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+def pack_label_cache(content, matrix):
+    """
+    Junta cabeçalho e matriz (saída de serialize_label_cache) num blob só,
+    para backends chave/valor.
+
+    Returns:
+        bytes: Tamanho do cabeçalho + cabeçalho JSON + .npy (se houver matriz)
+    """
+    header = content.encode('utf-8')
+    buffer = io.BytesIO()
+    if matrix is not None:
+        np.save(buffer, matrix)
+    return _BLOB_HEADER.pack(len(header)) + header + buffer.getvalue()
+
+
+def unpack_label_cache(blob):
+    """
+    Inverso de pack_label_cache.
+
+    Returns:
+        dict: Cache do label (embeddings como linhas da matriz)
+
+    Raises:
+        ValueError: Blob corrompido ou em formato desconhecido
+    """
+    try:
+        (header_size,) = _BLOB_HEADER.unpack_from(blob)
+        header_end = _BLOB_HEADER.size + header_size
+        cache_data = json.loads(blob[_BLOB_HEADER.size:header_end].decode('utf-8'))
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f"Blob de cache de label inválido: {e}")
+    if cache_data.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Formato de blob desconhecido: {cache_data.get('format')}")
+
+    matrix = None
+    if cache_data.get("embeddings_file"):
+        matrix = np.load(io.BytesIO(blob[header_end:]), allow_pickle=False)
+    return _attach_embeddings(cache_data, matrix)
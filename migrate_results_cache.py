@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Migração do cache de resultados: JSON (um arquivo por resultado) → SQLite.
+
+Uso:
+    python migrate_results_cache.py                 # importa .results_cache/*.json
+    python migrate_results_cache.py --delete        # importa e remove os JSONs importados
+    python migrate_results_cache.py --dir outro_dir
+    python migrate_results_cache.py --rehash-md5    # migração única das chaves MD5 antigas
+
+--rehash-md5: entradas gravadas com o hash MD5 do PDF passam para o hash atual
+(relendo o PDF de pdf_path). Entradas cujo PDF não está mais no disco não são
+migradas e expiram pelo TTL; depois disso CACHE_LEGACY_MD5_LOOKUP pode ficar desligado.
+"""
+import argparse
+import os
+from pathlib import Path
+from cache_manager import CacheManager
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa o cache de resultados JSON para o SQLite")
+    parser.add_argument("--dir", default=".results_cache", help="Diretório do cache de resultados")
+    parser.add_argument("--delete", action="store_true", help="Remove os arquivos JSON após importar")
+    parser.add_argument("--rehash-md5", action="store_true", help="Migra chaves MD5 antigas para o hash atual")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("  MIGRACAO DO CACHE DE RESULTADOS (JSON -> SQLite)")
+    print("=" * 80)
+
+    # sweep_interval=0: sem thread de limpeza; a expiração roda aqui, em primeiro plano
+    cache = CacheManager(results_cache_dir=args.dir, sweep_interval=0)
+    before = cache.results_store.count_results()
+
+    report = cache.results_store.import_json_dir(args.dir)
+
+    # Entradas importadas já expiradas saem em um único DELETE
+    expired = cache.purge_expired_results()
+
+    print(f"\n[OK] Resultados importados: {report['results']}")
+    print(f"[OK] Campos importados: {report['fields']}")
+    print(f"[OK] Arquivos ignorados (erro): {report['skipped']}")
+    print(f"[OK] Entradas expiradas removidas: {expired}")
+    print(f"[OK] Resultados no SQLite: {before} -> {cache.results_store.count_results()}")
+
+    if args.delete:
+        for path in report['imported_files']:
+            os.remove(path)
+        fields_dir = Path(args.dir) / "fields"
+        if fields_dir.exists() and not any(fields_dir.iterdir()):
+            fields_dir.rmdir()
+        print(f"[OK] {len(report['imported_files'])} arquivo(s) JSON removido(s)")
+
+    if args.rehash_md5:
+        rehash_md5(cache)
+
+    print("=" * 80)
+
+
+def rehash_md5(cache):
+    """Regrava com o hash atual as entradas cuja chave ainda é o MD5 do PDF."""
+    migrated = missing = 0
+    for pdf_hash, pdf_path in cache.results_store.iter_pdf_paths():
+        if not Path(pdf_path).is_file():
+            missing += 1
+            continue
+        if cache.get_legacy_pdf_hash(pdf_path) != pdf_hash:
+            continue
+        migrated += cache.results_store.rekey_pdf_hash(pdf_hash, cache.get_pdf_hash(pdf_path))
+
+    print(f"[OK] Resultados migrados de MD5 para o hash atual: {migrated}")
+    print(f"[OK] PDFs ausentes no disco (não verificados): {missing}")
+
+
+if __name__ == '__main__':
+    main()
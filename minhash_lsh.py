@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+MinHash + LSH para detectar documentos quase idênticos (mesmo template).
+ESTRATÉGIA: Cada documento vira uma assinatura MinHash (estimador de Jaccard
+sobre shingles de caracteres, robusto a inserções). O índice LSH (banding)
+retorna só os candidatos que provavelmente passam do limiar, sem varrer o cache.
+"""
+import re
+import numpy as np
+
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def _normalize(text):
+    """Minúsculas e espaços colapsados (quebras de linha não mudam o template)."""
+    return re.sub(r'\s+', ' ', text.lower()).strip()
+
+
+class MinHasher:
+    """
+    Assinaturas MinHash de shingles de caracteres.
+    Permutações: h(x) = (a*x + b) mod (2^61 - 1), truncado em 32 bits.
+    """
+
+    def __init__(self, num_perm=128, shingle_size=5, seed=1):
+        """
+        Args:
+            num_perm: Número de permutações (tamanho da assinatura)
+            shingle_size: Tamanho dos shingles de caracteres
+            seed: Semente das permutações (assinaturas só são comparáveis com a mesma)
+        """
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        # a, b < 2^32: o produto a*x (x < 2^32) não estoura uint64
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text):
+        """
+        Hashes (uint64, 32 bits úteis) dos shingles distintos do texto.
+
+        Args:
+            text: Texto do documento
+
+        Returns:
+            np.ndarray: Hashes únicos dos shingles
+        """
+        data = np.frombuffer(_normalize(text).encode('utf-8'), dtype=np.uint8).astype(np.uint64)
+        if data.size == 0:
+            return np.empty(0, dtype=np.uint64)
+
+        # Texto menor que um shingle vira um único shingle
+        size = min(self.shingle_size, data.size)
+        windows = data.size - size + 1
+
+        # Hash polinomial de todas as janelas (overflow uint64 intencional)
+        hashes = np.zeros(windows, dtype=np.uint64)
+        for offset in range(size):
+            hashes = hashes * np.uint64(1099511628211) + data[offset:offset + windows]
+        hashes ^= hashes >> np.uint64(32)
+        return np.unique(hashes & _MAX_HASH)
+
+    def signature(self, text):
+        """
+        Assinatura MinHash do texto.
+
+        Args:
+            text: Texto do documento
+
+        Returns:
+            np.ndarray: uint32 (num_perm,)
+        """
+        shingles = self.shingles(text)
+        if shingles.size == 0:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint32)
+
+        permuted = (np.outer(self._a, shingles) + self._b[:, None]) % _MERSENNE_PRIME
+        return (permuted & _MAX_HASH).min(axis=1).astype(np.uint32)
+
+    def jaccard(self, text1, text2):
+        """Jaccard exato entre os conjuntos de shingles de dois textos."""
+        s1, s2 = self.shingles(text1), self.shingles(text2)
+        union = np.union1d(s1, s2).size
+        if union == 0:
+            return 0.0
+        return np.intersect1d(s1, s2, assume_unique=True).size / union
+
+
+def estimate_jaccard(signature1, signature2):
+    """Jaccard estimado: fração de posições iguais nas assinaturas."""
+    return float(np.mean(signature1 == signature2))
+
+
+def signature_to_bytes(signature):
+    """Serializa assinatura (uint32 little-endian) para gravar no SQLite."""
+    return np.asarray(signature, dtype='<u4').tobytes()
+
+
+def signature_from_bytes(data):
+    """Desserializa assinatura gravada com signature_to_bytes."""
+    return np.frombuffer(data, dtype='<u4').astype(np.uint32)
+
+
+def optimal_bands(num_perm, threshold):
+    """
+    Escolhe (bandas, linhas por banda) cujo limiar da curva S, (1/b)^(1/r),
+    fica mais próximo do limiar de Jaccard desejado.
+
+    Returns:
+        tuple: (bands, rows)
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class LSHIndex:
+    """
+    Índice LSH (banding) de assinaturas MinHash.
+    Documentos que coincidem em pelo menos uma banda inteira viram candidatos.
+    """
+
+    def __init__(self, num_perm=128, threshold=0.85):
+        """
+        Args:
+            num_perm: Tamanho das assinaturas indexadas
+            threshold: Limiar de Jaccard que orienta a escolha das bandas
+        """
+        self.threshold = threshold
+        self.bands, self.rows = optimal_bands(num_perm, threshold)
+        self._buckets = [{} for _ in range(self.bands)]
+        self._signatures = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def __contains__(self, key):
+        return key in self._signatures
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield band, signature[start:start + self.rows].tobytes()
+
+    def insert(self, key, signature):
+        """
+        Indexa (ou reindexa) a assinatura de um documento.
+
+        Args:
+            key: Identificador do documento (ex: chave do cache de resultados)
+            signature: Assinatura MinHash (np.ndarray uint32)
+        """
+        if key in self._signatures:
+            self.remove(key)
+        signature = np.asarray(signature, dtype=np.uint32)
+        self._signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, set()).add(key)
+
+    def remove(self, key):
+        """Remove um documento do índice (no-op se ausente)."""
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band, band_key in self._band_keys(signature):
+            bucket = self._buckets[band].get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][band_key]
+
+    def query(self, signature, threshold=None):
+        """
+        Documentos similares: candidatos do LSH verificados pelo Jaccard estimado.
+
+        Args:
+            signature: Assinatura MinHash da consulta
+            threshold: Jaccard mínimo (default = limiar do índice)
+
+        Returns:
+            list: [(key, similaridade)] em ordem decrescente de similaridade
+        """
+        threshold = self.threshold if threshold is None else threshold
+        signature = np.asarray(signature, dtype=np.uint32)
+
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(band_key, ()))
+
+        matches = []
+        for key in candidates:
+            similarity = estimate_jaccard(signature, self._signatures[key])
+            if similarity >= threshold:
+                matches.append((key, similarity))
+        matches.sort(key=lambda match: match[1], reverse=True)
+        return matches
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Pré-aquecimento dos caches a partir de um dataset (formato do run.py).
+
+Antes de um lote grande (ou num nó novo), preenche os caches para que a
+execução real não pague o custo de "primeiro documento":
+- Texto: PDFs lidos em paralelo (processos) e gravados no cache de textos
+- Hash do conteúdo: calculado no mesmo passo (chave de todos os caches)
+- Embeddings: calculados em lotes e persistidos
+- Resultados (opcional): importa um extraction_results.json anterior para o
+  cache de resultados/campos e como exemplos few-shot
+
+Uso:
+    python prewarm_cache.py                                   # data/dataset.json
+    python prewarm_cache.py --results extraction_results.json # + resultados anteriores
+    python prewarm_cache.py --dataset outro.json --files-dir pdfs/ --workers 8
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+import fitz  # PyMuPDF
+from cache_manager import CacheManager, hash_bytes
+from extractor import PDFExtractor
+from request_context import RequestContext
+
+
+def parse_pdf(pdf_path):
+    """
+    Lê o PDF uma vez: hash do conteúdo + texto limpo (roda num processo do pool).
+
+    Returns:
+        tuple: (pdf_path, hash, texto, erro)
+    """
+    try:
+        data = Path(pdf_path).read_bytes()
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            text = "".join(page.get_text() for page in doc)
+        return pdf_path, hash_bytes(data), PDFExtractor.clean_text(text), None
+    except Exception as e:
+        return pdf_path, None, None, str(e)
+
+
+def parse_all(pdf_paths, workers):
+    """Lê os PDFs em paralelo. Returns: {pdf_path: (hash, texto)} e lista de erros."""
+    parsed, errors = {}, []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for pdf_path, pdf_hash, text, error in pool.map(parse_pdf, pdf_paths, chunksize=4):
+            if error:
+                errors.append((pdf_path, error))
+            else:
+                parsed[pdf_path] = (pdf_hash, text)
+    return parsed, errors
+
+
+def import_results(cache, results_path, dataset, files_dir, parsed):
+    """
+    Importa os resultados bem-sucedidos de um extraction_results.json.
+    O schema vem do item do dataset com o mesmo índice (o run.py não grava o schema);
+    cached_at = data do arquivo (o TTL continua valendo).
+
+    Returns:
+        dict: {"imported", "skipped", "expired"}
+    """
+    with open(results_path, 'r', encoding='utf-8') as f:
+        results = json.load(f).get("results", [])
+
+    cached_at = datetime.fromtimestamp(os.path.getmtime(results_path))
+    if datetime.now() - cached_at > cache.ttl:
+        return {"imported": 0, "skipped": 0, "expired": len(results)}
+
+    report = {"imported": 0, "skipped": 0, "expired": 0}
+    for entry in results:
+        index = entry.get("index", 0) - 1
+        item = dataset[index] if 0 <= index < len(dataset) else None
+        if not entry.get("success") or item is None or item.get("pdf_path") != entry.get("pdf"):
+            report["skipped"] += 1
+            continue
+
+        pdf_path = str(Path(files_dir) / item["pdf_path"])
+        if pdf_path not in parsed:
+            report["skipped"] += 1
+            continue
+
+        pdf_hash, text = parsed[pdf_path]
+        label = item.get("label", "unknown")
+        schema = item.get("extraction_schema", {})
+        data = {field_name: entry["extracted_data"].get(field_name) for field_name in schema}
+
+        # Mesmo caminho do extract(): hash já calculado viaja no ctx
+        ctx = RequestContext()
+        ctx.content_hash = pdf_hash
+        pdf_text = text[:2000]
+        result = {
+            "success": True,
+            "data": data,
+            "label": label,
+            "cost": 0.0,
+            "tokens": {"input": 0, "output": 0, "total": 0},
+            "from_cache": False,
+            "used_examples": False
+        }
+        cache.update_schema(label, schema)
+        cache.add_example(label, pdf_text, data, ctx)
+        cache.save_fields(pdf_path, label, schema, data, ctx)
+        cache.save_result_with_text(pdf_path, pdf_text, label, schema, result, ctx, cached_at=cached_at)
+        report["imported"] += 1
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pré-aquece os caches a partir de um dataset")
+    parser.add_argument("--dataset", default="data/dataset.json", help="Dataset no formato do run.py")
+    parser.add_argument("--files-dir", default="data/files", help="Diretório dos PDFs do dataset")
+    parser.add_argument("--results", help="extraction_results.json anterior para importar")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processos de leitura de PDF")
+    parser.add_argument("--batch-size", type=int, default=64, help="Trechos por lote de embeddings")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("  PRE-AQUECIMENTO DOS CACHES")
+    print("=" * 80)
+
+    with open(args.dataset, 'r', encoding='utf-8') as f:
+        dataset = json.load(f)
+    pdf_paths = sorted({str(Path(args.files_dir) / item.get("pdf_path", "")) for item in dataset})
+    print(f"\n[DATASET] {len(dataset)} documento(s), {len(pdf_paths)} PDF(s) distinto(s)")
+
+    # sweep_interval=0: job em primeiro plano, sem thread de limpeza em background
+    cache = CacheManager(sweep_interval=0)
+
+    # 1. Texto + hash em paralelo, gravados em uma transação
+    start = time.time()
+    parsed, errors = parse_all(pdf_paths, args.workers)
+    cache.save_texts(parsed.values())
+    print(f"[TEXTO] {len(parsed)} PDF(s) lido(s) em {time.time() - start:.2f}s ({args.workers} processo(s))")
+    for pdf_path, error in errors:
+        print(f"[AVISO] Ignorando {pdf_path}: {error}")
+
+    # 2. Embeddings dos trechos usados na busca few-shot (500 chars do texto truncado)
+    start = time.time()
+    computed = cache.warm_embeddings([text[:2000][:500] for _, text in parsed.values()], args.batch_size)
+    print(f"[EMBEDDINGS] {computed} calculado(s) em {time.time() - start:.2f}s "
+          f"({len(parsed) - computed} já persistido(s)) com {cache.embedding_backend.name}")
+
+    # 3. Resultados anteriores (cache de resultados, campos e exemplos few-shot)
+    if args.results:
+        start = time.time()
+        report = import_results(cache, args.results, dataset, args.files_dir, parsed)
+        print(f"[RESULTADOS] {report['imported']} importado(s), {report['skipped']} ignorado(s), "
+              f"{report['expired']} fora do TTL em {time.time() - start:.2f}s")
+
+    cache.flush()
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    main()
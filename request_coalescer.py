@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Coalescer de requisições - Une requisições pendentes do MESMO PDF.
+ESTRATÉGIA: Integrações enviam o mesmo documento várias vezes com schemas
+diferentes. Dentro de uma janela curta, as requisições do mesmo (hash do PDF,
+label) são unidas e resolvidas com UMA única chamada ao LLM.
+"""
+import base64
+import threading
+import time
+from request_context import RequestContext, DeadlineExceeded
+
+
+class _PendingBatch:
+    """Lote de requisições aguardando a janela de coalescing."""
+
+    def __init__(self):
+        self.schemas = []
+        self.contexts = []
+        self.done = threading.Event()
+        self.result = None
+
+    def batch_context(self, pdf_hash, retry_failed):
+        """
+        RequestContext da extração unificada: deadline da requisição mais
+        tolerante (sem deadline se alguma não tem). Cada requisição continua
+        esperando apenas até o PRÓPRIO deadline.
+        """
+        deadlines = [ctx.deadline for ctx in self.contexts]
+        deadline = None
+        if all(d is not None for d in deadlines):
+            deadline = max(deadlines, key=lambda d: d.expires_at)
+        ctx = RequestContext(deadline=deadline, retry_failed=retry_failed)
+        ctx.content_hash = pdf_hash
+        return ctx
+
+
+class RequestCoalescer:
+    """
+    Agrupa requisições concorrentes para o mesmo PDF e label.
+
+    A primeira requisição de um lote (líder) espera a janela, fecha o lote e
+    dispara a extração unificada. Todas (líder e seguidoras) aguardam o
+    resultado até o próprio deadline e recebem a fatia do seu schema.
+    Só entram no mesmo lote requisições com o mesmo retry_failed.
+    """
+
+    def __init__(self, extractor, window_ms=0):
+        """
+        Args:
+            extractor: Instância de PDFExtractor
+            window_ms: Janela de espera em ms (0 = coalescing desabilitado)
+        """
+        self.extractor = extractor
+        self.window = max(window_ms, 0) / 1000.0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, pdf_base64, label, extraction_schema, ctx=None):
+        """
+        Executa (ou junta a um lote pendente) a extração de um PDF.
+
+        Args:
+            pdf_base64: PDF codificado em Base64
+            label: Label do documento
+            extraction_schema: Schema de extração desta requisição
+            ctx: RequestContext (deadline) ou None
+
+        Returns:
+            dict: Resultado no mesmo formato de PDFExtractor.extract
+        """
+        if ctx is None:
+            ctx = RequestContext()
+
+        if self.window <= 0:
+            return self.extractor.extract_from_base64(pdf_base64, label, extraction_schema, ctx=ctx)
+
+        try:
+            pdf_hash = self.extractor.cache.get_bytes_hash(base64.b64decode(pdf_base64))
+            ctx.content_hash = pdf_hash
+        except Exception:
+            # Base64 inválido: deixa o extrator reportar o erro normalmente
+            return self.extractor.extract_from_base64(pdf_base64, label, extraction_schema, ctx=ctx)
+
+        # Reprocessamento forçado (retry_failed) não entra no lote de quem usa o cache negativo
+        key = (pdf_hash, label, ctx.retry_failed)
+        with self._lock:
+            batch = self._pending.get(key)
+            is_leader = batch is None
+            if is_leader:
+                batch = _PendingBatch()
+                self._pending[key] = batch
+            index = len(batch.schemas)
+            batch.schemas.append(extraction_schema)
+            batch.contexts.append(ctx)
+
+        if is_leader:
+            self._close_batch(key, batch, pdf_base64, label, ctx)
+        if not batch.done.wait(timeout=ctx.remaining()):
+            # Deadline desta requisição esgotou antes do lote terminar
+            return self.extractor._interrupted_result(DeadlineExceeded("espera do lote coalescido"))
+
+        return self._split_result(batch, index)
+
+    def _close_batch(self, key, batch, pdf_base64, label, ctx):
+        """
+        Espera a janela e fecha o lote. Sozinha, a requisição roda com o próprio
+        ctx; lote com várias roda em uma thread, com o ctx do lote.
+        """
+        time.sleep(ctx.timeout(self.window))
+        with self._lock:
+            # Fecha o lote: novas requisições abrem outro
+            self._pending.pop(key, None)
+
+        if len(batch.schemas) == 1:
+            self._run_batch(batch, pdf_base64, label, ctx)
+            return
+
+        batch_ctx = batch.batch_context(key[0], retry_failed=key[2])
+        threading.Thread(
+            target=self._run_batch, args=(batch, pdf_base64, label, batch_ctx), daemon=True
+        ).start()
+
+    def _run_batch(self, batch, pdf_base64, label, ctx):
+        """Executa a extração (unificada, se o lote tem várias requisições)."""
+        try:
+            if len(batch.schemas) == 1:
+                batch.result = self.extractor.extract_from_base64(pdf_base64, label, batch.schemas[0], ctx=ctx)
+            else:
+                print(f"         [COALESCE] {len(batch.schemas)} requisicoes unidas para o mesmo PDF")
+                extraction_schemas = {str(i): schema for i, schema in enumerate(batch.schemas)}
+                batch.result = self.extractor.extract_multi_from_base64(pdf_base64, label, extraction_schemas, ctx=ctx)
+        except Exception as e:
+            batch.result = {"success": False, "error": f"Erro na extração coalescida: {str(e)}"}
+        finally:
+            batch.done.set()
+
+    def _split_result(self, batch, index):
+        """Retorna a fatia do resultado unificado referente à requisição index."""
+        result = batch.result
+        members = len(batch.schemas)
+        if members == 1 or not result.get('success', False):
+            return result
+
+        # Custo dividido entre as requisições que compartilharam a chamada
+        member_result = {k: v for k, v in result.items() if k != 'results'}
+        member_result['data'] = result['results'][str(index)]
+        member_result['cost'] = result.get('cost', 0.0) / members
+        member_result['coalesced_requests'] = members
+        return member_result
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Contexto de requisição - Valores que acompanham UMA extração pelo pipeline.
+ESTRATÉGIA: Deadline ponta a ponta. Cada etapa (texto, embeddings, LLM) usa
+apenas o tempo que resta e nenhuma tentativa começa se não puder terminar.
+Hashes e embeddings do documento são calculados uma vez por requisição e
+reusados por todas as etapas.
+Cancelamento: se o cliente desconecta, a extração (e seus retries) para.
+"""
+import threading
+import time
+
+
+class ExtractionInterrupted(Exception):
+    """Extração interrompida antes de terminar (deadline ou cancelamento)."""
+
+
+class DeadlineExceeded(ExtractionInterrupted):
+    """Deadline da requisição esgotado antes de concluir a extração."""
+
+    def __init__(self, stage):
+        self.stage = stage
+        super().__init__(f"Deadline excedido durante: {stage}")
+
+
+class ExtractionCancelled(ExtractionInterrupted):
+    """Extração cancelada (ex: cliente desconectou do stream SSE)."""
+
+    def __init__(self, stage):
+        self.stage = stage
+        super().__init__(f"Extração cancelada durante: {stage}")
+
+
+class CancellationToken:
+    """
+    Sinal de cancelamento compartilhado entre a thread da requisição e a da extração.
+    Callbacks registrados (ex: fechar a conexão HTTP do LLM) rodam no cancel().
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        """True se cancel() já foi chamado."""
+        return self._event.is_set()
+
+    def cancel(self):
+        """Sinaliza o cancelamento e executa os callbacks registrados."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks)
+            self._callbacks.clear()
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[AVISO] Falha em callback de cancelamento: {e}")
+
+    def add_callback(self, callback):
+        """Registra callback; se já cancelado, executa imediatamente."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        """Remove callback registrado (ex: chamada LLM já terminou)."""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+class Deadline:
+    """
+    Instante limite da requisição (relógio monotônico).
+    """
+
+    def __init__(self, timeout_seconds):
+        """
+        Args:
+            timeout_seconds: Tempo total disponível a partir de agora
+        """
+        self.expires_at = time.monotonic() + timeout_seconds
+
+    @classmethod
+    def from_ms(cls, timeout_ms):
+        """Cria deadline a partir de um orçamento em milissegundos."""
+        return cls(timeout_ms / 1000.0)
+
+    def remaining(self):
+        """Segundos restantes (nunca negativo)."""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self):
+        """True se o deadline já passou."""
+        return self.remaining() <= 0
+
+
+class RequestContext:
+    """
+    Estado de uma requisição passado pelas etapas da extração.
+    Sem deadline, todas as verificações são no-op (comportamento antigo).
+    """
+
+    def __init__(self, deadline=None, cancel_token=None, retry_failed=False):
+        """
+        Args:
+            deadline: Deadline da requisição ou None (sem limite)
+            cancel_token: CancellationToken ou None (não cancelável)
+            retry_failed: Ignora o cache negativo (reprocessa PDF que falhou recentemente)
+        """
+        self.deadline = deadline
+        self.cancel_token = cancel_token
+        self.retry_failed = retry_failed
+
+        # Hash do conteúdo do PDF: calculado UMA vez (ao decodificar/ler os bytes)
+        # e reusado por todas as consultas de cache da requisição
+        self.content_hash = None
+        self.legacy_content_hash = None
+
+        # Embedding do trecho inicial do texto: calculado UMA vez (busca few-shot)
+        # e reusado ao gravar o exemplo depois da resposta do LLM
+        self.text_embedding = None
+
+        # Assinatura MinHash do texto: busca de template e gravação do resultado
+        self.minhash = None
+
+        # Hash do texto limpo enviado ao LLM: chave por texto do cache de resultados
+        self.text_hash = None
+
+    @property
+    def cancelled(self):
+        """True se a requisição foi cancelada."""
+        return self.cancel_token is not None and self.cancel_token.cancelled
+
+    def remaining(self):
+        """Segundos restantes ou None se não há deadline."""
+        if self.deadline is None:
+            return None
+        return self.deadline.remaining()
+
+    def has_time_for(self, seconds):
+        """True se ainda há pelo menos `seconds` disponíveis."""
+        remaining = self.remaining()
+        return remaining is None or remaining >= seconds
+
+    def timeout(self, default):
+        """Timeout de uma etapa: o menor entre o default e o tempo restante."""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return min(default, remaining)
+
+    def check(self, stage):
+        """
+        Interrompe a extração se foi cancelada ou se o deadline já passou.
+
+        Args:
+            stage: Nome da etapa (vai na mensagem de erro)
+
+        Raises:
+            ExtractionCancelled: Se a requisição foi cancelada
+            DeadlineExceeded: Se o deadline expirou
+        """
+        if self.cancelled:
+            raise ExtractionCancelled(stage)
+        if self.deadline is not None and self.deadline.expired():
+            raise DeadlineExceeded(stage)
@@ -0,0 +1,666 @@
+# -*- coding: utf-8 -*-
+"""
+Result Store - Cache de resultados e de campos em SQLite.
+ESTRATÉGIA: Um arquivo JSON por resultado degrada com centenas de milhares de
+entradas (glob + parse de tudo para buscar por label). Em SQLite (modo WAL)
+as buscas por chave, label e template viram consultas indexadas e a expiração
+por TTL é um único DELETE indexado.
+"""
+import json
+import sqlite3
+import numpy as np
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    cache_key     TEXT PRIMARY KEY,
+    pdf_hash      TEXT NOT NULL,
+    label         TEXT NOT NULL,
+    schema_hash   TEXT NOT NULL,
+    schema_fields TEXT NOT NULL,
+    cached_at     REAL NOT NULL,
+    pdf_path      TEXT,
+    pdf_text      TEXT,
+    result        TEXT NOT NULL,
+    minhash       BLOB,
+    last_accessed REAL,
+    text_hash     TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_results_pdf_hash ON results(pdf_hash);
+CREATE INDEX IF NOT EXISTS idx_results_label_schema ON results(label, schema_hash);
+CREATE INDEX IF NOT EXISTS idx_results_cached_at ON results(cached_at);
+
+CREATE TABLE IF NOT EXISTS fields (
+    pdf_hash  TEXT NOT NULL,
+    label     TEXT NOT NULL,
+    field_key TEXT NOT NULL,
+    value     TEXT NOT NULL,
+    cached_at REAL NOT NULL,
+    PRIMARY KEY (pdf_hash, label, field_key)
+);
+CREATE INDEX IF NOT EXISTS idx_fields_cached_at ON fields(cached_at);
+
+CREATE TABLE IF NOT EXISTS texts (
+    pdf_hash  TEXT PRIMARY KEY,
+    text      TEXT NOT NULL,
+    cached_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_texts_cached_at ON texts(cached_at);
+
+CREATE TABLE IF NOT EXISTS embeddings (
+    text_hash TEXT NOT NULL,
+    backend   TEXT NOT NULL,
+    vector    BLOB NOT NULL,
+    cached_at REAL NOT NULL,
+    PRIMARY KEY (text_hash, backend)
+);
+CREATE INDEX IF NOT EXISTS idx_embeddings_cached_at ON embeddings(cached_at);
+
+CREATE TABLE IF NOT EXISTS failures (
+    failure_key   TEXT PRIMARY KEY,
+    label         TEXT NOT NULL,
+    failure_class TEXT NOT NULL,
+    error         TEXT NOT NULL,
+    cached_at     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_failures_cached_at ON failures(cached_at);
+"""
+
+# Tabelas auxiliares expiradas junto com os resultados (mesmo TTL; falhas têm TTL próprio)
+_AUX_TABLES = ("fields", "texts", "embeddings")
+
+
+class ResultStore:
+    """
+    Armazena resultados de extração e valores por campo em SQLite (WAL).
+    Uma conexão por thread (sqlite3 não compartilha conexões entre threads).
+    """
+
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path: Caminho do arquivo SQLite
+        """
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+
+        # Bancos criados antes das assinaturas MinHash / do LRU / da chave por texto não têm as colunas
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(results)")}
+        with conn:
+            if "minhash" not in columns:
+                _add_column(conn, "results", "minhash BLOB")
+            if "last_accessed" not in columns:
+                _add_column(conn, "results", "last_accessed REAL")
+                conn.execute("UPDATE results SET last_accessed = cached_at WHERE last_accessed IS NULL")
+            if "text_hash" not in columns:
+                _add_column(conn, "results", "text_hash TEXT")
+            # Fingerprint estrutural não é mais consultado: o índice só custava escrita
+            conn.execute("DROP INDEX IF EXISTS idx_results_label_fingerprint")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_last_accessed ON results(last_accessed)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_text_key ON results(text_hash, label, schema_hash)")
+
+    def _conn(self):
+        """Retorna a conexão da thread atual (criada sob demanda)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ===== RESULTADOS =====
+
+    def get_result(self, cache_key, min_cached_at):
+        """
+        Busca resultado válido (não expirado) por chave.
+
+        Args:
+            cache_key: Chave do resultado
+            min_cached_at: Timestamp mínimo (epoch) para ainda estar válido
+
+        Returns:
+            dict ou None: {"cached_at": float, "result": dict} ou None
+        """
+        row = self._conn().execute(
+            "SELECT cached_at, result FROM results WHERE cache_key = ? AND cached_at >= ?",
+            (cache_key, min_cached_at)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"cached_at": row["cached_at"], "result": json.loads(row["result"])}
+
+    def put_result(self, cache_key, pdf_hash, label, schema_hash, schema_fields, result,
+                   pdf_path=None, pdf_text=None, cached_at=None, minhash=None, text_hash=None):
+        """
+        Insere (ou substitui) um resultado.
+
+        Args:
+            cache_key: Chave do resultado
+            pdf_hash: Hash do conteúdo do PDF
+            label: Label do documento
+            schema_hash: Hash do schema de extração
+            schema_fields: Lista de campos do schema
+            result: Resultado da extração (dict)
+            pdf_path: Caminho original do PDF (informativo)
+            pdf_text: Texto do PDF (para template matching)
+            cached_at: Timestamp (epoch); default = agora
+            minhash: Assinatura MinHash serializada (bytes) para detecção de templates
+            text_hash: Hash do texto limpo enviado ao LLM (chave por texto)
+        """
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results "
+                "(cache_key, pdf_hash, label, schema_hash, schema_fields, cached_at, pdf_path, pdf_text, "
+                "result, minhash, last_accessed, text_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    cache_key, pdf_hash, label, schema_hash,
+                    json.dumps(list(schema_fields), ensure_ascii=False),
+                    cached_at if cached_at is not None else time.time(),
+                    pdf_path, pdf_text,
+                    json.dumps(result, ensure_ascii=False),
+                    minhash,
+                    time.time(),
+                    text_hash
+                )
+            )
+
+    def find_by_text_hash(self, text_hash, label, schema_hash, min_cached_at):
+        """
+        Busca resultado mais recente de um PDF com o mesmo texto limpo (bytes
+        diferentes: reexportado, reassinado, metadados novos).
+
+        Returns:
+            dict ou None: {"cache_key", "cached_at", "result"} ou None
+        """
+        row = self._conn().execute(
+            "SELECT cache_key, cached_at, result FROM results "
+            "WHERE text_hash = ? AND label = ? AND schema_hash = ? AND cached_at >= ? "
+            "ORDER BY cached_at DESC LIMIT 1",
+            (text_hash, label, schema_hash, min_cached_at)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"cache_key": row["cache_key"], "cached_at": row["cached_at"], "result": json.loads(row["result"])}
+
+    def iter_template_candidates(self, label, schema_hash, min_cached_at):
+        """
+        Documentos válidos de um (label, schema) que podem servir de template:
+        com assinatura MinHash gravada ou com texto para calculá-la.
+
+        Returns:
+            list: [{"cache_key", "minhash" (bytes ou None), "pdf_text"}]
+        """
+        rows = self._conn().execute(
+            "SELECT cache_key, minhash, CASE WHEN minhash IS NULL THEN pdf_text END AS pdf_text FROM results "
+            "WHERE label = ? AND schema_hash = ? AND cached_at >= ? "
+            "AND (minhash IS NOT NULL OR pdf_text IS NOT NULL)",
+            (label, schema_hash, min_cached_at)
+        ).fetchall()
+        return [
+            {"cache_key": row["cache_key"], "minhash": row["minhash"], "pdf_text": row["pdf_text"]}
+            for row in rows
+        ]
+
+    def get_pdf_text(self, cache_key):
+        """Texto gravado junto com o resultado (None se ausente)."""
+        row = self._conn().execute(
+            "SELECT pdf_text FROM results WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        return row["pdf_text"] if row is not None else None
+
+    # ===== CAMPOS =====
+
+    def get_fields(self, pdf_hash, label, field_keys, min_cached_at):
+        """
+        Busca valores de campos já extraídos.
+
+        Args:
+            pdf_hash: Hash do conteúdo do PDF
+            label: Label do documento
+            field_keys: Chaves dos campos (nome + hash da descrição)
+            min_cached_at: Timestamp mínimo (epoch) para ainda estar válido
+
+        Returns:
+            dict: {field_key: valor} apenas dos campos encontrados
+        """
+        field_keys = list(field_keys)
+        if not field_keys:
+            return {}
+        placeholders = ",".join("?" * len(field_keys))
+        rows = self._conn().execute(
+            f"SELECT field_key, value FROM fields "
+            f"WHERE pdf_hash = ? AND label = ? AND cached_at >= ? AND field_key IN ({placeholders})",
+            (pdf_hash, label, min_cached_at, *field_keys)
+        ).fetchall()
+        return {row["field_key"]: json.loads(row["value"]) for row in rows}
+
+    def put_fields(self, pdf_hash, label, values, cached_at=None):
+        """
+        Insere (ou substitui) valores de campos.
+
+        Args:
+            pdf_hash: Hash do conteúdo do PDF
+            label: Label do documento
+            values: Dict {field_key: valor}
+            cached_at: Timestamp (epoch); default = agora
+        """
+        cached_at = cached_at if cached_at is not None else time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO fields (pdf_hash, label, field_key, value, cached_at) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (pdf_hash, label, field_key, json.dumps(value, ensure_ascii=False), cached_at)
+                    for field_key, value in values.items()
+                ]
+            )
+
+    # ===== TEXTOS E EMBEDDINGS =====
+
+    def get_text(self, pdf_hash, min_cached_at):
+        """
+        Texto (já limpo) de um PDF extraído antes.
+
+        Returns:
+            str ou None: Texto ou None se ausente/expirado
+        """
+        row = self._conn().execute(
+            "SELECT text FROM texts WHERE pdf_hash = ? AND cached_at >= ?", (pdf_hash, min_cached_at)
+        ).fetchone()
+        return row["text"] if row is not None else None
+
+    def put_texts(self, items, cached_at=None):
+        """
+        Insere (ou substitui) textos de PDFs em uma transação.
+
+        Args:
+            items: Lista de (pdf_hash, texto)
+            cached_at: Timestamp (epoch); default = agora
+        """
+        cached_at = cached_at if cached_at is not None else time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO texts (pdf_hash, text, cached_at) VALUES (?, ?, ?)",
+                [(pdf_hash, text, cached_at) for pdf_hash, text in items]
+            )
+
+    def get_embedding(self, text_hash, backend, min_cached_at):
+        """
+        Embedding persistido de um trecho (float32).
+
+        Returns:
+            np.ndarray ou None: Vetor ou None se ausente/expirado
+        """
+        row = self._conn().execute(
+            "SELECT vector FROM embeddings WHERE text_hash = ? AND backend = ? AND cached_at >= ?",
+            (text_hash, backend, min_cached_at)
+        ).fetchone()
+        return np.frombuffer(row["vector"], dtype='<f4').astype(np.float32) if row is not None else None
+
+    def missing_embeddings(self, text_hashes, backend, min_cached_at):
+        """
+        Quais hashes ainda não têm embedding válido persistido.
+
+        Returns:
+            set: Hashes sem embedding
+        """
+        text_hashes = list(text_hashes)
+        found = set()
+        conn = self._conn()
+        for start in range(0, len(text_hashes), 500):
+            chunk = text_hashes[start:start + 500]
+            rows = conn.execute(
+                f"SELECT text_hash FROM embeddings WHERE backend = ? AND cached_at >= ? "
+                f"AND text_hash IN ({','.join('?' * len(chunk))})",
+                (backend, min_cached_at, *chunk)
+            ).fetchall()
+            found.update(row["text_hash"] for row in rows)
+        return set(text_hashes) - found
+
+    def put_embeddings(self, items, backend, cached_at=None):
+        """
+        Persiste embeddings em uma transação.
+
+        Args:
+            items: Lista de (text_hash, vetor)
+            backend: Nome do backend que gerou os vetores
+            cached_at: Timestamp (epoch); default = agora
+        """
+        cached_at = cached_at if cached_at is not None else time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (text_hash, backend, vector, cached_at) VALUES (?, ?, ?, ?)",
+                [
+                    (text_hash, backend, np.asarray(vector, dtype='<f4').tobytes(), cached_at)
+                    for text_hash, vector in items
+                ]
+            )
+
+    # ===== FALHAS (CACHE NEGATIVO) =====
+
+    def get_failure(self, failure_keys, min_cached_at):
+        """
+        Falha mais recente registrada para uma das chaves (ainda no TTL).
+
+        Args:
+            failure_keys: Chaves a consultar (ex: conteúdo e conteúdo+label+schema)
+            min_cached_at: Timestamp mínimo (epoch) para ainda estar válida
+
+        Returns:
+            dict ou None: {"failure_key", "failure_class", "error", "cached_at"} ou None
+        """
+        failure_keys = list(failure_keys)
+        row = self._conn().execute(
+            f"SELECT failure_key, failure_class, error, cached_at FROM failures "
+            f"WHERE failure_key IN ({','.join('?' * len(failure_keys))}) AND cached_at >= ? "
+            f"ORDER BY cached_at DESC LIMIT 1",
+            (*failure_keys, min_cached_at)
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def put_failure(self, failure_key, label, failure_class, error, cached_at=None):
+        """Insere (ou renova) a falha de uma chave."""
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO failures (failure_key, label, failure_class, error, cached_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (failure_key, label, failure_class, error, cached_at if cached_at is not None else time.time())
+            )
+
+    def delete_failures(self, failure_keys):
+        """Remove as falhas das chaves (ex: extração voltou a funcionar)."""
+        conn = self._conn()
+        with conn:
+            conn.executemany("DELETE FROM failures WHERE failure_key = ?", [(key,) for key in failure_keys])
+
+    def delete_expired_failures(self, min_cached_at):
+        """
+        Remove falhas fora do TTL (tabela pequena: um único DELETE indexado).
+
+        Returns:
+            int: Número de falhas removidas
+        """
+        conn = self._conn()
+        with conn:
+            return conn.execute("DELETE FROM failures WHERE cached_at < ?", (min_cached_at,)).rowcount
+
+    # ===== MANUTENÇÃO =====
+
+    def touch(self, cache_keys, accessed_at=None):
+        """
+        Atualiza o último acesso (ordem do LRU) de vários resultados em uma transação.
+
+        Args:
+            cache_keys: Chaves acessadas
+            accessed_at: Timestamp (epoch); default = agora
+        """
+        accessed_at = accessed_at if accessed_at is not None else time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "UPDATE results SET last_accessed = ? WHERE cache_key = ?",
+                [(accessed_at, cache_key) for cache_key in cache_keys]
+            )
+
+    def delete_expired(self, min_cached_at, batch_size=500):
+        """
+        Remove um lote de entradas expiradas (resultados e tabelas auxiliares).
+        ESTRATÉGIA: Lotes pequenos = transações curtas; o lock de escrita do
+        SQLite fica livre entre lotes e as requisições não esperam a varredura.
+
+        Args:
+            min_cached_at: Entradas com cached_at anterior a este timestamp são removidas
+            batch_size: Máximo de linhas removidas por tabela neste lote
+
+        Returns:
+            dict: {"results": {label: n}, "other": n} removidos neste lote
+            ("other" = campos, textos e embeddings)
+        """
+        conn = self._conn()
+        other = 0
+        with conn:
+            rows = conn.execute(
+                "SELECT rowid, label FROM results WHERE cached_at < ? LIMIT ?", (min_cached_at, batch_size)
+            ).fetchall()
+            self._delete_rowids(conn, "results", [row["rowid"] for row in rows])
+            for table in _AUX_TABLES:
+                other += conn.execute(
+                    f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE cached_at < ? LIMIT ?)",
+                    (min_cached_at, batch_size)
+                ).rowcount
+        return {"results": _count_labels(rows), "other": other}
+
+    def evict_least_recently_used(self, max_entries=0, max_bytes=0, batch_size=500):
+        """
+        Remove um lote dos resultados acessados há mais tempo se o banco passou
+        de um dos limites (0 = sem limite). Campos do mesmo (PDF, label) saem junto.
+        Bytes = páginas em uso (page_count - freelist_count): não conta o espaço
+        já liberado que só o VACUUM devolve ao sistema de arquivos.
+
+        Args:
+            max_entries: Máximo de resultados
+            max_bytes: Máximo de bytes em uso no banco
+            batch_size: Máximo de resultados removidos neste lote
+
+        Returns:
+            dict: {label: n} removidos neste lote (vazio se dentro dos limites)
+        """
+        conn = self._conn()
+        excess = 0
+        if max_entries > 0:
+            excess = max(self.count_results() - max_entries, 0)
+        if max_bytes > 0 and self.used_bytes() > max_bytes:
+            excess = max(excess, batch_size)
+        if excess == 0:
+            return {}
+
+        with conn:
+            rows = conn.execute(
+                "SELECT rowid, pdf_hash, label FROM results ORDER BY last_accessed LIMIT ?",
+                (min(excess, batch_size),)
+            ).fetchall()
+            self._delete_rowids(conn, "results", [row["rowid"] for row in rows])
+            conn.executemany(
+                "DELETE FROM fields WHERE pdf_hash = ? AND label = ?",
+                {(row["pdf_hash"], row["label"]) for row in rows}
+            )
+        return _count_labels(rows)
+
+    def iter_pdf_paths(self):
+        """
+        Pares distintos (pdf_hash, pdf_path) dos resultados armazenados.
+
+        Returns:
+            list: Lista de (pdf_hash, pdf_path) com pdf_path preenchido
+        """
+        rows = self._conn().execute(
+            "SELECT DISTINCT pdf_hash, pdf_path FROM results WHERE pdf_path IS NOT NULL"
+        ).fetchall()
+        return [(row["pdf_hash"], row["pdf_path"]) for row in rows]
+
+    def rekey_pdf_hash(self, old_hash, new_hash):
+        """
+        Troca o hash do PDF nas chaves de resultados, campos e textos (migração de
+        algoritmo de hash), em uma transação. Entradas já existentes com o hash
+        novo prevalecem sobre as antigas.
+
+        Returns:
+            int: Número de resultados migrados
+        """
+        conn = self._conn()
+        with conn:
+            migrated = conn.execute(
+                "UPDATE OR IGNORE results SET cache_key = ? || substr(cache_key, ?), pdf_hash = ? "
+                "WHERE pdf_hash = ?",
+                (new_hash, len(old_hash) + 1, new_hash, old_hash)
+            ).rowcount
+            conn.execute("UPDATE OR IGNORE fields SET pdf_hash = ? WHERE pdf_hash = ?", (new_hash, old_hash))
+            conn.execute("UPDATE OR IGNORE texts SET pdf_hash = ? WHERE pdf_hash = ?", (new_hash, old_hash))
+            for table in ("results", "fields", "texts"):
+                conn.execute(f"DELETE FROM {table} WHERE pdf_hash = ?", (old_hash,))
+        return migrated
+
+    def _delete_rowids(self, conn, table, rowids):
+        """DELETE por rowid (em blocos, abaixo do limite de parâmetros do SQLite)."""
+        for start in range(0, len(rowids), 500):
+            chunk = rowids[start:start + 500]
+            conn.execute(f"DELETE FROM {table} WHERE rowid IN ({','.join('?' * len(chunk))})", chunk)
+
+    def count_results(self):
+        """Número de resultados armazenados."""
+        return self._conn().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def count_fields(self):
+        """Número de valores de campos armazenados."""
+        return self._conn().execute("SELECT COUNT(*) FROM fields").fetchone()[0]
+
+    def used_bytes(self):
+        """Bytes em páginas ocupadas do banco (sem as páginas livres)."""
+        conn = self._conn()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - freelist_count) * page_size
+
+    def file_bytes(self):
+        """Tamanho em disco do banco, incluindo WAL e shared memory."""
+        paths = [self.db_path.with_name(self.db_path.name + suffix) for suffix in ("", "-wal", "-shm")]
+        return sum(path.stat().st_size for path in paths if path.exists())
+
+    def compact(self):
+        """
+        Devolve ao sistema de arquivos o espaço liberado: checkpoint que trunca o
+        WAL + VACUUM (reescreve o banco; bloqueia escritas enquanto roda).
+
+        Returns:
+            dict: {"bytes_before", "bytes_after"}
+        """
+        conn = self._conn()
+        bytes_before = self.file_bytes()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"bytes_before": bytes_before, "bytes_after": self.file_bytes()}
+
+    def stats_by_label(self):
+        """
+        Ocupação por label: resultados e campos armazenados e bytes dos valores
+        (JSON do resultado, texto, assinatura e valores de campos).
+
+        Returns:
+            dict: {label: {"entries", "fields", "bytes"}}
+        """
+        conn = self._conn()
+        stats = {}
+        for row in conn.execute(
+            "SELECT label, COUNT(*) AS n, "
+            "SUM(LENGTH(result) + IFNULL(LENGTH(pdf_text), 0) + IFNULL(LENGTH(minhash), 0)) AS size "
+            "FROM results GROUP BY label"
+        ):
+            stats[row["label"]] = {"entries": row["n"], "fields": 0, "bytes": row["size"] or 0}
+        for row in conn.execute("SELECT label, COUNT(*) AS n, SUM(LENGTH(value)) AS size FROM fields GROUP BY label"):
+            entry = stats.setdefault(row["label"], {"entries": 0, "fields": 0, "bytes": 0})
+            entry["fields"] = row["n"]
+            entry["bytes"] += row["size"] or 0
+        return stats
+
+    def import_json_dir(self, results_dir):
+        """
+        Importa o formato antigo (um JSON por resultado em .results_cache/ e
+        um JSON por (PDF, label) em .results_cache/fields/).
+
+        Args:
+            results_dir: Diretório do cache antigo
+
+        Returns:
+            dict: {"results": n, "fields": n, "skipped": n, "imported_files": [paths]}
+        """
+        results_dir = Path(results_dir)
+        report = {"results": 0, "fields": 0, "skipped": 0, "imported_files": []}
+
+        for cache_file in sorted(results_dir.glob("*.json")):
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    cached_data = json.load(f)
+
+                # Nome do arquivo: {pdf_hash}_{label}_{schema_hash} (label pode ter "_")
+                pdf_hash, _, rest = cache_file.stem.partition("_")
+                _, _, schema_hash = rest.rpartition("_")
+                label = cached_data.get('label') or rest.rpartition("_")[0]
+                pdf_text = cached_data.get('pdf_text')
+
+                self.put_result(
+                    cache_file.stem, pdf_hash, label, schema_hash,
+                    cached_data.get('schema_fields', []), cached_data['result'],
+                    pdf_path=cached_data.get('pdf_path'), pdf_text=pdf_text,
+                    cached_at=_parse_iso_timestamp(cached_data['cached_at'])
+                )
+                report["results"] += 1
+                report["imported_files"].append(str(cache_file))
+            except Exception as e:
+                print(f"[AVISO] Ignorando {cache_file.name}: {e}")
+                report["skipped"] += 1
+
+        fields_dir = results_dir / "fields"
+        for cache_file in sorted(fields_dir.glob("*.json")) if fields_dir.exists() else []:
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    cached_fields = json.load(f)
+
+                # Nome do arquivo: {pdf_hash}_{label}
+                pdf_hash, _, label = cache_file.stem.partition("_")
+                for field_key, entry in cached_fields.items():
+                    self.put_fields(
+                        pdf_hash, label, {field_key: entry['value']},
+                        cached_at=_parse_iso_timestamp(entry['cached_at'])
+                    )
+                    report["fields"] += 1
+                report["imported_files"].append(str(cache_file))
+            except Exception as e:
+                print(f"[AVISO] Ignorando fields/{cache_file.name}: {e}")
+                report["skipped"] += 1
+
+        return report
+
+
+def _add_column(conn, table, column_ddl):
+    """
+    ALTER TABLE ... ADD COLUMN tolerante a corrida: outro worker pode ter
+    adicionado a coluna entre o PRAGMA table_info e o ALTER.
+
+    Returns:
+        bool: True se a coluna foi adicionada por esta chamada
+    """
+    try:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column_ddl}")
+        return True
+    except sqlite3.OperationalError as e:
+        if "duplicate column" not in str(e).lower():
+            raise
+        return False
+
+
+def _count_labels(rows):
+    """Contagem por label das linhas removidas (para métricas)."""
+    counts = {}
+    for row in rows:
+        counts[row["label"]] = counts.get(row["label"], 0) + 1
+    return counts
+
+
+def _parse_iso_timestamp(value):
+    """Converte timestamp ISO (formato antigo dos JSONs) para epoch."""
+    return datetime.fromisoformat(value).timestamp()
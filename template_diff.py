@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Diff de template - Reuso campo a campo para documentos do mesmo template.
+ESTRATÉGIA: Alinha (difflib, por tokens) o texto novo com o de um documento
+do mesmo template já extraído. Campos cujo valor no template está em trecho
+inalterado são reusados; o LLM recebe só os trechos alterados e só os campos
+cujos valores estão neles.
+"""
+import difflib
+import re
+
+
+_TOKEN_PATTERN = re.compile(r'\S+')
+
+
+def _tokens(text):
+    """Tokens (palavras) com posições de caractere no texto original."""
+    return [(match.group(), match.start(), match.end()) for match in _TOKEN_PATTERN.finditer(text)]
+
+
+def diff_texts(template_text, text, context_tokens=3):
+    """
+    Alinha os dois textos e identifica as regiões alteradas.
+
+    Args:
+        template_text: Texto do documento do template (já extraído)
+        text: Texto do documento atual
+        context_tokens: Tokens de contexto incluídos em volta de cada região alterada
+
+    Returns:
+        dict: {
+            "template_spans": [(início, fim)] alterados no template (fim == início = inserção),
+            "regions": [str] trechos alterados do documento atual (com contexto),
+            "equal_ratio": fração dos tokens do documento atual que não mudou
+        }
+    """
+    template_tokens = _tokens(template_text)
+    tokens = _tokens(text)
+    matcher = difflib.SequenceMatcher(
+        None,
+        [token for token, _, _ in template_tokens],
+        [token for token, _, _ in tokens],
+        autojunk=False
+    )
+
+    template_spans = []
+    ranges = []
+    equal_tokens = 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            equal_tokens += j2 - j1
+            continue
+
+        if i1 < i2:
+            template_spans.append((template_tokens[i1][1], template_tokens[i2 - 1][2]))
+        else:
+            position = template_tokens[i1][1] if i1 < len(template_tokens) else len(template_text)
+            template_spans.append((position, position))
+
+        # Remoção (j1 == j2) entra só com o contexto em volta
+        if tokens:
+            ranges.append((max(j1 - context_tokens, 0), min(j2 + context_tokens, len(tokens))))
+
+    # Junta regiões sobrepostas/adjacentes
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    regions = [
+        text[tokens[start][1]:tokens[end - 1][2]]
+        for start, end in merged
+        if start < end
+    ]
+
+    return {
+        "template_spans": template_spans,
+        "regions": regions,
+        "equal_ratio": equal_tokens / len(tokens) if tokens else 0.0
+    }
+
+
+def _value_positions(template_text, value):
+    """Posições (início, fim) de todas as ocorrências do valor no texto do template."""
+    if value is None or isinstance(value, (dict, list)):
+        return []
+    words = str(value).split()
+    if not words:
+        return []
+    pattern = r'(?<!\w)' + r'\s+'.join(re.escape(word) for word in words) + r'(?!\w)'
+    return [(match.start(), match.end()) for match in re.finditer(pattern, template_text, re.IGNORECASE)]
+
+
+def _overlaps(position, spans):
+    start, end = position
+    return any(
+        span_start <= end and start <= span_end if span_start == span_end
+        else span_start < end and start < span_end
+        for span_start, span_end in spans
+    )
+
+
+def plan_template_reuse(template_text, template_data, text, extraction_schema):
+    """
+    Decide, campo a campo, o que reusar do template e o que enviar ao LLM.
+
+    - Reusado: valor do template encontrado no texto do template e nenhuma
+      ocorrência dele está em região alterada
+    - Alterado: alguma ocorrência do valor está em região alterada
+    - Não localizado: valor nulo ou não encontrado literalmente no template
+      (ex: formato normalizado); vai ao LLM com o documento inteiro
+
+    Args:
+        template_text: Texto do documento do template
+        template_data: Dados extraídos do template ({campo: valor})
+        text: Texto do documento atual
+        extraction_schema: Campos a decidir ({campo: descrição})
+
+    Returns:
+        dict: {
+            "reused": {campo: valor},
+            "changed": [campos],
+            "unlocated": [campos],
+            "text": texto a enviar ao LLM (só regiões alteradas se possível),
+            "regions_only": bool
+        }
+    """
+    diff = diff_texts(template_text, text)
+
+    reused, changed, unlocated = {}, [], []
+    for field_name in extraction_schema:
+        value = template_data.get(field_name)
+        positions = _value_positions(template_text, value)
+        if not positions:
+            unlocated.append(field_name)
+        elif any(_overlaps(position, diff["template_spans"]) for position in positions):
+            changed.append(field_name)
+        else:
+            reused[field_name] = value
+
+    # Campo não localizado pode estar em trecho inalterado: documento inteiro
+    regions_only = not unlocated and bool(diff["regions"])
+    return {
+        "reused": reused,
+        "changed": changed,
+        "unlocated": unlocated,
+        "text": "\n[...]\n".join(diff["regions"]) if regions_only else text,
+        "regions_only": regions_only
+    }
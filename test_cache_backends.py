@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Teste dos backends de cache compartilhado
+Mesma interface (get/set/delete/scan com TTL) em file://, sqlite:// e redis://
+(contra um servidor RESP falso, em processo) e dois "nós" com caches locais
+separados compartilhando resultados e exemplos few-shot.
+"""
+import re
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+from pathlib import Path
+from cache_backends import FileSystemBackend, SQLiteBackend, RedisBackend, get_cache_backend
+from cache_manager import CacheManager, FAILURE_NO_TEXT
+from embedding_backends import HashedNgramBackend
+from request_context import RequestContext
+from testing_support import Checks, run_as_script
+
+
+class _FakeRedisHandler(socketserver.StreamRequestHandler):
+    """Subconjunto do protocolo Redis: PING, AUTH, SELECT, GET, SET [PX|EX], DEL, SCAN."""
+
+    def handle(self):
+        while True:
+            try:
+                command = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if command is None:
+                return
+            self.wfile.write(self.server.execute(command))
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            raise ValueError(line)
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """Servidor RESP em memória numa porta livre de localhost."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _FakeRedisHandler)
+        self.data = {}  # chave -> (valor, expira_em ou None)
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def execute(self, args):
+        name = args[0].decode().upper()
+        with self.lock:
+            now = time.time()
+            for key in [key for key, (_, expires_at) in self.data.items() if expires_at and expires_at <= now]:
+                del self.data[key]
+
+            if name == "PING":
+                return b"+PONG\r\n"
+            if name in ("AUTH", "SELECT"):
+                return b"+OK\r\n"
+            if name == "GET":
+                entry = self.data.get(args[1])
+                return b"$-1\r\n" if entry is None else _bulk(entry[0])
+            if name == "SET":
+                expires_at = None
+                if len(args) == 5 and args[3].upper() == b"PX":
+                    expires_at = now + int(args[4]) / 1000
+                elif len(args) == 5 and args[3].upper() == b"EX":
+                    expires_at = now + int(args[4])
+                self.data[args[1]] = (args[2], expires_at)
+                return b"+OK\r\n"
+            if name == "DEL":
+                removed = sum(self.data.pop(key, None) is not None for key in args[1:])
+                return b":%d\r\n" % removed
+            if name == "SCAN":
+                pattern = _glob_to_regex(args[args.index(b"MATCH") + 1].decode())
+                keys = [key for key in self.data if pattern.fullmatch(key.decode())]
+                return b"*2\r\n" + _bulk(b"0") + b"*%d\r\n" % len(keys) + b"".join(_bulk(key) for key in keys)
+        return b"-ERR unknown command\r\n"
+
+
+def _bulk(data):
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+def _glob_to_regex(pattern):
+    """Glob do Redis (*, ? e escapes com \\) para regex."""
+    parts = []
+    position = 0
+    while position < len(pattern):
+        char = pattern[position]
+        if char == "\\" and position + 1 < len(pattern):
+            position += 1
+            parts.append(re.escape(pattern[position]))
+        elif char == "*":
+            parts.append(".*")
+        elif char == "?":
+            parts.append(".")
+        else:
+            parts.append(re.escape(char))
+        position += 1
+    return re.compile("".join(parts), re.DOTALL)
+
+
+def _check_backend(backend):
+    """get/set/delete/scan e expiração."""
+    backend.set("result:a", b"1")
+    backend.set("result:b*", b"\x00\xff binario")
+    backend.set("label:x", b"3", ttl=0.2)
+    backend.set("outro:c", b"4", ttl=60)
+
+    ok = backend.get("result:a") == b"1" and backend.get("result:b*") == b"\x00\xff binario"
+    ok = ok and backend.get("ausente") is None
+    ok = ok and sorted(backend.scan("result:")) == ["result:a", "result:b*"]
+    ok = ok and sorted(backend.scan("result:b*")) == ["result:b*"]
+
+    backend.delete("result:a")
+    backend.delete("ausente")
+    ok = ok and backend.get("result:a") is None
+
+    time.sleep(0.3)
+    ok = ok and backend.get("label:x") is None and list(backend.scan("label:")) == []
+    ok = ok and backend.get("outro:c") == b"4"
+    backend.purge_expired()
+    return ok
+
+
+def _check_nodes(backend_url, root):
+    """Dois nós (caches locais separados) com o mesmo backend compartilhado."""
+    nodes = [
+        CacheManager(
+            cache_dir=root / f"no{i}_cache", results_cache_dir=root / f"no{i}_results",
+            flush_interval=0, sweep_interval=0, shared_backend=get_cache_backend(backend_url),
+            embedding_backend=HashedNgramBackend()
+        )
+        for i in range(2)
+    ]
+    schema = {"nome": "Nome"}
+    result = {"success": True, "data": {"nome": "PESSOA"}, "label": "oab", "from_cache": False}
+    pdf_a, pdf_b = root / "a.pdf", root / "b.pdf"
+    pdf_a.write_bytes(b"%PDF a")
+    pdf_b.write_bytes(b"%PDF b")
+
+    # Resultado extraído no nó 0 vale no nó 1 (mesmo conteúdo de PDF)
+    ctx = RequestContext()
+    ctx.content_hash = "a" * 32
+    nodes[0].save_result_with_text(pdf_a, "Nome: PESSOA\nInscrição 1", "oab", schema, result, ctx)
+    ctx = RequestContext()
+    ctx.content_hash = "a" * 32
+    shared_hit = nodes[1].get_cached_result(pdf_a, "oab", schema, ctx)
+
+    # Mesmo texto com bytes diferentes (chave por texto) também vale entre nós
+    ctx = RequestContext()
+    ctx.content_hash = "b" * 32
+    text_hit = nodes[1].get_cached_result_by_text(pdf_b, "Nome: PESSOA\nInscrição 1", "oab", schema, ctx)
+
+    # Exemplos few-shot: cada nó aprende um, os dois enxergam os dois
+    nodes[0].add_example("oab", "DOCUMENTO UM\nNome: PESSOA", {"nome": "UM"})
+    nodes[1].add_example("oab", "DOCUMENTO DOIS\nNome: OUTRA", {"nome": "DOIS"})
+    nodes[0].add_example("oab", "DOCUMENTO TRES\nNome: MAIS UMA", {"nome": "TRES"})
+    fresh = CacheManager(
+        cache_dir=root / "no2_cache", results_cache_dir=root / "no2_results",
+        flush_interval=0, sweep_interval=0, shared_backend=get_cache_backend(backend_url),
+        embedding_backend=HashedNgramBackend()
+    )
+    learned = sorted(example["extracted"]["nome"] for example in fresh.load_cache("oab")["examples"])
+    context = fresh.get_context("oab", schema, "DOCUMENTO DOIS\nNome: OUTRA")
+
+    print(f"      Resultado do outro nó: {shared_hit is not None and shared_hit['data'] == result['data']}")
+    print(f"      Mesmo texto, outro nó: {text_hit is not None and text_hit['data'] == result['data']}")
+    print(f"      Exemplos vistos por um nó novo: {learned}")
+    return (
+        shared_hit is not None and shared_hit["data"] == result["data"]
+        and text_hit is not None and text_hit["data"] == result["data"]
+        and learned == ["DOIS", "TRES", "UM"]
+        and context["examples"][0]["extracted"] == {"nome": "DOIS"}
+        and fresh.get_metrics()["caches"]["shared"]["total"].get("hits", 0) >= 1
+    )
+
+
+def _new_node(backend_url, root, name):
+    return CacheManager(
+        cache_dir=root / f"{name}_cache", results_cache_dir=root / f"{name}_results",
+        flush_interval=0, sweep_interval=0, shared_backend=get_cache_backend(backend_url),
+        embedding_backend=HashedNgramBackend()
+    )
+
+
+def _context(content_hash):
+    ctx = RequestContext()
+    ctx.content_hash = content_hash
+    return ctx
+
+
+def _check_tiers(backend_url, root):
+    """Campos, textos e falhas gravados por um nó valem no outro."""
+    writer, reader = _new_node(backend_url, root, "campos0"), _new_node(backend_url, root, "campos1")
+    pdf = root / "d.pdf"
+    pdf.write_bytes(b"%PDF d")
+    schema = {"nome": "Nome", "inscricao": "Inscrição"}
+
+    writer.save_fields(pdf, "oab", schema, {"nome": "PESSOA"}, _context("d" * 32))
+    writer.save_text(pdf, "Nome: PESSOA", _context("d" * 32))
+    writer.save_failure(pdf, "oab", None, FAILURE_NO_TEXT, "PDF sem texto", _context("d" * 32))
+
+    fields = reader.get_cached_fields(pdf, "oab", schema, _context("d" * 32))
+    text = reader.get_cached_text(pdf, _context("d" * 32))
+    failure = reader.get_cached_failure(pdf, "oab", schema, _context("d" * 32))
+    reader.clear_failures(pdf, "oab", schema, _context("d" * 32))
+    cleared = _new_node(backend_url, root, "campos2").get_cached_failure(pdf, "oab", schema, _context("d" * 32))
+
+    print(f"      Campos do outro nó: {fields}, texto: {text!r}")
+    print(f"      Falha do outro nó: {failure and failure['error']!r}, depois de limpar: {cleared}")
+    return (
+        fields == {"nome": "PESSOA"} and text == "Nome: PESSOA"
+        and failure is not None and failure["error"] == "PDF sem texto" and cleared is None
+    )
+
+
+def _check_label_deltas(backend_url, root):
+    """Flush do label publica só o exemplo novo (e remove o despejado), sem regravar o label."""
+    node = _new_node(backend_url, root, "delta")
+    node.update_schema("cnh", {"nome": "Nome"})
+    for i in range(3):
+        node.add_example("cnh", f"CNH {i}\nNome: PESSOA {i}", {"nome": f"PESSOA {i}"})
+
+    writes, deletes = [], []
+    backend_set, backend_delete = node.shared.set, node.shared.delete
+    node.shared.set = lambda key, value, ttl=None: (writes.append(key), backend_set(key, value, ttl))[1]
+    node.shared.delete = lambda key: (deletes.append(key), backend_delete(key))[1]
+    node.max_examples = 3
+    node.add_example("cnh", "CNH 3\nNome: PESSOA 3", {"nome": "PESSOA 3"})
+
+    shared_keys = sorted(node.shared.scan("label:cnh:"))
+    new_id = node.load_cache("cnh")["examples"][-1]["id"]
+    print(f"      Chaves gravadas no flush: {len(writes)}, removidas: {len(deletes)}, no backend: {len(shared_keys)}")
+    return (
+        writes == [f"label:cnh:example:{new_id}"] and len(deletes) == 1
+        and len(shared_keys) == 4  # 3 exemplos + 1 campo do schema
+        and len(_new_node(backend_url, root, "delta2").load_cache("cnh")["examples"]) == 3
+    )
+
+
+def test_cache_backends():
+    """Interface comum dos três backends e compartilhamento entre nós"""
+    check = Checks("TESTE DOS BACKENDS DE CACHE COMPARTILHADO")
+    root = Path(tempfile.mkdtemp())
+    server = FakeRedisServer()
+    try:
+        backends = [
+            ("file://", FileSystemBackend(root / "fs")),
+            ("sqlite://", SQLiteBackend(root / "shared.db")),
+            ("redis:// (servidor falso)", RedisBackend(port=server.port)),
+        ]
+        for step, (name, backend) in enumerate(backends, start=1):
+            print(f"\n[{step}/7] Interface {name}...")
+            check(_check_backend(backend), "get/set/delete/scan e TTL")
+
+        print("\n[4/7] Dois nós compartilhando o Redis falso...")
+        check(_check_nodes(f"redis://127.0.0.1:{server.port}/0", root), "Resultados e exemplos compartilhados")
+
+        print("\n[5/7] Campos, textos e falhas entre nós...")
+        check(_check_tiers(f"redis://127.0.0.1:{server.port}/0", root), "Todos os tiers passam pelo backend")
+
+        print("\n[6/7] Flush do label no backend...")
+        check(_check_label_deltas(f"redis://127.0.0.1:{server.port}/0", root), "Só as chaves alteradas são gravadas")
+
+        print("\n[7/7] Servidor fora do ar...")
+        node = CacheManager(
+            cache_dir=root / "down_cache", results_cache_dir=root / "down_results",
+            flush_interval=0, sweep_interval=0, shared_backend=RedisBackend(port=server.port, timeout=0.5)
+        )
+        server.stop()
+        ctx = RequestContext()
+        ctx.content_hash = "c" * 32
+        node.save_result("c.pdf", "oab", {"nome": "Nome"}, {"success": True, "data": {"nome": "X"}}, ctx)
+        node.add_example("oab", "DOCUMENTO\nNome: X", {"nome": "X"})
+        ctx = RequestContext()
+        ctx.content_hash = "c" * 32
+        local_hit = node.get_cached_result("c.pdf", "oab", {"nome": "Nome"}, ctx)
+        errors = node.get_metrics()["caches"]["shared"]["total"].get("errors", 0)
+        print(f"      Erros do backend: {errors} (backend ignorado depois do primeiro)")
+        ok = local_hit is not None and len(node.load_cache("oab")["examples"]) == 1 and errors == 1
+        check(ok, "Caches locais seguem funcionando")
+    finally:
+        try:
+            server.stop()
+        except OSError:
+            pass
+        shutil.rmtree(root, ignore_errors=True)
+
+    check.finish()
+
+
+if __name__ == '__main__':
+    run_as_script(test_cache_backends)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Teste de concorrência do CacheManager
+Muitas extrações em paralelo no MESMO label (threads e processos, como
+workers gunicorn) não podem perder exemplos nem corromper o JSON do cache.
+"""
+import json
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from cache_manager import CacheManager
+from testing_support import Checks, run_as_script
+
+LABEL = "stress"
+THREADS = 8
+EXAMPLES_PER_THREAD = 25
+PROCESSES = 4
+
+
+def _add_examples(cache, worker_id):
+    """Simula o fim de uma extração: update_schema + add_example."""
+    for i in range(EXAMPLES_PER_THREAD):
+        cache.update_schema(LABEL, {f"campo_{worker_id}": f"Campo do worker {worker_id}"})
+        cache.add_example(LABEL, f"DOCUMENTO {worker_id}-{i}\nNome: PESSOA {i}", {"nome": f"PESSOA {i}"})
+
+
+def _run_threads(cache_dir, results_dir, process_id=0, flush_interval=0.05):
+    """Várias threads no mesmo CacheManager (Flask threaded=True)."""
+    cache = CacheManager(
+        cache_dir=cache_dir, results_cache_dir=results_dir,
+        max_examples=100_000, flush_interval=flush_interval
+    )
+    threads = [
+        threading.Thread(target=_add_examples, args=(cache, f"{process_id}.{t}"))
+        for t in range(THREADS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cache.flush()
+    return THREADS * EXAMPLES_PER_THREAD
+
+
+def _check(cache_dir, results_dir, expected):
+    """Relê o cache do disco (JSON válido, sem exemplos perdidos nem duplicados)."""
+    with open(Path(cache_dir) / f"{LABEL}.json", 'r', encoding='utf-8') as f:
+        on_disk = json.load(f)
+
+    ids = [example["id"] for example in on_disk["examples"]]
+    fresh = CacheManager(cache_dir=cache_dir, results_cache_dir=results_dir, max_examples=100_000)
+    loaded = fresh.load_cache(LABEL)
+
+    print(f"      Exemplos no disco: {len(ids)} (esperado {expected})")
+    print(f"      Ids únicos: {len(set(ids))}")
+    print(f"      Campos no schema: {len(loaded['schema_complete'])}")
+    return len(ids) == expected and len(set(ids)) == expected and len(loaded["examples"]) == expected
+
+
+def test_concurrency():
+    """Threads (write-behind e síncrono) e múltiplos processos no mesmo label"""
+    check = Checks("TESTE DE CONCORRENCIA - CACHE MANAGER")
+    scenarios = [
+        ("threads, write-behind", 1, 0.05),
+        ("threads, gravação síncrona", 1, 0),
+        (f"{PROCESSES} processos x {THREADS} threads", PROCESSES, 0.05),
+    ]
+
+    for step, (name, processes, flush_interval) in enumerate(scenarios, start=1):
+        print(f"\n[{step}/{len(scenarios)}] {name}...")
+        cache_dir = tempfile.mkdtemp()
+        results_dir = tempfile.mkdtemp()
+        try:
+            if processes == 1:
+                expected = _run_threads(cache_dir, results_dir, flush_interval=flush_interval)
+            else:
+                with ProcessPoolExecutor(max_workers=processes) as pool:
+                    futures = [
+                        pool.submit(_run_threads, cache_dir, results_dir, process_id, flush_interval)
+                        for process_id in range(processes)
+                    ]
+                    expected = sum(future.result() for future in futures)
+
+            check(_check(cache_dir, results_dir, expected), "Nenhum exemplo perdido ou duplicado, JSON íntegro")
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            shutil.rmtree(results_dir, ignore_errors=True)
+
+    check.finish()
+
+
+if __name__ == '__main__':
+    run_as_script(test_concurrency)
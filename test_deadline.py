@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Teste do deadline por requisição na API
+X-Deadline-Ms curto demais para uma tentativa LLM ou LLM mais lento que o
+deadline: HTTP 504 com X-Extraction-Timeout. Deadline inválido: 400.
+Usa o test client do Flask e um LLM simulado (sem rede).
+"""
+import json
+import time
+
+from testing_support import Checks, FakeLLM, load_app, pdf_base64, run_as_script, workspace
+
+
+def test_deadline():
+    """Deadline curto, LLM lento, deadline inválido e deadline folgado"""
+    check = Checks("TESTE DE DEADLINE (API)")
+    with workspace() as workdir:
+        llm = FakeLLM(response=json.dumps({"nome": "JOANA PRADO"}))
+        api = load_app(workdir, llm)
+        api.extractor.min_llm_attempt_seconds = 1.0
+        client = api.app.test_client()
+        schema = {"nome": "Nome"}
+
+        def post(doc, headers=None, **body):
+            return client.post(
+                "/extract", headers=headers or {},
+                json={"label": "oab", "extraction_schema": schema,
+                      "pdf": pdf_base64(["Nome: JOANA PRADO", doc]), **body}
+            )
+
+        def timed_out(response):
+            return response.status_code == 504 and response.headers.get("X-Extraction-Timeout") == "true"
+
+        print("\n[1/4] Deadline menor que uma tentativa LLM...")
+        start = time.time()
+        response = post("Doc 1", headers={"X-Deadline-Ms": "300"})
+        elapsed = time.time() - start
+        check(timed_out(response) and not llm.calls and elapsed < 1.0,
+              f"HTTP {response.status_code} em {elapsed:.2f}s, LLM não chamado")
+
+        print("\n[2/4] LLM mais lento que o deadline (deadline_ms no body)...")
+        llm.delay = 1.5
+        start = time.time()
+        response = post("Doc 2", deadline_ms=1200)
+        elapsed = time.time() - start
+        check(timed_out(response), f"HTTP {response.status_code} em {elapsed:.2f}s")
+
+        print("\n[3/4] Deadline inválido...")
+        response = post("Doc 3", headers={"X-Deadline-Ms": "-5"})
+        check(response.status_code == 400, f"HTTP {response.status_code}: {response.get_json()}")
+
+        print("\n[4/4] Deadline folgado...")
+        llm.delay = 0.0
+        response = post("Doc 4", headers={"X-Deadline-Ms": "10000"})
+        ok = response.status_code == 200 and response.get_json() == {"nome": "JOANA PRADO"}
+        check(ok, f"HTTP {response.status_code}: {response.get_json()}")
+    check.finish()
+
+
+if __name__ == '__main__':
+    run_as_script(test_deadline)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Teste do cache de campos
+Schema subconjunto de um já extraído não chama o LLM; schema com campos extras
+envia ao LLM só os campos que faltam; descrição diferente não reaproveita.
+O LLM é simulado: responde lendo "Campo: valor" do texto enviado.
+"""
+from testing_support import Checks, FakeLLM, create_pdf, new_extractor, run_as_script, workspace
+
+
+def test_field_cache():
+    """Subconjunto, campos extras e descrição alterada"""
+    check = Checks("TESTE DO CACHE DE CAMPOS")
+    with workspace() as workdir:
+        llm = FakeLLM()
+        extractor = new_extractor(workdir, llm)
+        pdf_path = create_pdf(workdir / "oab.pdf", ["Nome: JOANA PRADO", "Inscricao: 101943", "Seccional: PR"])
+
+        print("\n[1/4] Primeira extração (nome, inscricao)...")
+        result = extractor.extract(pdf_path, "oab", {"nome": "Nome", "inscricao": "Inscrição"})
+        ok = result["success"] and result["data"] == {"nome": "JOANA PRADO", "inscricao": "101943"}
+        check(ok and llm.calls == [["nome", "inscricao"]], f"LLM chamado uma vez: {llm.calls}")
+
+        print("\n[2/4] Subconjunto (nome): só cache de campos...")
+        result = extractor.extract(pdf_path, "oab", {"nome": "Nome"})
+        ok = result["success"] and result["from_cache"] and result["data"] == {"nome": "JOANA PRADO"}
+        ok = ok and result.get("fields_from_cache") == 1 and len(llm.calls) == 1
+        check(ok, f"LLM não chamado, {result.get('fields_from_cache')} campo do cache")
+
+        print("\n[3/4] Campo extra (nome, seccional): LLM só para o que falta...")
+        result = extractor.extract(pdf_path, "oab", {"nome": "Nome", "seccional": "Seccional"})
+        ok = result["success"] and result["data"] == {"nome": "JOANA PRADO", "seccional": "PR"}
+        ok = ok and llm.calls[-1] == ["seccional"] and result.get("fields_from_cache") == 1
+        check(ok, f"Enviado ao LLM: {llm.calls[-1]}")
+
+        print("\n[4/4] Mesma chave, descrição diferente: não reaproveita...")
+        result = extractor.extract(pdf_path, "oab", {"nome": "Nome completo do profissional"})
+        ok = result["success"] and llm.calls[-1] == ["nome"] and not result.get("fields_from_cache")
+        check(ok, f"Enviado ao LLM: {llm.calls[-1]}")
+    check.finish()
+
+
+if __name__ == '__main__':
+    run_as_script(test_field_cache)
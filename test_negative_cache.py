@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Teste do cache negativo na API
+PDF sem texto e resposta inválida do LLM: o reenvio falha rápido com
+exatamente o mesmo erro e header X-Extraction-Negative-Cache; X-Retry-Failed
+força o reprocessamento (e, se der certo, limpa a falha gravada).
+Usa o test client do Flask e um LLM simulado (sem rede).
+"""
+import json
+
+from testing_support import Checks, FakeLLM, load_app, pdf_base64, run_as_script, workspace
+
+
+def test_negative_cache():
+    """PDF sem texto, JSON inválido do LLM e X-Retry-Failed"""
+    check = Checks("TESTE DO CACHE NEGATIVO (API)")
+    with workspace() as workdir:
+        llm = FakeLLM(response="isto não é JSON")
+        api = load_app(workdir, llm, negative_ttl_seconds=600)
+        client = api.app.test_client()
+        schema = {"nome": "Nome"}
+
+        def post(pdf, headers=None):
+            return client.post(
+                "/extract", headers=headers or {},
+                json={"label": "oab", "extraction_schema": schema, "pdf": pdf}
+            )
+
+        def negative(response):
+            return response.headers.get("X-Extraction-Negative-Cache") == "true"
+
+        print("\n[1/5] PDF sem texto: reenvio com o mesmo erro...")
+        empty_pdf = pdf_base64()
+        first, second = post(empty_pdf), post(empty_pdf)
+        ok = first.status_code == second.status_code == 500
+        ok = ok and first.get_json() == second.get_json() and not negative(first) and negative(second)
+        check(ok, f"{first.get_json()['error']!r} / {second.get_json()['error']!r}")
+
+        print("\n[2/5] PDF sem texto com X-Retry-Failed: reprocessa...")
+        retried = post(empty_pdf, headers={"X-Retry-Failed": "true"})
+        ok = retried.status_code == 500 and not negative(retried) and retried.get_json() == first.get_json()
+        check(ok, f"HTTP {retried.status_code}, sem cache negativo")
+
+        print("\n[3/5] JSON inválido do LLM: reenvio sem chamar o LLM...")
+        text_pdf = pdf_base64(["Nome: JOANA PRADO"])
+        first = post(text_pdf)
+        calls_after_first = len(llm.calls)
+        second = post(text_pdf)
+        ok = first.status_code == second.status_code == 500 and calls_after_first > 0
+        ok = ok and first.get_json() == second.get_json() and negative(second) and len(llm.calls) == calls_after_first
+        check(ok, f"{second.get_json()['error']!r}, LLM chamado {calls_after_first}x só na primeira")
+
+        print("\n[4/5] X-Retry-Failed com o LLM respondendo: sucesso...")
+        llm.response = json.dumps({"nome": "JOANA PRADO"})
+        retried = post(text_pdf, headers={"X-Retry-Failed": "true"})
+        ok = retried.status_code == 200 and retried.get_json() == {"nome": "JOANA PRADO"}
+        check(ok, f"HTTP {retried.status_code}: {retried.get_json()}")
+
+        print("\n[5/5] Depois do sucesso, a falha do LLM foi apagada...")
+        again = post(text_pdf)
+        remaining = api.extractor.cache.results_store._conn().execute(
+            "SELECT COUNT(*) FROM failures WHERE failure_class = 'invalid_llm_output'"
+        ).fetchone()[0]
+        ok = again.status_code == 200 and again.headers.get("X-Extraction-From-Cache") == "true" and remaining == 0
+        check(ok, f"HTTP {again.status_code} do cache, {remaining} falha(s) gravada(s)")
+    check.finish()
+
+
+if __name__ == '__main__':
+    run_as_script(test_negative_cache)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Teste do diff de template
+Documento do mesmo template: campos em trechos inalterados vêm do template e o
+LLM recebe só os trechos alterados. Com o modo eager ligado, campos conhecidos
+do label não são pedidos sobre esse texto reduzido (nem gravados como null).
+O LLM é simulado: responde lendo "Campo: valor" do texto enviado.
+"""
+from testing_support import Checks, FakeLLM, create_pdf, new_extractor, run_as_script, workspace
+
+BOILERPLATE = [
+    "ORDEM DOS ADVOGADOS DO BRASIL",
+    "CONSELHO SECCIONAL DO PARANA",
+    "IDENTIDADE DE ADVOGADO",
+    "Documento de identidade valido em todo o territorio nacional",
+    "conforme o artigo 13 da Lei 8.906 de 4 de julho de 1994",
+]
+
+
+def create_oab_pdf(path, nome, inscricao, valor):
+    lines = BOILERPLATE[:3] + [
+        f"Nome: {nome}", f"Inscricao: {inscricao}", "Seccional: PR", f"Valor: {valor}"
+    ] + BOILERPLATE[3:]
+    return create_pdf(path, lines)
+
+
+def test_template_diff():
+    """Reuso por diff de template e modo eager com texto reduzido"""
+    check = Checks("TESTE DO DIFF DE TEMPLATE")
+    with workspace() as workdir:
+        llm = FakeLLM()
+        extractor = new_extractor(workdir, llm)
+        extractor.template_diff_mode = True
+        extractor.eager_schema = True
+
+        pdf_a = create_oab_pdf(workdir / "a.pdf", "JOANA PRADO", "101943", "350,00")
+        pdf_b = create_oab_pdf(workdir / "b.pdf", "MARIA SOUZA", "205117", "120,00")
+        pdf_c = create_oab_pdf(workdir / "c.pdf", "PAULO MENDES", "205117", "120,00")
+        full_schema = {"nome": "Nome", "inscricao": "Inscrição", "seccional": "Seccional", "valor": "Valor"}
+        schema = {"nome": "Nome", "inscricao": "Inscrição"}
+
+        print("\n[1/4] Label aprende todos os campos (nome, inscricao, seccional, valor)...")
+        result = extractor.extract(pdf_a, "oab", full_schema)
+        check(result["success"] and result["data"]["valor"] == "350,00", f"LLM chamado: {llm.calls[-1]}")
+
+        print("\n[2/4] Primeiro documento do template com o schema (nome, inscricao)...")
+        result = extractor.extract(pdf_b, "oab", schema)
+        ok = result["success"] and result["data"] == {"nome": "MARIA SOUZA", "inscricao": "205117"}
+        check(ok and not result.get("fields_from_template"), f"Texto completo, eager: {llm.calls[-1]}")
+
+        print("\n[3/4] Mesmo template, outro nome: diff de template...")
+        result = extractor.extract(pdf_c, "oab", schema)
+        ok = result["success"] and result["data"] == {"nome": "PAULO MENDES", "inscricao": "205117"}
+        ok = ok and result.get("fields_from_template") == 1 and llm.calls[-1] == ["nome"]
+        check(ok, f"Do template: {result.get('fields_from_template')}, "
+                  f"enviado ao LLM: {llm.calls[-1]} (sem campos eager sobre os trechos alterados)")
+
+        print("\n[4/4] Campo conhecido do label pedido depois (valor)...")
+        calls_before = len(llm.calls)
+        result = extractor.extract(pdf_c, "oab", {"valor": "Valor"})
+        ok = result["success"] and result["data"] == {"valor": "120,00"} and len(llm.calls) == calls_before + 1
+        check(ok, f"valor={result['data'].get('valor')!r} (nenhum null gravado no cache de campos)")
+    check.finish()
+
+
+if __name__ == '__main__':
+    run_as_script(test_template_diff)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Teste do cache por texto
+PDF com o mesmo texto e bytes diferentes (metadados alterados, reexportado)
+reusa o resultado sem chamar o LLM; o resultado passa a valer também pela
+chave de bytes do novo PDF. Schema diferente ou chave por texto desligada
+não reaproveitam.
+"""
+import json
+from pathlib import Path
+
+from testing_support import Checks, FakeLLM, create_pdf, new_extractor, run_as_script, workspace
+
+
+def test_text_key_cache():
+    """Mesmo texto com bytes diferentes, schema diferente e chave por texto desligada"""
+    check = Checks("TESTE DO CACHE POR TEXTO")
+    with workspace() as workdir:
+        llm = FakeLLM(response=json.dumps({"nome": "JOANA PRADO", "inscricao": "101943"}))
+        extractor = new_extractor(workdir, llm)
+        lines = ["Nome: JOANA PRADO", "Inscricao: 101943", "Seccional: PR"]
+        pdf_a, pdf_b, pdf_c = (
+            create_pdf(workdir / f"{name}.pdf", lines, {"title": title, "producer": f"exportador {title}"})
+            for name, title in (("a", "original"), ("b", "reexportado"), ("c", "reassinado"))
+        )
+        schema = {"nome": "Nome", "inscricao": "Inscrição"}
+        check(Path(pdf_a).read_bytes() != Path(pdf_b).read_bytes(), "Bytes diferentes entre os PDFs")
+
+        print("\n[1/4] Primeira extração...")
+        result = extractor.extract(pdf_a, "oab", schema)
+        check(result["success"] and not result["from_cache"] and len(llm.calls) == 1, "LLM chamado")
+
+        print("\n[2/4] Mesmo texto, outros bytes: chave por texto...")
+        result = extractor.extract(pdf_b, "oab", schema)
+        ok = result["success"] and result["from_cache"] and len(llm.calls) == 1
+        ok = ok and result["data"] == {"nome": "JOANA PRADO", "inscricao": "101943"}
+        ok = ok and extractor.cache.get_cached_result(pdf_b, "oab", schema) is not None
+        check(ok, "LLM não chamado; resultado regravado com a chave de bytes")
+
+        print("\n[3/4] Mesmo texto, schema diferente...")
+        result = extractor.extract(pdf_b, "oab", {"nome": "Nome"})
+        check(result["success"] and len(llm.calls) == 2, "LLM chamado (schema faz parte da chave)")
+
+        print("\n[4/4] Chave por texto desligada (RESULT_CACHE_TEXT_KEY=false)...")
+        extractor.cache.text_key_lookup = False
+        result = extractor.extract(pdf_c, "oab", schema)
+        check(result["success"] and not result["from_cache"] and len(llm.calls) == 3, "LLM chamado")
+    check.finish()
+
+
+if __name__ == '__main__':
+    run_as_script(test_text_key_cache)
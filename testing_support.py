@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Apoio aos testes com LLM simulado (sem rede, sem chave real).
+PDFs gerados em memória, diretório temporário isolado para os caches, LLM
+falso no lugar de PDFExtractor._call_llm e verificações que imprimem
+[OK]/[FALHA] e falham de verdade sob pytest.
+
+Importar ANTES de extractor/app: define a chave falsa e desliga a
+pré-conexão com a OpenAI.
+"""
+import base64
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-teste")
+os.environ["OPENAI_PRECONNECT"] = "false"
+
+import fitz  # PyMuPDF
+
+
+class FakeUsage:
+    """usage no formato do SDK da OpenAI."""
+    prompt_tokens = 100
+    completion_tokens = 20
+    total_tokens = 120
+
+
+class FakeLLM:
+    """
+    Substitui PDFExtractor._call_llm.
+    Sem response fixa, responde os campos pedidos lendo "Campo: valor" do texto
+    enviado (trechos alterados do diff de template podem começar no meio da linha).
+    """
+
+    def __init__(self, response=None, delay=0.0):
+        """
+        Args:
+            response: Texto devolvido em toda chamada (None = lê os campos do texto)
+            delay: Segundos de "geração" antes de responder (respeita o deadline)
+        """
+        self.response = response
+        self.delay = delay
+        self.calls = []
+
+    def __call__(self, messages, ctx):
+        system, user = messages[0]["content"], messages[1]["content"]
+        fields = re.findall(r'^"([^"]+)":', system, re.MULTILINE)
+        self.calls.append(fields)
+        if self.delay:
+            time.sleep(self.delay)
+            ctx.check("chamada LLM")
+        if self.response is not None:
+            return self.response, FakeUsage()
+
+        data = {}
+        for field_name in fields:
+            match = re.search(rf'(?:^|\s){re.escape(field_name)}:[ \t]*([^\n]+)', user, re.IGNORECASE)
+            data[field_name] = match.group(1).strip() if match else None
+        return json.dumps(data), FakeUsage()
+
+
+def pdf_bytes(lines=(), metadata=None):
+    """PDF de uma página com as linhas de texto (sem linhas = PDF sem texto)."""
+    doc = fitz.open()
+    page = doc.new_page()
+    if lines:
+        page.insert_text((72, 72), "\n".join(lines))
+    if metadata:
+        doc.set_metadata(metadata)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def create_pdf(path, lines, metadata=None):
+    """Grava o PDF em path e retorna o caminho (str)."""
+    Path(path).write_bytes(pdf_bytes(lines, metadata))
+    return str(path)
+
+
+def pdf_base64(lines=()):
+    """PDF em Base64, como no body de /extract."""
+    return base64.b64encode(pdf_bytes(lines)).decode()
+
+
+@contextmanager
+def workspace():
+    """
+    Diretório temporário como cwd: os caches default criados por PDFExtractor()
+    (e pelo import de app) ficam fora do repositório e são apagados ao final.
+    """
+    workdir = Path(tempfile.mkdtemp())
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        yield workdir
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def new_cache(workdir, **kwargs):
+    """CacheManager isolado em workdir, gravação síncrona e sem thread de limpeza."""
+    from cache_manager import CacheManager
+    options = dict(flush_interval=0, sweep_interval=0)
+    options.update(kwargs)
+    return CacheManager(cache_dir=workdir / "cache", results_cache_dir=workdir / "results", **options)
+
+
+def new_extractor(workdir, llm, **cache_kwargs):
+    """PDFExtractor com cache isolado e o LLM simulado."""
+    from extractor import PDFExtractor
+    extractor = PDFExtractor()
+    extractor.cache = new_cache(workdir, **cache_kwargs)
+    extractor._call_llm = llm
+    return extractor
+
+
+def load_app(workdir, llm, **cache_kwargs):
+    """Módulo app (Flask) com o extrator usando cache isolado e o LLM simulado."""
+    import app
+    app.extractor.cache = new_cache(workdir, **cache_kwargs)
+    app.extractor._call_llm = llm
+    return app
+
+
+class Checks:
+    """Verificações de um teste: imprime [OK]/[FALHA] e falha o teste no final."""
+
+    def __init__(self, title):
+        self.title = title
+        self.failures = []
+        print("=" * 80)
+        print(f"  {title}")
+        print("=" * 80)
+
+    def __call__(self, ok, message):
+        print(f"      {'[OK]' if ok else '[FALHA]'} {message}")
+        if not ok:
+            self.failures.append(message)
+        return ok
+
+    def finish(self):
+        """Resumo final; AssertionError se alguma verificação falhou."""
+        print("\n" + "=" * 80)
+        print("[OK] TODOS OS TESTES PASSARAM!" if not self.failures else f"[FALHA] {self.title}")
+        print("=" * 80)
+        assert not self.failures, f"{self.title}: {self.failures}"
+
+
+def run_as_script(test_fn):
+    """Executa o teste fora do pytest: exit 0 se passou, 1 se falhou."""
+    try:
+        test_fn()
+    except AssertionError:
+        exit(1)
+    exit(0)